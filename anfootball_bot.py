@@ -1,15 +1,18 @@
 import interactions
-from interactions.ext.wait_for import wait_for_component, setup
 # ctx: interactions.context._Context
 
-import asyncio
-
 from server import keep_alive
 
-from ug_scraper import json_from_search, json_from_url, json_from_explore, InvalidLinkError, requests
-from ug_parser import UGTab, UGSearch, UGSearchResult, UGChords, UGExplore, UGArtist
-
-UG_YELLOW = 0xffc600
+from ug_scraper import async_json_from_search, async_json_from_url, async_json_from_explore, async_json_from_artist, EXPLORE_OPTIONS, pooled_session, set_cache, get_cache, set_search_index, get_search_index, set_parse_pool, get_parse_pool, get_download_stats, get_scheduler, InvalidLinkError, QueueFullError, CircuitOpenError, requests
+from ug_cache import UGCache, DiskCache, KeysCache
+from ug_index import SearchIndex
+from ug_parser import UGTab, UGSearch, UGChords, UGExplore, UGArtist
+from ug_embeds import format_tab_embed, format_results_embeds, get_render_stats
+from ug_prefetch import ExploreRefresher, Prefetcher, fetch_top_tab
+from ug_concurrency import ParsePool
+from ug_sessions import SessionStore, ResultsBrowser, TabPager, encode_custom_id, decode_custom_id
+from ug_rank import check_ranker
+import ug_metrics
 
 import os
 from dotenv import load_dotenv
@@ -21,8 +24,56 @@ load_dotenv()
 _token = os.getenv('TOKEN')
 _ready: bool = False
 
+# the ranker each command sorts its results by (see ug_rank),
+# /chords and /tabs take the top result, so it should not be one with a few perfect votes
+# checked before anything is started, so that a misspelt ranker stops the bot
+# instead of failing every search
+RANKERS = {
+    "chords": check_ranker(os.getenv('CHORDS_RANKER', 'wilson'), 'CHORDS_RANKER'),
+    "tabs": check_ranker(os.getenv('TABS_RANKER', 'wilson'), 'TABS_RANKER'),
+    "search": check_ranker(os.getenv('SEARCH_RANKER', 'bayesian'), 'SEARCH_RANKER'),
+}
+
+# pages are parsed on PARSE_WORKERS worker processes, if set,
+# started first, so that they are forked before the bot, the search index
+# or anything else starts a thread (see ParsePool)
+_parse_workers = int(os.getenv('PARSE_WORKERS', '0'))
+if _parse_workers > 0:
+    set_parse_pool(ParsePool(_parse_workers, context='fork'))
+    get_parse_pool().start()
+
 bot = interactions.Client(token=_token)
-setup(bot)
+
+# pages are cached in memory, and on disk between restarts
+_cache_dir = os.getenv('CACHE_DIR', '.ug_cache')
+set_cache(UGCache(disk=DiskCache(_cache_dir)))
+# searches made before are answered from the tabs seen so far
+set_search_index(SearchIndex(os.path.join(_cache_dir, 'search.index')))
+get_search_index().start()
+
+# served on /metrics and /stats by the keep alive server, METRICS=0 to turn off
+ug_metrics.enable(os.getenv('METRICS', '1') != '0')
+ug_metrics.register_collector("cache", lambda: get_cache().get_stats())
+ug_metrics.register_collector("downloads", get_download_stats)
+ug_metrics.register_collector("scheduler", lambda: get_scheduler().get_stats())
+ug_metrics.register_collector("index", lambda: get_search_index().get_stats())
+ug_metrics.register_collector("embeds", get_render_stats)
+if get_parse_pool() is not None:
+    ug_metrics.register_collector("parse_pool", lambda: get_parse_pool().get_stats())
+
+# the explore listings and their top tabs, kept in memory for /explore
+explore_refresher = ExploreRefresher()
+
+# the results shown by /search and /explore, and the long tabs shown,
+# until their buttons are unused for SESSION_TTL
+browsers = SessionStore(on_evict=lambda session: session.close())
+ug_metrics.register_collector("sessions", browsers.get_stats)
+
+# the chords sheets whose keys are switched keep all 12 keys, for the most recent ones
+keys_cache = KeysCache()
+ug_metrics.register_collector("keys", keys_cache.get_stats)
+
+NEVER_MEANT_URL = "https://tabs.ultimate-guitar.com/tab/american-football/never-meant-tabs-979718"
 
 
 @bot.event
@@ -40,6 +91,7 @@ async def on_ready():
                 )]
             )
         )
+        explore_refresher.start()
         _ready = True
     
 
@@ -59,17 +111,17 @@ async def ping(ctx):
     description = "americ anfootball",
 )
 async def nevermeant(ctx):
-    try:
-        url = "https://tabs.ultimate-guitar.com/tab/american-football/never-meant-tabs-979718"
-        ugtabs = UGTab(json_from_url(url))
-        NM_GREEN = 0x606E36
-
-        tab_embed = _format_tab_embed(ugtabs)
+    with ug_metrics.command_scope("nevermeant"):
+        try:
+            url = NEVER_MEANT_URL
+            # fetched now, so that Display Full Tab is answered from the cache
+            await async_json_from_url(url)
+            NM_GREEN = 0x606E36
 
-        embed = interactions.Embed(
-            title = "Never Meant",
-            url = url,
-            description = \
+            embed = interactions.Embed(
+                title = "Never Meant",
+                url = url,
+                description = \
 """```
 E|------------0----0-----0----0-------0-----|
 C|---4p2p0---0-0--0-----0-0--0-------0-0----|
@@ -78,36 +130,34 @@ C|-0----------------------------------------|
 A|------------------------------------------|
 F|------------------------------------------|
 ```""",
-            color = NM_GREEN,
-        )
-        embed.set_author(name="American Football", icon_url="https://f4.bcbits.com/img/a2991634193_10.jpg")
-        embed.set_footer(text=url)
-        
-        await ctx.send("Let's just forget...", embeds=embed, components=nm_display_full_button)
-
-        try:
-            # Waiting for the button click
-            button_ctx: interactions.ComponentContext = await bot.wait_for_component(
-                components=[nm_display_full_button], 
-                timeout=60
+                color = NM_GREEN,
             )
-            await button_ctx.edit(content=None, embeds=tab_embed, components=[])
-        except asyncio.TimeoutError:
-            return await ctx.edit(components=[])
-
-    except InvalidLinkError as e:
-        # Ephemeral message for invalid Links
-        await ctx.send(e, ephemeral=True)
-    except requests.HTTPError as e:
-        # Ephemeral message for unsuccessful HTTP connections
-        if e.response.status_code == 404:
-            await ctx.send(f"Tab not found.", ephemeral=True)
-        else:
-            await ctx.send(f"Unsuccessful connection: {e}. Try again later.", ephemeral=True)
-    # except Exception as e:
-    #     # Ephemeral message for all other errors
-    #     print(e)
-    #     await ctx.send("Something went wrong.", ephemeral=True)
+            embed.set_author(name="American Football", icon_url="https://f4.bcbits.com/img/a2991634193_10.jpg")
+            embed.set_footer(text=url)
+            
+            with ug_metrics.timer("send"):
+                # the full tab is shown by on_component
+                await ctx.send("Let's just forget...", embeds=embed, components=nm_display_full_button)
+
+        except InvalidLinkError as e:
+            # Ephemeral message for invalid Links
+            await ctx.send(e, ephemeral=True)
+        except QueueFullError:
+            # Ephemeral message when too many commands are waiting on ultimate-guitar
+            await ctx.send("The bot is busy, try again in a moment.", ephemeral=True)
+        except CircuitOpenError:
+            # Ephemeral message while ultimate-guitar is down, instead of asking it again
+            await ctx.send("Ultimate-Guitar is not responding, try again in a minute.", ephemeral=True)
+        except requests.HTTPError as e:
+            # Ephemeral message for unsuccessful HTTP connections
+            if e.response.status_code == 404:
+                await ctx.send(f"Tab not found.", ephemeral=True)
+            else:
+                await ctx.send(f"Unsuccessful connection: {e}. Try again later.", ephemeral=True)
+        # except Exception as e:
+        #     # Ephemeral message for all other errors
+        #     print(e)
+        #     await ctx.send("Something went wrong.", ephemeral=True)
 
 
 nm_display_full_button = interactions.Button(
@@ -149,28 +199,37 @@ nm_display_full_button = interactions.Button(
     ],
 )
 async def chords(ctx, artist: str, song: str, transpose: int = 0): #url: str
-    try:
-        # Takes the first result in the sorted results listing.
-        url = UGSearch(json_from_search(artist, song)).get_chords_results(1)[0].get_tab_url()
-        ugchords = UGChords(json_from_url(url))
-        ugchords.transpose(transpose)
-        
-        embed = _format_tab_embed(ugchords)
-        
-        await ctx.send(embeds=embed)
-    except InvalidLinkError as e:
-        # Ephemeral message for invalid Links
-        await ctx.send(e, ephemeral=True)
-    except requests.HTTPError as e:
-        # Ephemeral message for unsuccessful HTTP connections
-        if e.response.status_code == 404:
-            await ctx.send(f"Tab not found.", ephemeral=True)
-        else:
-            await ctx.send(f"Unsuccessful connection: {e}. Try again later.", ephemeral=True)
-    # except Exception as e:
-    #     # Ephemeral message for all other errors
-    #     print(e)
-    #     await ctx.send("Something went wrong.", ephemeral=True)
+    with ug_metrics.command_scope("chords"):
+        try:
+            # Takes the first result in the sorted results listing,
+            # or the second if the first is slow to fetch
+            ugchords = await fetch_top_tab(UGSearch(await async_json_from_search(artist, song), RANKERS["chords"]).get_chords_results(2), UGChords)
+            ugchords.transpose(transpose)
+            
+            embed = format_tab_embed(ugchords)
+            components = tab_row(TabPager("chords", ugchords))
+            
+            with ug_metrics.timer("send"):
+                await ctx.send(embeds=embed, components=components)
+        except InvalidLinkError as e:
+            # Ephemeral message for invalid Links
+            await ctx.send(e, ephemeral=True)
+        except QueueFullError:
+            # Ephemeral message when too many commands are waiting on ultimate-guitar
+            await ctx.send("The bot is busy, try again in a moment.", ephemeral=True)
+        except CircuitOpenError:
+            # Ephemeral message while ultimate-guitar is down, instead of asking it again
+            await ctx.send("Ultimate-Guitar is not responding, try again in a minute.", ephemeral=True)
+        except requests.HTTPError as e:
+            # Ephemeral message for unsuccessful HTTP connections
+            if e.response.status_code == 404:
+                await ctx.send(f"Tab not found.", ephemeral=True)
+            else:
+                await ctx.send(f"Unsuccessful connection: {e}. Try again later.", ephemeral=True)
+        # except Exception as e:
+        #     # Ephemeral message for all other errors
+        #     print(e)
+        #     await ctx.send("Something went wrong.", ephemeral=True)
 
 
 
@@ -193,27 +252,36 @@ async def chords(ctx, artist: str, song: str, transpose: int = 0): #url: str
     ],
 )
 async def tabs(ctx, artist: str, song: str):
-    try:
-        # Takes the first result in the sorted results listing.
-        url = UGSearch(json_from_search(artist, song)).get_tabs_results(1)[0].get_tab_url()
-        ugtabs = UGTab(json_from_url(url))
-
-        embed = _format_tab_embed(ugtabs)
-        
-        await ctx.send(embeds=embed)
-    except InvalidLinkError as e:
-        # Ephemeral message for invalid Links
-        await ctx.send(e, ephemeral=True)
-    except requests.HTTPError as e:
-        # Ephemeral message for unsuccessful HTTP connections
-        if e.response.status_code == 404:
-            await ctx.send(f"Tab not found.", ephemeral=True)
-        else:
-            await ctx.send(f"Unsuccessful connection: {e}. Try again later.", ephemeral=True)
-    # except Exception as e:
-    #     # Ephemeral message for all other errors
-    #     print(e)
-    #     await ctx.send("Something went wrong.", ephemeral=True)
+    with ug_metrics.command_scope("tabs"):
+        try:
+            # Takes the first result in the sorted results listing,
+            # or the second if the first is slow to fetch
+            ugtabs = await fetch_top_tab(UGSearch(await async_json_from_search(artist, song), RANKERS["tabs"]).get_tabs_results(2), UGTab)
+
+            embed = format_tab_embed(ugtabs)
+            components = tab_row(TabPager("tabs", ugtabs))
+            
+            with ug_metrics.timer("send"):
+                await ctx.send(embeds=embed, components=components)
+        except InvalidLinkError as e:
+            # Ephemeral message for invalid Links
+            await ctx.send(e, ephemeral=True)
+        except QueueFullError:
+            # Ephemeral message when too many commands are waiting on ultimate-guitar
+            await ctx.send("The bot is busy, try again in a moment.", ephemeral=True)
+        except CircuitOpenError:
+            # Ephemeral message while ultimate-guitar is down, instead of asking it again
+            await ctx.send("Ultimate-Guitar is not responding, try again in a minute.", ephemeral=True)
+        except requests.HTTPError as e:
+            # Ephemeral message for unsuccessful HTTP connections
+            if e.response.status_code == 404:
+                await ctx.send(f"Tab not found.", ephemeral=True)
+            else:
+                await ctx.send(f"Unsuccessful connection: {e}. Try again later.", ephemeral=True)
+        # except Exception as e:
+        #     # Ephemeral message for all other errors
+        #     print(e)
+        #     await ctx.send("Something went wrong.", ephemeral=True)
 
 
 
@@ -294,113 +362,50 @@ async def tabs(ctx, artist: str, song: str):
     ],
 )
 async def search(ctx: interactions.context._Context, sub_command: str, artist: str, song: str = None):
-    try:
-        if sub_command == "artist":
-            ugsearch = UGSearch(json_from_search(artist))
-            results = ugsearch.get_artists_results(10)
-            results_embeds = _format_results_embeds(results)
-            
-            page = 0
-            PAGE_MAX = len(results_embeds)-1
-            search_row.components[0].disabled = True
-            search_row.components[2].disabled = page == PAGE_MAX
-
-            await ctx.send(embeds=results_embeds[page], components=search_row)
-            
-            try:
-                while True:
-                    # Waiting for the button click
-                    button_ctx: interactions.ComponentContext = await bot.wait_for_component(
-                        components=[search_left_button, search_choose_button, search_right_button], 
-                        timeout=60
-                    )
-                    if button_ctx.custom_id == "next":
-                        page += 1
-                    elif button_ctx.custom_id == "prev":
-                        page -= 1
-                    elif button_ctx.custom_id == "choose":
-                        break
-
-                    search_row.components[0].disabled=page == 0
-                    search_row.components[2].disabled=page == PAGE_MAX
-
-                    await button_ctx.edit(embeds=results_embeds[page], components=search_row)
-            except asyncio.TimeoutError:
-                return await ctx.edit(embeds=results_embeds[page], components=[])
-            
-            url = "https://www.ultimate-guitar.com" + results[page].get_artist_url()
-            ugsearch = UGSearch(json_from_url(url))
-            sub_command = "all"
-            await ctx.edit(embeds=results_embeds[page], components=[])
-        else:
-            ugsearch = UGSearch(json_from_search(artist, song))
-
-        if sub_command == "all":
-            results = ugsearch.get_results(10)
-        elif sub_command == "chords":
-            results = ugsearch.get_chords_results(10)
-        elif sub_command == "tabs":
-            results = ugsearch.get_tabs_results(10)
-        
-        results_embeds = _format_results_embeds(results)
-        
-        page = 0
-        PAGE_MAX = len(results_embeds)-1
-        search_row.components[0].disabled = True
-        search_row.components[2].disabled = page == PAGE_MAX
-
-        await ctx.send(embeds=results_embeds[page], components=search_row)
-        
+    with ug_metrics.command_scope("search"):
         try:
-            while True:
-                # Waiting for the button click
-                button_ctx: interactions.ComponentContext = await bot.wait_for_component(
-                    components=[search_left_button, search_choose_button, search_right_button], 
-                    timeout=60
-                )
-                if button_ctx.custom_id == "next":
-                    page += 1
-                elif button_ctx.custom_id == "prev":
-                    page -= 1
-                elif button_ctx.custom_id == "choose":
-                    break
-
-                search_row.components[0].disabled=page == 0
-                search_row.components[2].disabled=page == PAGE_MAX
-
-                await button_ctx.edit(embeds=results_embeds[page], components=search_row)
-        except asyncio.TimeoutError:
-            return await ctx.edit(embeds=results_embeds[page], components=[])
-        
-        
-        url = results[page].get_tab_url()
-        ugtab = UGTab(json_from_url(url))
-
-        embed = _format_tab_embed(ugtab)
-
-        tab_row.components[0].url = url
-        
-        await button_ctx.edit(embeds=embed, components=tab_row)
-
-        button_ctx = await bot.wait_for_component(
-            components=[close_button],
-            timeout=None
-        )
-        await button_ctx.edit(embeds=results_embeds[page], components=[])
-        
-    except InvalidLinkError as e:
-        # Ephemeral message for invalid Links
-        await ctx.send(e, ephemeral=True)
-    except requests.HTTPError as e:
-        # Ephemeral message for unsuccessful HTTP connections
-        if e.response.status_code == 404:
-            await ctx.send(f"Tab not found.", ephemeral=True)
-        else:
-            await ctx.send(f"Unsuccessful connection: {e}. Try again later.", ephemeral=True)
-    # except Exception as e:
-    #     # Ephemeral message for all other errors
-    #     print(e)
-    #     await ctx.send("Something went wrong.", ephemeral=True)
+            if sub_command == "artist":
+                ugsearch = UGSearch(await async_json_from_search(artist), RANKERS["search"])
+                results = ugsearch.get_artists_results(10)
+                # the artist's tabs are shown once one is chosen, see display_result
+                browser = ResultsBrowser("search", results, format_results_embeds(results))
+            else:
+                ugsearch = UGSearch(await async_json_from_search(artist, song), RANKERS["search"])
+
+                if sub_command == "all":
+                    results = ugsearch.get_results(10)
+                elif sub_command == "chords":
+                    results = ugsearch.get_chords_results(10)
+                elif sub_command == "tabs":
+                    results = ugsearch.get_tabs_results(10)
+
+                # the tabs are fetched while the user pages through the results
+                prefetcher = Prefetcher([result.get_tab_url() for result in results])
+                browser = ResultsBrowser("search", results, format_results_embeds(results), prefetcher)
+
+            # the buttons are answered by on_component
+            session_id = browsers.add(browser)
+            await ctx.send(embeds=browser.get_embed(), components=results_row(session_id, browser))
+            
+        except InvalidLinkError as e:
+            # Ephemeral message for invalid Links
+            await ctx.send(e, ephemeral=True)
+        except QueueFullError:
+            # Ephemeral message when too many commands are waiting on ultimate-guitar
+            await ctx.send("The bot is busy, try again in a moment.", ephemeral=True)
+        except CircuitOpenError:
+            # Ephemeral message while ultimate-guitar is down, instead of asking it again
+            await ctx.send("Ultimate-Guitar is not responding, try again in a minute.", ephemeral=True)
+        except requests.HTTPError as e:
+            # Ephemeral message for unsuccessful HTTP connections
+            if e.response.status_code == 404:
+                await ctx.send(f"Tab not found.", ephemeral=True)
+            else:
+                await ctx.send(f"Unsuccessful connection: {e}. Try again later.", ephemeral=True)
+        # except Exception as e:
+        #     # Ephemeral message for all other errors
+        #     print(e)
+        #     await ctx.send("Something went wrong.", ephemeral=True)
 
 
 @bot.command(
@@ -430,165 +435,224 @@ async def search(ctx: interactions.context._Context, sub_command: str, artist: s
     ],
 )
 async def explore(ctx: interactions.context._Context, sub_command: str):
-    try:
-        if sub_command == "today":
-            option = "hitsdailygroup_desc"
-        elif sub_command == "popular":
-            option = "hitstotal_desc"
-        elif sub_command == "recent":
-            option = "date_desc"
-        elif sub_command == "rating":
-            option = "rating_desc"
-        
-        # Gets the highest voted 5 chord results and 5 tab results
-        ugexplore = UGExplore(json_from_explore(option))
-        results = ugexplore.get_results(10)
-        
-        results_embeds = _format_results_embeds(results)
-        
-        page = 0
-        PAGE_MAX = len(results_embeds)-1
-        search_row.components[0].disabled = True
-        search_row.components[2].disabled = page == PAGE_MAX
-
-        await ctx.send(embeds=results_embeds[page], components=search_row)
-        
-        # TODO: close brings back to the pagination
+    with ug_metrics.command_scope("explore"):
         try:
-            while True:
-                # Waiting for the button click
-                button_ctx: interactions.ComponentContext = await bot.wait_for_component(
-                    components=[search_left_button, search_choose_button, search_right_button], 
-                    timeout=60
-                )
-                if button_ctx.custom_id == "next":
-                    page += 1
-                elif button_ctx.custom_id == "prev":
-                    page -= 1
-                elif button_ctx.custom_id == "choose":
-                    break
-
-                search_row.components[0].disabled=page == 0
-                search_row.components[2].disabled=page == PAGE_MAX
-
-                await button_ctx.edit(embeds=results_embeds[page], components=search_row)
-        except asyncio.TimeoutError:
-            return await ctx.edit(embeds=results_embeds[page], components=[])
-        
-        
-        url = results[page].get_tab_url()
-        ugtab = UGTab(json_from_url(url))
-
-        embed = _format_tab_embed(ugtab)
-
-        tab_row.components[0].url = url
-        
-        await button_ctx.edit(embeds=embed, components=tab_row)
-
-        button_ctx = await bot.wait_for_component(
-            components=[close_button],
-            timeout=None
-        )
-        await button_ctx.edit(embeds=results_embeds[page], components=[])
-
+            option = EXPLORE_OPTIONS[sub_command]
             
-
-    except requests.HTTPError as e:
-        # Ephemeral message for unsuccessful HTTP connections
-        if e.response.status_code == 404:
-            await ctx.send(f"Tab not found.", ephemeral=True)
-        else:
-            await ctx.send(f"Unsuccessful connection: {e}. Try again later.", ephemeral=True)
-    # except Exception as e:
-    #     # Ephemeral message for all other errors
-    #     print(e)
-    #     await ctx.send("Something went wrong.", ephemeral=True)
-
-
-
-
-def _format_tab_embed(ugtab: UGTab) -> interactions.Embed:
-    """Formats the tab to be an embed."""
-    # FIXME: Handle chords/tabs that are too long (max: 4096)!!
-    # temporary fix
-    c = ugtab.get_content()
-    if len(c) > 4096:
-        c = c[:4000] + "\n\n... [TRUNCATED] ..." 
-
-    embed = interactions.Embed(
-        title = ugtab.get_artist() + " - " + ugtab.get_song() + " (" + ugtab.get_type() + ")",
-        url = ugtab.get_tab_url(),
-        description = "```" + c + "```",
-        color = UG_YELLOW
-    )
-    embed.set_footer(text=ugtab.get_formatted_metadata())
-    return embed
+            # Gets the highest voted 5 chord results and 5 tab results
+            ugexplore = explore_refresher.get_explore(option)
+            if ugexplore is None:
+                ugexplore = UGExplore(await async_json_from_explore(option))
+            results = ugexplore.get_results(10)
+
+            # the tabs are fetched while the user pages through the results
+            prefetcher = Prefetcher([result.get_tab_url() for result in results])
+            browser = ResultsBrowser("explore", results, format_results_embeds(results), prefetcher)
+
+            # the buttons are answered by on_component
+            session_id = browsers.add(browser)
+            await ctx.send(embeds=browser.get_embed(), components=results_row(session_id, browser))
+
+        except QueueFullError:
+            # Ephemeral message when too many commands are waiting on ultimate-guitar
+            await ctx.send("The bot is busy, try again in a moment.", ephemeral=True)
+        except CircuitOpenError:
+            # Ephemeral message while ultimate-guitar is down, instead of asking it again
+            await ctx.send("Ultimate-Guitar is not responding, try again in a minute.", ephemeral=True)
+        except requests.HTTPError as e:
+            # Ephemeral message for unsuccessful HTTP connections
+            if e.response.status_code == 404:
+                await ctx.send(f"Tab not found.", ephemeral=True)
+            else:
+                await ctx.send(f"Unsuccessful connection: {e}. Try again later.", ephemeral=True)
+        # except Exception as e:
+        #     # Ephemeral message for all other errors
+        #     print(e)
+        #     await ctx.send("Something went wrong.", ephemeral=True)
 
 
 
-def _format_results_embeds(results: "list[UGSearchResult | UGArtist]") -> "list[interactions.Embed]":
-    """Formats the results listing to be embeds."""
-    results_embeds = []
-    for i in range(len(results)):
-        r = results[i]
-        if type(r) is UGSearchResult:
-            embed = interactions.Embed(
-                title = r.get_artist() + " - " + r.get_song() + " (" + r.get_type() + ")",
-                description = r.get_formatted_result_description(),
-                color = UG_YELLOW
-            )
-        elif type(r) is UGArtist:
-            embed = interactions.Embed(
-                title = r.get_artist(),
-                description = r.get_formatted_result_description(),
-                color = UG_YELLOW
-            )
-        embed.set_footer(text=str(i+1)+"/"+str(len(results)))
-        results_embeds.append(embed)
-    return results_embeds
-
-
+@bot.event
+async def on_component(ctx: interactions.ComponentContext):
+    """Answers the buttons of every result browser and tab, by the action and session id in their custom_id."""
+    if ctx.custom_id == nm_display_full_button.custom_id:
+        return await display_never_meant(ctx)
+    decoded = decode_custom_id(ctx.custom_id)
+    if decoded is None:
+        return
+    action, session_id = decoded
+    session = browsers.get(session_id)
+    if session is None:
+        # the session has not been used for SESSION_TTL, or was closed
+        return await ctx.edit(components=[])
+
+    with ug_metrics.command_scope(session.get_command()):
+        try:
+            if action in ("tabprev", "tabnext", "keydown", "keyup"):
+                # the pages and keys of a tab, shown by itself or chosen from the results
+                pager = session if type(session) is TabPager else session.get_tab_pager()
+                if pager is None:
+                    return
+                if action == "tabprev" or action == "tabnext":
+                    pager.turn(-1 if action == "tabprev" else 1)
+                elif type(pager.get_tab()) is UGChords:
+                    # all 12 keys are built on the first key change, the next ones are lookups
+                    keys_cache.add(pager.get_tab())
+                    pager.transpose(-1 if action == "keydown" else 1)
+                await ctx.edit(embeds=format_tab_embed(pager.get_tab(), pager.get_page()), components=tab_row(pager, session_id, pager is not session))
+            elif type(session) is not ResultsBrowser:
+                return
+            elif action == "prev" or action == "next":
+                session.turn(-1 if action == "prev" else 1)
+                await ctx.edit(embeds=session.get_embed(), components=results_row(session_id, session))
+            elif action == "choose":
+                await display_result(ctx, session_id, session)
+            elif action == "close":
+                # TODO: close brings back to the pagination
+                browsers.pop(session_id)
+                session.close()
+                await ctx.edit(embeds=session.get_embed(), components=[])
+
+        except QueueFullError:
+            # Ephemeral message when too many commands are waiting on ultimate-guitar
+            await ctx.send("The bot is busy, try again in a moment.", ephemeral=True)
+        except CircuitOpenError:
+            # Ephemeral message while ultimate-guitar is down, instead of asking it again
+            await ctx.send("Ultimate-Guitar is not responding, try again in a minute.", ephemeral=True)
+        except requests.HTTPError as e:
+            # Ephemeral message for unsuccessful HTTP connections
+            if e.response.status_code == 404:
+                await ctx.send(f"Tab not found.", ephemeral=True)
+            else:
+                await ctx.send(f"Unsuccessful connection: {e}. Try again later.", ephemeral=True)
+
+
+async def display_result(ctx: interactions.ComponentContext, session_id: str, browser: ResultsBrowser):
+    """Shows the tab of the result chosen, or the tabs of the artist chosen."""
+    result = browser.get_result()
+    if type(result) is UGArtist:
+        ugsearch = UGSearch(await async_json_from_artist(result.get_artist_url()), RANKERS["search"])
+        results = ugsearch.get_results(10)
+        prefetcher = Prefetcher([r.get_tab_url() for r in results])
+        browser.set_results(results, format_results_embeds(results), prefetcher)
+        return await ctx.edit(embeds=browser.get_embed(), components=results_row(session_id, browser))
+
+    ugtab = explore_refresher.get_tab(result.get_tab_url()) if browser.get_command() == "explore" else None
+    if ugtab is None:
+        ugtab = await browser.get_prefetcher().get(browser.get_page())
+    browser.close()
+
+    embed = format_tab_embed(ugtab)
+    components = tab_row(browser.show_tab(ugtab), session_id, closable=True)
+
+    with ug_metrics.timer("send"):
+        await ctx.edit(embeds=embed, components=components)
+
+
+async def display_never_meant(ctx: interactions.ComponentContext):
+    with ug_metrics.command_scope("nevermeant"):
+        try:
+            ugtabs = UGTab(await async_json_from_url(NEVER_MEANT_URL))
+            components = tab_row(TabPager("nevermeant", ugtabs))
+            await ctx.edit(content=None, embeds=format_tab_embed(ugtabs), components=components)
+        except (QueueFullError, CircuitOpenError, requests.RequestException):
+            await ctx.send("Ultimate-Guitar is not responding, try again in a minute.", ephemeral=True)
+
+
+def results_row(session_id: str, browser: ResultsBrowser) -> interactions.ActionRow:
+    """Builds the buttons of the result browser, for the page it shows."""
+    return interactions.ActionRow(
+        components=[
+            interactions.Button(
+                style=interactions.ButtonStyle.PRIMARY, 
+                label="Prev",
+                custom_id=encode_custom_id("prev", session_id),
+                disabled=browser.is_first_page()
+            ),
+            interactions.Button(
+                style=interactions.ButtonStyle.SUCCESS, 
+                label="Display",
+                custom_id=encode_custom_id("choose", session_id)
+            ),
+            interactions.Button(
+                style=interactions.ButtonStyle.PRIMARY, 
+                label="Next",
+                custom_id=encode_custom_id("next", session_id),
+                disabled=browser.is_last_page()
+            ),
+        ]
+    )
 
-search_right_button = interactions.Button(
-    style=interactions.ButtonStyle.PRIMARY, 
-    label="Next",
-    custom_id="next"
-)
-search_left_button = interactions.Button(
-    style=interactions.ButtonStyle.PRIMARY, 
-    label="Prev",
-    custom_id="prev"
-)
-search_choose_button = interactions.Button(
-    style=interactions.ButtonStyle.SUCCESS, 
-    label="Display",
-    custom_id="choose"
-)
-search_row = interactions.ActionRow(
-    components=[
-        search_left_button, 
-        search_choose_button, 
-        search_right_button
-    ]
-)
 
-link_button = interactions.Button(
-    style=interactions.ButtonStyle.LINK, 
-    label="Open in UG"
-)
-close_button = interactions.Button(
-    style=interactions.ButtonStyle.DANGER, 
-    label="Close",
-    custom_id="close"
-)
-tab_row = interactions.ActionRow(
-    components=[
-        link_button, 
-        close_button
-    ]
-)
+def tab_row(pager: TabPager, session_id: str = None, closable: bool = False) -> "list[interactions.ActionRow]":
+    """
+    Builds the buttons of a tab: Prev and Next if it has more than one page,
+    Open in UG and Close if it was chosen from the results of the session,
+    and Key - and Key + on a row of their own if it is a chords sheet.
+    A tab shown by itself is added to the sessions if it has more than one page, or is a chords sheet.
+    """
+    tab = pager.get_tab()
+    transposable = type(tab) is UGChords
+    if session_id is None and (tab.get_page_count() > 1 or transposable):
+        # the other pages and keys are shown by on_component
+        session_id = browsers.add(pager)
+    buttons = []
+    if tab.get_page_count() > 1:
+        buttons += [
+            interactions.Button(
+                style=interactions.ButtonStyle.PRIMARY, 
+                label="Prev",
+                custom_id=encode_custom_id("tabprev", session_id),
+                disabled=pager.is_first_page()
+            ),
+            interactions.Button(
+                style=interactions.ButtonStyle.PRIMARY, 
+                label="Next",
+                custom_id=encode_custom_id("tabnext", session_id),
+                disabled=pager.is_last_page()
+            ),
+        ]
+    if closable:
+        buttons += [
+            interactions.Button(
+                style=interactions.ButtonStyle.LINK, 
+                label="Open in UG",
+                url=tab.get_tab_url()
+            ),
+            interactions.Button(
+                style=interactions.ButtonStyle.DANGER, 
+                label="Close",
+                custom_id=encode_custom_id("close", session_id)
+            ),
+        ]
+    rows = [interactions.ActionRow(components=buttons)] if buttons else []
+    if transposable:
+        rows.append(interactions.ActionRow(
+            components=[
+                interactions.Button(
+                    style=interactions.ButtonStyle.SECONDARY, 
+                    label="Key -",
+                    custom_id=encode_custom_id("keydown", session_id)
+                ),
+                interactions.Button(
+                    style=interactions.ButtonStyle.SECONDARY, 
+                    label="Key +",
+                    custom_id=encode_custom_id("keyup", session_id)
+                ),
+            ]
+        ))
+    return rows
 
 
 keep_alive()
 
-bot.start()
\ No newline at end of file
+# keeps the connections to ultimate-guitar open while the bot runs,
+# and closes them when it stops
+with pooled_session():
+    try:
+        bot.start()
+    finally:
+        get_search_index().stop()
+        get_search_index().save()
+        if get_parse_pool() is not None:
+            get_parse_pool().shutdown()
\ No newline at end of file
@@ -0,0 +1,416 @@
+"""
+Benchmarks for the scraper and the parser, run with:
+
+    python benchmarks.py [extract] [memory] [transpose] [pipeline] [index] [rank] [workers] [batch] [stages] [--baseline FILE]
+
+The pages are replayed from fixtures (see ug_fixtures.py) built from the saved
+JSON in sample/sample_json, so no connection to ultimate-guitar is needed.
+With --baseline, the stage timings are saved to FILE the first time,
+and compared to it afterwards.
+"""
+import sys
+import json
+import copy
+import random
+import pickle
+import timeit
+import asyncio
+import tempfile
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter_ns
+
+import ug_scraper
+import ug_parser
+import ug_index
+import ug_rank
+import ug_prefetch
+import ug_concurrency
+from ug_fixtures import SAMPLE_URLS, load_sample_pages, build_from_samples, replay, save_page, page_from_json
+
+# a stage is a regression if its median is this much slower than the baseline
+_REGRESSION_RATIO = 1.25
+
+
+def bench_extract(number: int = 50) -> None:
+    """Compares the fast js-store extractor to the BeautifulSoup extractor."""
+    print("js-store extraction (ms per page)")
+    for name, page in load_sample_pages().items():
+        fast = timeit.timeit(lambda: ug_scraper._fast_extract_data_content(page, 'utf-8'), number=number)
+        soup = timeit.timeit(lambda: ug_scraper._soup_extract_data_content(page), number=number)
+        print(f"  {name:<18} {len(page)//1024:>5} KiB | fast {fast/number*1000:8.3f} | soup {soup/number*1000:8.3f} | x{soup/fast:.0f}")
+
+
+class _DictBacked():
+    """A dict-backed copy of a parsed object, for comparing to the slot-based one."""
+    def __init__(self, record: ug_parser._Record):
+        for name in ug_parser._record_fields(type(record)):
+            value = getattr(record, name, None)
+            setattr(self, name, _DictBacked(value) if isinstance(value, ug_parser._Record) else value)
+
+
+def _bytes_per_object(build, n: int = 2000) -> float:
+    """Returns the bytes allocated per object built by build()."""
+    tracemalloc.start()
+    objects = [build() for _ in range(n)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size / n
+
+
+def bench_memory() -> None:
+    """Compares the memory used per parsed object to dict-backed objects."""
+    with open('sample/sample_json/chit_chat.json', 'r') as f:
+        tab_data = json.load(f)
+    result_data = tab_data['store']['page']['data']['tab']
+    objects = {
+        'UGTabInfo': lambda: ug_parser.UGTabInfo(tab_data),
+        'UGSearchResult': lambda: ug_parser.UGSearchResult(result_data),
+        'UGArtist': lambda: ug_parser.UGArtist(result_data),
+    }
+    print("memory (bytes per object, excluding shared strings)")
+    for name, build in objects.items():
+        record = build()
+        after = _bytes_per_object(build)
+        before = _bytes_per_object(lambda: _DictBacked(record))
+        print(f"  {name:<18} dict {before:7.0f} | slots {after:7.0f} | pickled {len(pickle.dumps(record)):5d}")
+
+
+def bench_transpose(number: int = 1000) -> None:
+    """Times transposing a chords sheet to each key in turn."""
+    with open('sample/sample_json/chit_chat.json', 'r') as f:
+        chords = ug_parser.UGChords(json.load(f))
+    first = timeit.timeit(lambda: chords.transpose(1), number=1)
+    steps = iter(range(number))
+    rest = timeit.timeit(lambda: chords.transpose(next(steps)), number=number)
+    materialize = timeit.timeit(chords.materialize_keys, number=1)
+    steps = iter(range(number))
+    lookup = timeit.timeit(lambda: chords.transpose(next(steps)), number=number)
+    print("transpose (us)")
+    print(f"  first {first*1e6:8.1f} | then {rest/number*1e6:8.1f} per key change")
+    print(f"  all 12 keys {materialize*1e6:8.1f} ({chords.get_keys_nbytes()} bytes, content {len(chords.get_content())} chars) | then {lookup/number*1e6:8.1f} per key change")
+
+
+def _network_latency(rng: random.Random):
+    """Returns a function giving each request 10-20 ms, or 100-200 ms for one request in six, like a slow network."""
+    return lambda url: rng.uniform(0.1, 0.2) if rng.random() < 1/6 else rng.uniform(0.01, 0.02)
+
+
+def bench_pipeline(number: int = 60) -> None:
+    """Compares the sequential search then tab fetches of /chords to the hedged ones, on a slow network."""
+    with open('sample/sample_json/chit_chat_search.json', 'r') as f:
+        data = json.load(f)
+    best = data['store']['page']['data']['results'][0]
+    second = dict(best, id=best['id'] + 1, votes=best['votes'] - 1,
+                  tab_url=next(url for url, name in SAMPLE_URLS.items() if name == 'bright'))
+    data['store']['page']['data']['results'] = [best, second]
+
+    async def sequential():
+        url = ug_parser.UGSearch(await ug_scraper.async_json_from_url(ug_scraper.SAMPLE_SEARCH)).get_chords_results(1)[0].get_tab_url()
+        return ug_parser.UGChords(await ug_scraper.async_json_from_url(url))
+
+    async def hedged():
+        results = ug_parser.UGSearch(await ug_scraper.async_json_from_url(ug_scraper.SAMPLE_SEARCH)).get_chords_results(2)
+        return await ug_prefetch.fetch_top_tab(results, ug_parser.UGChords, hedge_after=0.05, accept_after=0.08)
+
+    old_cache, old_scheduler = ug_scraper.get_cache(), ug_scraper.get_scheduler()
+    ug_scraper.set_cache(None)
+    ug_scraper.set_scheduler(ug_concurrency.FetchScheduler(max_concurrent=8, rate=10000, burst=10000))
+    print(f"/chords pipeline ({number} commands, ms, 1 in 6 requests slow)")
+    try:
+        with tempfile.TemporaryDirectory() as path:
+            build_from_samples(path)
+            save_page(ug_scraper.SAMPLE_SEARCH, page_from_json(data), path)
+            for name, command in (("sequential", sequential), ("hedged", hedged)):
+                with replay(path, latency=_network_latency(random.Random(0))):
+                    times = []
+                    for _ in range(number):
+                        start = perf_counter_ns()
+                        asyncio.run(command())
+                        times.append((perf_counter_ns() - start) / 1e6)
+                times.sort()
+                print(f"  {name:<12} p50 {times[len(times)//2]:7.1f} | p95 {times[int(len(times)*0.95)]:7.1f}")
+    finally:
+        ug_scraper.set_cache(old_cache)
+        ug_scraper.set_scheduler(old_scheduler)
+
+
+def bench_batch(number: int = 10) -> None:
+    """Compares fetching the tabs of the results one by one to fetching them with json_from_urls, on a slow network."""
+    urls = [url for url, name in SAMPLE_URLS.items() if name in ('chit_chat', 'bright')]
+    old_cache, old_scheduler = ug_scraper.get_cache(), ug_scraper.get_scheduler()
+    ug_scraper.set_cache(None)
+    ug_scraper.set_scheduler(ug_concurrency.FetchScheduler(max_concurrent=8, rate=10000, burst=10000))
+    print(f"batch fetch ({number} batches of 10 tabs, ms, 1 in 6 requests slow)")
+    try:
+        with tempfile.TemporaryDirectory() as path:
+            build_from_samples(path)
+            for name, fetch in (
+                ("one by one", lambda batch: [ug_scraper.json_from_url(url) for url in batch]),
+                ("json_from_urls", lambda batch: list(ug_scraper.json_from_urls(batch))),
+            ):
+                with replay(path, latency=_network_latency(random.Random(0))):
+                    times = []
+                    for _ in range(number):
+                        start = perf_counter_ns()
+                        fetch([urls[i % len(urls)] for i in range(10)])
+                        times.append((perf_counter_ns() - start) / 1e6)
+                times.sort()
+                print(f"  {name:<14} p50 {times[len(times)//2]:7.1f} | p95 {times[int(len(times)*0.95)]:7.1f}")
+    finally:
+        ug_scraper.set_cache(old_cache)
+        ug_scraper.set_scheduler(old_scheduler)
+
+
+def index_results(num: int, seed: int = 0) -> "list[dict]":
+    """Returns num search results with made up artist and song names, over a vocabulary like ultimate-guitar's."""
+    rng = random.Random(seed)
+    syllables = ["ba", "ka", "lo", "mi", "ne", "ri", "so", "ta", "vu", "ze", "é", "qu", "ch", "st", "or"]
+    words = list({''.join(rng.choice(syllables) for _ in range(rng.randint(2, 4))) for _ in range(20000)})
+    artists = [' '.join(rng.choice(words) for _ in range(rng.randint(1, 3))).title() for _ in range(num // 20)]
+    results = []
+    for i in range(num):
+        artist = rng.choice(artists)
+        song = ' '.join(rng.choice(words) for _ in range(rng.randint(1, 4))).title()
+        results.append({
+            "id": i, "tab_url": f"https://tabs.ultimate-guitar.com/tab/{i}", "artist_name": artist, "song_name": song,
+            "type": rng.choice(("Chords", "Tabs")), "votes": rng.randint(0, 5000), "rating": rng.uniform(3, 5),
+            "artist_url": "/artist/" + artist.lower().replace(' ', '_'),
+        })
+    return results
+
+
+def bench_index(num: int = 100000, queries: int = 2000) -> None:
+    """Times building, querying, saving and loading the search index with num tabs."""
+    results = index_results(num)
+    rng = random.Random(1)
+    print(f"search index ({num} tabs)")
+
+    start = perf_counter_ns()
+    index = ug_index.SearchIndex()
+    index.add_results(results)
+    build = (perf_counter_ns() - start) / 1e9
+    tracemalloc.start()
+    measured = ug_index.SearchIndex()
+    measured.add_results(results)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del measured
+    print(f"  build {build:6.2f} s | {memory / num:6.0f} bytes per tab | {index.get_stats()['words']} words")
+
+    samples = [rng.choice(results) for _ in range(queries)]
+    for r in samples:
+        index._searched[ug_index._search_key(r['artist_name'] + " " + r['song_name'])] = ug_index.time.time()
+    for name, lookup in (
+        ("query song", lambda r: index.query(r['song_name'])),
+        ("query artist", lambda r: index.query(r['artist_name'])),
+        ("lookup", lambda r: index.lookup(r['artist_name'], r['song_name'])),
+    ):
+        times = []
+        for r in samples:
+            start = perf_counter_ns()
+            lookup(r)
+            times.append((perf_counter_ns() - start) / 1000)
+        times.sort()
+        print(f"  {name:<12} p50 {times[len(times)//2]:8.1f} us | p95 {times[int(len(times)*0.95)]:8.1f} us")
+
+    with tempfile.TemporaryDirectory() as path:
+        index._path = path + '/search.index'
+        save = timeit.timeit(index.save, number=1)
+        load = timeit.timeit(lambda: ug_index.SearchIndex(index._path), number=1)
+        size = ug_index.os.path.getsize(index._path)
+    print(f"  save {save:6.2f} s | load {load:6.2f} s | {size / 1024 / 1024:.1f} MiB")
+
+
+def bench_rank(number: int = 200) -> None:
+    """Times parsing a search page and scoring its results with each ranker."""
+    print(f"rankers ({number} searches, us, numpy {'on' if ug_rank.numpy is not None else 'off'})")
+    for num in (50, 500, 5000):
+        data = search_data(num)
+        line = f"  {num:>5} results"
+        for ranker in ug_rank.RANKERS:
+            seconds = timeit.timeit(lambda: ug_parser.UGSearch(data, ranker).get_chords_results(2), number=number)
+            line += f" | {ranker} {seconds / number * 1e6:8.1f}"
+        print(line)
+
+
+def bench_workers(number: int = 400) -> None:
+    """Compares the pages parsed per second in the fetching threads to those on parse pools of more workers."""
+    raws = []
+    for page in load_sample_pages().values():
+        extractor = ug_scraper.DataContentExtractor()
+        extractor.feed(page)
+        raws.append(extractor.get_raw_data_content())
+    jobs = [raws[i % len(raws)] for i in range(number)]
+    cores = multiprocessing.cpu_count()
+    print(f"parse workers ({number} pages, {cores} cores, 8 fetching threads)")
+
+    def throughput(parse) -> float:
+        with ThreadPoolExecutor(8) as threads:
+            start = perf_counter_ns()
+            list(threads.map(parse, jobs))
+            return number / ((perf_counter_ns() - start) / 1e9)
+
+    in_process = throughput(lambda raw: ug_scraper._decode_page(raw, True, True))
+    print(f"  {'in-process':<12} {in_process:8.0f} pages/s")
+    workers = 1
+    while workers <= max(cores, 2):
+        pool = ug_concurrency.ParsePool(workers, context='fork')
+        try:
+            pool.start()
+            pages = throughput(lambda raw: pool.run(ug_scraper._decode_page, raw, True, True))
+        finally:
+            pool.shutdown()
+        print(f"  {f'{workers} workers':<12} {pages:8.0f} pages/s | x{pages / in_process:.2f}")
+        workers *= 2
+
+
+def search_data(num: int = 500) -> dict:
+    """Returns the JSON of a search page with num results, built from the sample search result."""
+    with open('sample/sample_json/chit_chat_search.json', 'r') as f:
+        data = json.load(f)
+    result = data['store']['page']['data']['results'][0]
+    results = []
+    for i in range(num):
+        r = copy.copy(result)
+        r['id'] = i
+        r['type'] = "Chords" if i % 3 else "Tabs"
+        r['votes'] = (i * 7919) % 1009
+        r['rating'] = 3 + (i % 21) / 10
+        results.append(r)
+    data['store']['page']['data']['results'] = results
+    return data
+
+
+def time_stage(func, number: int) -> "dict[str, float]":
+    """
+    Calls func number times, and returns the percentiles of its time in microseconds,
+    and the memory it allocates at its peak per call in KiB, measured on separate calls.
+    """
+    func()
+    times = []
+    for _ in range(number):
+        start = perf_counter_ns()
+        func()
+        times.append((perf_counter_ns() - start) / 1000)
+    times.sort()
+
+    tracemalloc.start()
+    peak = 0
+    for _ in range(min(number, 5)):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        func()
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    percentile = lambda p: times[min(len(times) - 1, int(p / 100 * len(times)))]
+    return {"p50": percentile(50), "p95": percentile(95), "p99": percentile(99), "alloc_kib": peak / 1024}
+
+
+def stages() -> "list[tuple[str, object]]":
+    """Returns the (name, function) of each stage of handling a command, to be run under replay()."""
+    tab_url = next(url for url, name in SAMPLE_URLS.items() if name == 'chit_chat')
+    page = load_sample_pages()['chit_chat']
+    data_content = ug_scraper.extract_data_content(page)
+    data = json.loads(data_content)
+    chords = ug_parser.UGChords(data)
+    search = search_data()
+    steps = iter(range(10**9))
+
+    result = [
+        ("fetch", lambda: ug_scraper._get_session().get(tab_url).content),
+        ("json_from_url", lambda: ug_scraper._fetch_json(tab_url, None, ug_scraper._get_breaker("tabs.ultimate-guitar.com"))),
+        ("extract", lambda: ug_scraper.extract_data_content(page)),
+        ("decode", lambda: ug_parser.slim(ug_scraper._loads(data_content))),
+        ("UGTab", lambda: ug_parser.UGTab(data)),
+        ("UGChords", lambda: ug_parser.UGChords(data)),
+        ("transpose", lambda: chords.transpose(next(steps))),
+        ("paginate", lambda: ug_parser.paginate(chords.get_content(), 500)),
+        ("UGSearch ranking", lambda: ug_parser.UGSearch(search).get_results(10)),
+        ("UGSearch wilson", lambda: ug_parser.UGSearch(search, "wilson").get_results(10)),
+    ]
+    try:
+        import ug_embeds
+        tab = ug_parser.UGTab(data)
+        result.append(("format_tab_embed", lambda: ug_embeds.format_tab_embed(tab)))
+        # without the render cache, as for a tab shown for the first time
+        result.append(("build_tab_embed", lambda: ug_embeds._build_tab_embed(tab, 0)))
+    except ImportError:
+        # interactions is only needed by the bot
+        pass
+    return result
+
+
+def bench_stages(number: int = 200, baseline: str = None) -> bool:
+    """
+    Times each stage of handling a command on replayed pages.
+    Returns False if a stage regressed against the baseline file.
+    """
+    ok = True
+    results = {}
+    # not rate limited, which would time the token bucket instead of the fetch
+    old_scheduler = ug_scraper.get_scheduler()
+    ug_scraper.set_scheduler(None)
+    try:
+        with tempfile.TemporaryDirectory() as path:
+            build_from_samples(path)
+            with replay(path):
+                for name, func in stages():
+                    results[name] = time_stage(func, number)
+    finally:
+        ug_scraper.set_scheduler(old_scheduler)
+
+    old = None
+    if baseline is not None:
+        try:
+            with open(baseline, 'r') as f:
+                old = json.load(f)
+        except OSError:
+            with open(baseline, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    print(f"stages ({number} calls, us)")
+    print(f"  {'stage':<18} {'p50':>9} {'p95':>9} {'p99':>9} {'alloc KiB':>10}")
+    for name, r in results.items():
+        line = f"  {name:<18} {r['p50']:9.1f} {r['p95']:9.1f} {r['p99']:9.1f} {r['alloc_kib']:10.1f}"
+        if old is not None and name in old:
+            ratio = r['p50'] / old[name]['p50']
+            line += f"  x{ratio:.2f} vs baseline"
+            if ratio > _REGRESSION_RATIO:
+                line += "  REGRESSION"
+                ok = False
+        print(line)
+    return ok
+
+
+_BENCHMARKS = {
+    'extract': bench_extract,
+    'memory': bench_memory,
+    'transpose': bench_transpose,
+    'pipeline': bench_pipeline,
+    'index': bench_index,
+    'rank': bench_rank,
+    'workers': bench_workers,
+    'batch': bench_batch,
+}
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    baseline = None
+    if '--baseline' in args:
+        i = args.index('--baseline')
+        baseline = args[i+1]
+        del args[i:i+2]
+    names = args or list(_BENCHMARKS) + ['stages']
+
+    ok = True
+    for name in names:
+        if name == 'stages':
+            ok = bench_stages(baseline=baseline) and ok
+        else:
+            _BENCHMARKS[name]()
+    sys.exit(0 if ok else 1)
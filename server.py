@@ -1,12 +1,24 @@
-from flask import Flask
+from flask import Flask, Response, jsonify
 from threading import Thread
 
-app = Flask('')
+import ug_metrics
+
+app = Flask(__name__)
 
 @app.route('/')
 def home():
     return "I'm alive"
 
+@app.route('/metrics')
+def metrics():
+    """The bot's metrics, in the Prometheus text format."""
+    return Response(ug_metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/stats')
+def stats():
+    """The bot's metrics, as JSON."""
+    return jsonify(ug_metrics.snapshot())
+
 def run():
   app.run(host='0.0.0.0',port=8080)
 
@@ -1,17 +1,81 @@
+import os
+import copy
+import time
+import pickle
+import asyncio
 import unittest
-
+import threading
+import contextlib
+import tempfile
+from unittest import mock
 
 import ug_scraper
+import ug_fixtures
+import ug_cache
+import ug_concurrency
+import ug_prefetch
+import ug_sessions
+import ug_index
+import ug_parser
+import ug_rank
+import ug_metrics
+try:
+    import ug_embeds
+except ImportError:
+    # interactions is only needed by the bot
+    ug_embeds = None
+
+
+@contextlib.contextmanager
+def scraper_settings(**settings):
+    """
+    Swaps the scraper's settings for the with block,
+    e.g. scraper_settings(cache=None) calls set_cache(None), and then restores get_cache().
+    """
+    with contextlib.ExitStack() as stack:
+        for name, value in settings.items():
+            stack.callback(getattr(ug_scraper, "set_" + name), getattr(ug_scraper, "get_" + name)())
+            getattr(ug_scraper, "set_" + name)(value)
+        yield
+
+
+@contextlib.contextmanager
+def replaying(pages: "dict[str, bytes]" = None, samples: bool = True, latency=None, **settings):
+    """
+    Replays the pages built from sample/sample_json, and any other pages, for the with block,
+    with the scraper's settings swapped (see scraper_settings).
+
+    Parameters:
+    - pages:    the other pages to replay, url -> html
+    - samples:  whether to replay the sample pages
+    - latency:  the seconds to wait before each response (see ug_fixtures.replay)
+
+    Returns:
+    - the ReplayAdapter
+    """
+    with contextlib.ExitStack() as stack:
+        path = stack.enter_context(tempfile.TemporaryDirectory())
+        if samples:
+            ug_fixtures.build_from_samples(path)
+        for url, page in (pages or {}).items():
+            ug_fixtures.save_page(url, page, path)
+        stack.enter_context(scraper_settings(**settings))
+        yield stack.enter_context(ug_fixtures.replay(path, latency))
+
 
 class TestScraper(unittest.TestCase):
     """
     Tests for the basic functionality of scraper.py
-    i.e. web scraping ultimate-guitar.com
+    i.e. web scraping ultimate-guitar.com,
+    replayed from the fixtures built from sample/sample_json
     """
     def setUp(self):
         self.url = "https://tabs.ultimate-guitar.com/tab/beach-weather/chit-chat-chords-2421111"
         self.broken_url = "https://tabs.ultimate-guitar.com/tab/beach-weather/chit-chat-chords-2421"
         self.url2 = "https://tabs.ultimate-guitar.com/tab/echosmith/bright-chords-1442936"
+
+        self.stack = contextlib.ExitStack()
+        self.adapter = self.stack.enter_context(replaying(cache=None))
         
         # Writes JSON to files, uncomment for debug
         # scraper.write_dict_to_file(scraper.json_from_url(self.url), 'sample/sample_json/chit_chat.json')
@@ -27,12 +91,918 @@ class TestScraper(unittest.TestCase):
     def test_incorrect_link_raises_HTTPError(self):
         self.assertRaises(ug_scraper.requests.HTTPError, ug_scraper.json_from_url, self.broken_url)
     
+    def tearDown(self):
+        self.stack.close()
+
     def test_link_returns_jsondict(self):
         self.assertTrue(type(ug_scraper.json_from_url(self.url)) == dict)
 
+    def test_search_returns_jsondict(self):
+        self.assertTrue(type(ug_scraper.json_from_search("beach weather", "chit chat")) == dict)
+        self.assertEqual(1, self.adapter.get_requests())
 
+    def test_replay_restores_the_session(self):
+        session = ug_scraper._get_session()
+        self.stack.close()
+        self.assertIsNot(self.adapter, session.get_adapter(self.url))
+
+
+class TestAsyncScraper(unittest.TestCase):
+    """
+    Tests for the async functions of scraper.py
+    """
+    def test_invalid_link_raises_InvalidLinkError(self):
+        self.assertRaises(ug_scraper.InvalidLinkError, asyncio.run, ug_scraper.async_json_from_url('https://www.google.com/'))
+
+    def test_async_functions_build_same_urls(self):
+        self.assertEqual(ug_scraper.SAMPLE_SEARCH, ug_scraper._search_url(" beach weather", "chit chat "))
+        self.assertEqual("https://www.ultimate-guitar.com/search.php?search_type=band&value=beach%20weather", ug_scraper._search_url("beach weather"))
+        self.assertEqual("https://www.ultimate-guitar.com/explore?order=date_desc", ug_scraper.explore_url("date_desc"))
+        self.assertEqual("https://www.ultimate-guitar.com/artist/beach_weather_12345", ug_scraper._artist_url("/artist/beach_weather_12345"))
+
+
+class TestBatch(unittest.TestCase):
+    """
+    Tests for the batch fetches of scraper.py
+    """
+    def setUp(self):
+        self.urls = list(ug_fixtures.SAMPLE_URLS)
+        self.missing = "https://tabs.ultimate-guitar.com/tab/a/missing-chords-1"
+        self.stack = contextlib.ExitStack()
+        self.adapter = self.stack.enter_context(replaying(cache=ug_cache.UGCache(), scheduler=None))
+
+    def tearDown(self):
+        self.stack.close()
+
+    def check(self, results: list):
+        by_url = {url: (data, error) for url, data, error in results}
+        self.assertEqual(set(self.urls + [self.missing, "https://www.google.com/"]), set(by_url))
+        for url in self.urls:
+            self.assertEqual((ug_scraper.json_from_url(url), None), by_url[url])
+        self.assertIsNone(by_url[self.missing][0])
+        self.assertEqual(404, by_url[self.missing][1].response.status_code)
+        self.assertIsInstance(by_url["https://www.google.com/"][1], ug_scraper.InvalidLinkError)
+
+    def test_errors_are_yielded_per_url(self):
+        self.check(list(ug_scraper.json_from_urls(self.urls + [self.missing, "https://www.google.com/"])))
+
+    def test_async_errors_are_yielded_per_url(self):
+        async def fetch():
+            return [result async for result in ug_scraper.async_json_from_urls(self.urls + [self.missing, "https://www.google.com/"])]
+        self.check(asyncio.run(fetch()))
+
+    def test_urls_are_read_as_fetches_start(self):
+        read = []
+        def urls():
+            for url in self.urls:
+                read.append(url)
+                yield url
+        batch = ug_scraper.json_from_urls(urls(), max_concurrent=1)
+        next(batch)
+        self.assertEqual(1, len(read))
+        batch.close()
+        self.assertEqual(1, len(read))
+
+    def test_cached_pages_are_not_fetched_again(self):
+        list(ug_scraper.json_from_urls(self.urls))
+        requests = self.adapter.get_requests()
+        self.assertEqual(len(self.urls), requests)
+        list(ug_scraper.json_from_urls(self.urls + self.urls))
+        self.assertEqual(requests, self.adapter.get_requests())
+
+
+class TestSession(unittest.TestCase):
+    """
+    Tests for the pooled session of scraper.py
+    """
+    def tearDown(self):
+        ug_scraper.close()
+
+    def test_fetches_share_one_session(self):
+        self.assertIs(ug_scraper._get_session(), ug_scraper._get_session())
+
+    def test_open_session_sets_pool_size_and_compression(self):
+        ug_scraper.open_session(pool_size=3, max_workers=2)
+        session = ug_scraper._get_session()
+        self.assertEqual(3, session.get_adapter(ug_scraper._UG_TAB_URI)._pool_maxsize)
+        self.assertIn("gzip", session.headers["Accept-Encoding"])
+        self.assertEqual("keep-alive", session.headers["Connection"])
+
+    def test_pooled_session_closes_at_exit(self):
+        with ug_scraper.pooled_session(pool_size=2):
+            session = ug_scraper._get_session()
+            self.assertIs(session, ug_scraper._session)
+        self.assertIsNone(ug_scraper._session)
+        self.assertIsNone(ug_scraper._executor)
+
+
+class TestExtractor(unittest.TestCase):
+    """
+    Tests for the js-store extraction of scraper.py
+    """
+    def setUp(self):
+        self.pages = ug_fixtures.load_sample_pages()
+
+    def test_fast_extractor_matches_soup_extractor(self):
+        for page in self.pages.values():
+            fast = ug_scraper._fast_extract_data_content(page, 'utf-8')
+            self.assertIsNotNone(fast)
+            self.assertEqual(ug_scraper._soup_extract_data_content(page), fast)
+
+    def test_extracted_content_is_the_json(self):
+        with open('sample/sample_json/chit_chat.json', 'r') as f:
+            data = ug_scraper.json.load(f)
+        self.assertEqual(data, ug_scraper.json.loads(ug_scraper.extract_data_content(self.pages['chit_chat'])))
+
+    def test_uncommon_entities_are_unescaped(self):
+        page = b'<body><div class="js-store" data-content="{&quot;a&quot;: &quot;caf&eacute; &#x41;&quot;}"></div></body>'
+        self.assertEqual('{"a": "café A"}', ug_scraper.extract_data_content(page))
+
+    def test_falls_back_to_soup(self):
+        # single quoted attributes are not handled by the fast extractor
+        page = b"<body><div data-content='{\"a\": 1}' class='js-store'></div></body>"
+        self.assertIsNone(ug_scraper._fast_extract_data_content(page, 'utf-8'))
+        self.assertEqual('{"a": 1}', ug_scraper.extract_data_content(page))
+
+    def test_incremental_extractor_matches_fast_extractor(self):
+        for page in self.pages.values():
+            for chunk_size in (1, 7, 4096):
+                extractor = ug_scraper.DataContentExtractor()
+                for i in range(0, len(page), chunk_size):
+                    if extractor.feed(page[i:i+chunk_size]):
+                        break
+                self.assertEqual(ug_scraper.extract_data_content(page), extractor.get_data_content())
+                self.assertLess(extractor.get_bytes_read(), len(page))
+
+    def test_incremental_extractor_skips_other_tags(self):
+        extractor = ug_scraper.DataContentExtractor()
+        self.assertFalse(extractor.feed(b'<p class="js-store">x</p><div class="js-'))
+        self.assertFalse(extractor.feed(b'store" data-content="{&quot;a'))
+        self.assertTrue(extractor.feed(b'&quot;: 1}"></div>'))
+        self.assertEqual('{"a": 1}', extractor.get_data_content())
+
+    def test_streamed_fetch_stops_after_js_store(self):
+        url = "https://tabs.ultimate-guitar.com/tab/beach-weather/chit-chat-chords-2421111"
+        page = self.pages['chit_chat'] + b'<!-- footer -->' * 10000
+        with replaying({url: page}, samples=False, cache=None):
+            before = ug_scraper.get_download_stats()
+            data = ug_scraper.json_from_url(url)
+            after = ug_scraper.get_download_stats()
+        self.assertEqual(ug_parser.slim(ug_scraper.json.loads(ug_scraper.extract_data_content(page))), data)
+        self.assertEqual(1, after["pages"] - before["pages"])
+        self.assertEqual(len(page), (after["bytes_read"] - before["bytes_read"]) + (after["bytes_saved"] - before["bytes_saved"]))
+        self.assertGreater(after["bytes_saved"] - before["bytes_saved"], 100000)
+
+
+class TestCache(unittest.TestCase):
+    """
+    Tests for the page cache of cache.py
+    """
+    def setUp(self):
+        self.url = "https://tabs.ultimate-guitar.com/tab/beach-weather/chit-chat-chords-2421111"
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_urls_are_normalized(self):
+        self.assertEqual(
+            ug_cache.normalize_url("https://www.ultimate-guitar.com/search.php?value=a&search_type=title"),
+            ug_cache.normalize_url("HTTPS://WWW.ultimate-guitar.com/search.php?search_type=title&value=a#top"),
+        )
+        self.assertEqual("tab", ug_cache.url_kind(self.url))
+        self.assertEqual("search", ug_cache.url_kind(ug_scraper.SAMPLE_SEARCH))
+        self.assertEqual("explore", ug_cache.url_kind("https://www.ultimate-guitar.com/explore?order=date_desc"))
+
+    def test_lru_evicts_by_entries_and_bytes(self):
+        lru = ug_cache.LRUCache(max_entries=2, max_bytes=100)
+        lru.put("a", {}, 10)
+        lru.put("b", {}, 10)
+        lru.get("a")
+        lru.put("c", {}, 10)
+        self.assertIsNone(lru.get("b"))
+        self.assertIsNotNone(lru.get("a"))
+        lru.put("d", {}, 95)
+        self.assertEqual(1, len(lru))
+        self.assertEqual(95, lru.get_nbytes())
+
+    def test_expired_entries_are_misses(self):
+        cache = ug_cache.UGCache(ttls={"tab": -1})
+        cache.put(self.url, {"a": 1}, 10)
+        self.assertIsNone(cache.get(self.url))
+        cache.put(ug_scraper.SAMPLE_SEARCH, {"a": 1}, 10)
+        self.assertEqual({"a": 1}, cache.get(ug_scraper.SAMPLE_SEARCH))
+        self.assertEqual(1, cache.get_stats()["memory_hits"])
+        self.assertEqual(1, cache.get_stats()["misses"])
+
+    def test_disk_cache_persists(self):
+        ug_cache.UGCache(disk=ug_cache.DiskCache(self.tmp.name)).put(self.url, {"a": 1}, 10)
+        cache = ug_cache.UGCache(disk=ug_cache.DiskCache(self.tmp.name))
+        self.assertEqual({"a": 1}, cache.get(self.url))
+        self.assertEqual({"a": 1}, cache.get(self.url))
+        self.assertEqual(1, cache.get_stats()["disk_hits"])
+        self.assertEqual(1, cache.get_stats()["memory_hits"])
+
+    def test_disk_cache_evicts_oldest(self):
+        disk = ug_cache.DiskCache(self.tmp.name, max_bytes=150)
+        disk.put("a", {"x": "a" * 50})
+        ug_cache.os.utime(disk._file_path("a"), (0, 0))
+        disk.put("b", {"x": "b" * 50})
+        self.assertIsNone(disk.get("a"))
+        self.assertIsNotNone(disk.get("b"))
+        self.assertLessEqual(disk.get_nbytes(), 150)
+
+    def test_disk_cache_evicts_down_to_the_low_water_mark(self):
+        disk = ug_cache.DiskCache(self.tmp.name, max_bytes=500, low_water=0.5)
+        for i, key in enumerate("abcd"):
+            disk.put(key, {"x": key * 50})
+            ug_cache.os.utime(disk._file_path(key), (i, i))
+        disk.put("e", {"x": "e" * 50})
+        # evicted to 250 bytes, so the next put fits without scanning the files again
+        self.assertEqual(["d", "e"], [key for key in "abcde" if disk.get(key) is not None])
+        with mock.patch.object(disk, "_evict") as evict:
+            disk.put("f", {"x": "f" * 50})
+        evict.assert_not_called()
+
+    def test_disk_cache_put_is_best_effort(self):
+        disk = ug_cache.DiskCache(self.tmp.name)
+        with mock.patch.object(ug_cache.os, "replace", side_effect=OSError("No space left on device")):
+            self.assertEqual(0, disk.put("a", {"x": 1}))
+        self.assertEqual([], ug_cache.os.listdir(self.tmp.name))
+        self.assertEqual(0, disk.get_nbytes())
+
+    def test_malformed_disk_entries_are_misses(self):
+        disk = ug_cache.DiskCache(self.tmp.name)
+        for content in ('{"url": "a"}', '[1, 2]', '{"url": "a", "stored'):
+            with open(disk._file_path("a"), 'w') as f:
+                f.write(content)
+            self.assertIsNone(disk.get("a"))
+
+    def test_json_from_url_uses_the_cache(self):
+        cache = ug_cache.UGCache()
+        cache.put(self.url, {"a": 1}, 10)
+        with scraper_settings(cache=cache):
+            self.assertEqual({"a": 1}, ug_scraper.json_from_url(self.url))
+
+
+class TestSingleFlight(unittest.TestCase):
+    """
+    Tests for the request coalescing of concurrency.py
+    """
+    def setUp(self):
+        self.calls = 0
+
+    def slow(self, value):
+        self.calls += 1
+        time.sleep(0.05)
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def run_threads(self, flight, value, n=5):
+        results = []
+        def call():
+            try:
+                results.append(flight.do("key", self.slow, value))
+            except Exception as e:
+                results.append(e)
+        threads = [threading.Thread(target=call) for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_concurrent_calls_share_one_call(self):
+        flight = ug_concurrency.SingleFlight()
+        results = self.run_threads(flight, {"a": 1})
+        self.assertEqual(1, self.calls)
+        self.assertEqual([{"a": 1}] * 5, results)
+        self.assertEqual(0, flight.in_flight())
+
+    def test_errors_are_raised_to_every_caller(self):
+        error = ValueError("failed")
+        results = self.run_threads(ug_concurrency.SingleFlight(), error)
+        self.assertEqual(1, self.calls)
+        self.assertEqual([error] * 5, results)
+
+    def test_async_calls_share_one_call(self):
+        async def slow(value):
+            self.calls += 1
+            await asyncio.sleep(0.01)
+            return value
+        async def main():
+            flight = ug_concurrency.AsyncSingleFlight()
+            results = await asyncio.gather(*[flight.do("key", slow, 1) for _ in range(5)])
+            return results, flight.in_flight()
+        self.assertEqual(([1] * 5, 0), asyncio.run(main()))
+        self.assertEqual(1, self.calls)
+
+    def test_async_json_from_url_shares_one_fetch(self):
+        url = "https://tabs.ultimate-guitar.com/tab/beach-weather/chit-chat-chords-2421111"
+        async def main():
+            return await asyncio.gather(*[ug_scraper.async_json_from_url(url) for _ in range(5)])
+        with scraper_settings(cache=None), \
+                mock.patch.object(ug_scraper, "_fetch_json", side_effect=lambda url, cache, breaker: self.slow({"a": 1})):
+            self.assertEqual([{"a": 1}] * 5, asyncio.run(main()))
+        self.assertEqual(1, self.calls)
+
+
+class TestScheduler(unittest.TestCase):
+    """
+    Tests for the fetch scheduler of concurrency.py
+    """
+    def start(self, func, *args):
+        thread = threading.Thread(target=func, args=args)
+        thread.start()
+        self.addCleanup(thread.join)
+        return thread
+
+    def wait_for_queued(self, scheduler, level, n):
+        name = "queued_interactive" if level == ug_concurrency.INTERACTIVE else "queued_background"
+        while scheduler.get_stats()[name] < n:
+            time.sleep(0.001)
+
+    def test_async_fetches_past_the_capacity_are_rejected(self):
+        scheduler = ug_concurrency.FetchScheduler(max_concurrent=1, rate=1000, burst=100, max_queued={ug_concurrency.INTERACTIVE: 2, ug_concurrency.BACKGROUND: 0})
+        urls = [f"https://tabs.ultimate-guitar.com/tab/a/s-chords-{i}" for i in range(8)]
+        cached = "https://tabs.ultimate-guitar.com/tab/a/cached-chords-1"
+        cache = ug_cache.UGCache()
+        cache.put(cached, {"a": 1}, 10)
+
+        async def main():
+            fetches = [asyncio.ensure_future(ug_scraper.async_json_from_url(url)) for url in urls]
+            await asyncio.sleep(0.05)
+            start = time.monotonic()
+            data = await ug_scraper.async_json_from_url(cached)
+            return data, time.monotonic() - start, await asyncio.gather(*fetches, return_exceptions=True)
+
+        # fewer worker threads than the scheduler's capacity, which it adds to
+        with ug_scraper.pooled_session(max_workers=2), replaying(samples=False, latency=0.2, cache=cache, scheduler=scheduler):
+            data, waited, results = asyncio.run(main())
+        self.assertEqual({"a": 1}, data)
+        self.assertLess(waited, 0.1)
+        # one running and two waiting, the rest are rejected instead of waiting for a thread
+        self.assertEqual(3, sum(type(r) is ug_scraper.requests.HTTPError for r in results))
+        self.assertEqual(5, sum(type(r) is ug_concurrency.QueueFullError for r in results))
+
+    def test_concurrent_fetches_are_capped(self):
+        scheduler = ug_concurrency.FetchScheduler(max_concurrent=2, rate=1000, burst=100)
+        running = []
+        peak = []
+        lock = threading.Lock()
+        def fetch():
+            with scheduler.slot("host"):
+                with lock:
+                    running.append(1)
+                    peak.append(len(running))
+                time.sleep(0.02)
+                with lock:
+                    running.pop()
+        threads = [self.start(fetch) for _ in range(6)]
+        for t in threads:
+            t.join()
+        self.assertEqual(2, max(peak))
+        self.assertEqual(0, scheduler.get_stats()["running"])
+
+    def test_interactive_fetches_start_first(self):
+        scheduler = ug_concurrency.FetchScheduler(max_concurrent=1, rate=1000, burst=100)
+        order = []
+        def fetch(level, name):
+            with ug_concurrency.priority(level):
+                with scheduler.slot("host"):
+                    order.append(name)
+        scheduler.acquire("host")
+        self.start(fetch, ug_concurrency.BACKGROUND, "background")
+        self.wait_for_queued(scheduler, ug_concurrency.BACKGROUND, 1)
+        self.start(fetch, ug_concurrency.INTERACTIVE, "interactive")
+        self.wait_for_queued(scheduler, ug_concurrency.INTERACTIVE, 1)
+        scheduler.release()
+        while len(order) < 2:
+            time.sleep(0.001)
+        self.assertEqual(["interactive", "background"], order)
+
+    def test_full_queue_rejects(self):
+        scheduler = ug_concurrency.FetchScheduler(max_concurrent=1, max_queued={ug_concurrency.INTERACTIVE: 1})
+        scheduler.acquire("host")
+        self.start(scheduler.acquire, "host")
+        self.wait_for_queued(scheduler, ug_concurrency.INTERACTIVE, 1)
+        self.assertRaises(ug_concurrency.QueueFullError, scheduler.acquire, "host")
+        self.assertEqual(1, scheduler.get_stats()["rejected"])
+        # background fetches have their own queue
+        with ug_concurrency.priority(ug_concurrency.BACKGROUND):
+            self.assertEqual(ug_concurrency.BACKGROUND, ug_concurrency.get_priority())
+        self.assertEqual(ug_concurrency.INTERACTIVE, ug_concurrency.get_priority())
+        scheduler.release()
+        scheduler.release()
+
+    def test_token_bucket_limits_the_rate(self):
+        bucket = ug_concurrency.TokenBucket(rate=10, burst=2)
+        self.assertEqual(0.0, bucket.reserve())
+        self.assertEqual(0.0, bucket.reserve())
+        self.assertAlmostEqual(0.1, bucket.reserve(), delta=0.01)
+        self.assertAlmostEqual(0.2, bucket.reserve(), delta=0.01)
+
+
+class TestRetry(unittest.TestCase):
+    """
+    Tests for the retries and circuit breakers of scraper.py and concurrency.py
+    """
+    def setUp(self):
+        self.url = "https://tabs.ultimate-guitar.com/tab/beach-weather/chit-chat-chords-2421111"
+        self.stack = contextlib.ExitStack()
+        self.path = self.stack.enter_context(tempfile.TemporaryDirectory())
+        ug_scraper.set_retry_policy(ug_concurrency.RetryPolicy(max_attempts=3, base_delay=0))
+        ug_scraper.set_circuit_breakers(failure_threshold=3, reset_timeout=60)
+        self.cache = ug_cache.UGCache(ttls={"tab": 0})
+        self.stack.callback(ug_scraper.set_retry_policy, ug_concurrency.RetryPolicy())
+        self.stack.callback(ug_scraper.set_circuit_breakers)
+        # not rate limited, which would wait between the attempts too
+        self.stack.enter_context(scraper_settings(cache=self.cache, scheduler=None))
+
+    def tearDown(self):
+        self.stack.close()
+
+    def replay(self, status: int, headers: dict = None):
+        ug_fixtures.save_page(self.url, b'<html>Service Unavailable</html>', self.path, status, headers)
+        return self.stack.enter_context(ug_fixtures.replay(self.path))
+
+    def test_transient_errors_are_retried(self):
+        adapter = self.replay(503)
+        self.assertRaises(ug_scraper.requests.HTTPError, ug_scraper.json_from_url, self.url)
+        self.assertEqual(3, adapter.get_requests())
+
+    def test_not_found_is_not_retried(self):
+        adapter = self.replay(404)
+        self.assertRaises(ug_scraper.requests.HTTPError, ug_scraper.json_from_url, self.url)
+        self.assertEqual(1, adapter.get_requests())
+        self.assertEqual("closed", ug_scraper.get_circuit_states()["tabs.ultimate-guitar.com"])
+
+    def test_retry_after_is_honoured(self):
+        self.replay(429, {"Retry-After": "7"})
+        with mock.patch.object(ug_scraper.time, "sleep") as sleep:
+            self.assertRaises(ug_scraper.requests.HTTPError, ug_scraper.json_from_url, self.url)
+        sleep.assert_called_with(7.0)
+
+    def test_open_circuit_fails_fast(self):
+        adapter = self.replay(503)
+        # each fetch is retried 3 times, and counts once towards the threshold of 3
+        for _ in range(2):
+            self.assertRaises(ug_scraper.requests.HTTPError, ug_scraper.json_from_url, self.url)
+        self.assertEqual("closed", ug_scraper.get_circuit_states()["tabs.ultimate-guitar.com"])
+        self.assertRaises(ug_scraper.requests.HTTPError, ug_scraper.json_from_url, self.url)
+        self.assertEqual("open", ug_scraper.get_circuit_states()["tabs.ultimate-guitar.com"])
+        self.assertRaises(ug_concurrency.CircuitOpenError, ug_scraper.json_from_url, self.url)
+        self.assertEqual(9, adapter.get_requests())
+
+    def test_open_circuit_stops_the_retries(self):
+        adapter = self.replay(503)
+        breaker = ug_scraper._get_breaker("tabs.ultimate-guitar.com")
+
+        def open_breaker(delay):
+            # other fetches give up while this one waits to retry
+            for _ in range(3):
+                breaker.record_failure()
+
+        with mock.patch.object(ug_scraper.time, "sleep", side_effect=open_breaker):
+            self.assertRaises(ug_scraper.requests.HTTPError, ug_scraper.json_from_url, self.url)
+        self.assertEqual(2, adapter.get_requests())
+
+    def test_open_circuit_serves_stale_pages(self):
+        self.cache.put(self.url, {"a": 1}, 10)
+        self.replay(503)
+        self.assertEqual({"a": 1}, ug_scraper.json_from_url(self.url))
+        self.assertEqual({"a": 1}, ug_scraper.json_from_url(self.url))
+        self.assertEqual(2, self.cache.get_stats()["stale_hits"])
+
+    def test_backoff_is_jittered_and_capped(self):
+        policy = ug_concurrency.RetryPolicy(max_attempts=10, base_delay=1, max_delay=4, max_retry_after=5)
+        delays = [policy.get_delay(3) for _ in range(100)]
+        self.assertTrue(all(0 <= d <= 4 for d in delays))
+        self.assertGreater(len(set(delays)), 1)
+        self.assertEqual(2, policy.get_delay(0, retry_after=2))
+        self.assertIsNone(policy.get_delay(0, retry_after=60))
+        self.assertIsNone(policy.get_delay(9))
+
+    def test_breaker_half_opens_after_the_timeout(self):
+        breaker = ug_concurrency.CircuitBreaker("host", failure_threshold=1, reset_timeout=0.01)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        time.sleep(0.02)
+        self.assertTrue(breaker.allow())
+        self.assertEqual("half-open", breaker.get_state())
+        # only one trial at a time
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual("closed", breaker.get_state())
+
+
+def _exit_in_worker(pid: int) -> str:
+    """Kills the worker it runs on, or returns if it runs in the process with the pid."""
+    if os.getpid() != pid:
+        os._exit(1)
+    return "in-process"
+
+class TestParsePool(unittest.TestCase):
+    """
+    Tests for the parse worker processes of concurrency.py and scraper.py
+    """
+    def setUp(self):
+        self.pool = ug_concurrency.ParsePool(workers=2, max_pending=2, context='fork')
+        self.addCleanup(self.pool.shutdown)
+
+    def test_calls_run_on_workers(self):
+        self.assertNotEqual(os.getpid(), self.pool.run(os.getpid))
+        self.assertEqual(1, self.pool.get_stats()["offloaded"])
+
+    def test_falls_back_when_too_many_are_pending(self):
+        for _ in range(2):
+            self.pool._pending.acquire()
+        self.assertEqual(os.getpid(), self.pool.run(os.getpid))
+        self.assertEqual(1, self.pool.get_stats()["fallbacks"])
+
+    def test_falls_back_and_restarts_when_a_worker_dies(self):
+        pool = ug_concurrency.ParsePool(workers=1, context='spawn')
+        self.addCleanup(pool.shutdown)
+        self.assertEqual("in-process", pool.run(_exit_in_worker, os.getpid()))
+        self.assertEqual(1, pool.get_stats()["restarts"])
+        self.assertNotEqual(os.getpid(), pool.run(os.getpid))
+
+    def test_forked_workers_are_not_restarted_from_threads(self):
+        stop = threading.Event()
+        thread = threading.Thread(target=stop.wait)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(stop.set)
+        self.assertEqual("in-process", self.pool.run(_exit_in_worker, os.getpid()))
+        self.assertEqual(0, self.pool.get_stats()["restarts"])
+        self.assertEqual(os.getpid(), self.pool.run(os.getpid))
+        self.assertEqual(2, self.pool.get_stats()["fallbacks"])
+
+    def test_fetched_pages_are_parsed_on_workers(self):
+        url = "https://tabs.ultimate-guitar.com/tab/beach-weather/chit-chat-chords-2421111"
+        page = ug_fixtures.load_sample_pages()['chit_chat']
+        with replaying({url: page}, samples=False, cache=None):
+            expected = ug_scraper.json_from_url(url)
+            with scraper_settings(parse_pool=self.pool):
+                self.assertEqual(expected, ug_scraper.json_from_url(url))
+        self.assertEqual(1, self.pool.get_stats()["offloaded"])
+
+    def test_pages_without_a_streamed_attribute_are_extracted_on_workers(self):
+        page = b"<body><div data-content='{\"a\": 1}' class='js-store'></div></body>"
+        self.assertEqual({"a": 1}, self.pool.run(ug_scraper._decode_page, page, False, False))
+
+
+class TestSessions(unittest.TestCase):
+    """
+    Tests for the result browser sessions of sessions.py
+    """
+    def browser(self, pages: int = 3) -> ug_sessions.ResultsBrowser:
+        return ug_sessions.ResultsBrowser("search", list(range(pages)), [f"embed {i}" for i in range(pages)])
+
+    def test_custom_ids_round_trip(self):
+        custom_id = ug_sessions.encode_custom_id("next", "3fa9c1d2e0b4")
+        self.assertEqual(("next", "3fa9c1d2e0b4"), ug_sessions.decode_custom_id(custom_id))
+        self.assertLessEqual(len(custom_id), 100)
+        self.assertIsNone(ug_sessions.decode_custom_id("nm display"))
+        self.assertIsNone(ug_sessions.decode_custom_id("next:"))
+
+    def test_browser_pages_within_the_results(self):
+        browser = self.browser()
+        self.assertTrue(browser.is_first_page())
+        self.assertEqual(0, browser.turn(-1))
+        self.assertEqual(2, browser.turn(5))
+        self.assertTrue(browser.is_last_page())
+        self.assertEqual("embed 2", browser.get_embed())
+        browser.set_results([7], ["embed 7"])
+        self.assertEqual((7, True, True), (browser.get_result(), browser.is_first_page(), browser.is_last_page()))
+
+    def test_browser_prefetches_the_shown_page(self):
+        prefetcher = mock.Mock()
+        browser = ug_sessions.ResultsBrowser("explore", [0, 1], ["a", "b"], prefetcher)
+        browser.turn(1)
+        self.assertEqual([mock.call(0), mock.call(1)], prefetcher.show.call_args_list)
+        browser.set_results([2], ["c"])
+        prefetcher.cancel.assert_called_once()
+
+    def test_tab_pager_pages_within_the_tab(self):
+        tab = mock.Mock()
+        tab.get_page_count.return_value = 3
+        pager = ug_sessions.TabPager("chords", tab)
+        self.assertEqual(0, pager.turn(-1))
+        self.assertEqual(2, pager.turn(5))
+        self.assertTrue(pager.is_last_page())
+        browser = self.browser()
+        self.assertIsNone(browser.get_tab_pager())
+        self.assertIs(tab, browser.show_tab(tab).get_tab())
+        browser.set_results([1], ["embed 1"])
+        self.assertIsNone(browser.get_tab_pager())
+
+    def test_tab_pager_transposes_with_the_keys_kept(self):
+        with open('sample/sample_json/chit_chat.json', 'r') as f:
+            tab = ug_parser.UGChords(ug_scraper.json.load(f))
+        keys_cache = ug_cache.KeysCache()
+        keys_cache.add(tab)
+        pager = ug_sessions.TabPager("chords", tab)
+        self.assertEqual(11, pager.transpose(-1))
+        self.assertEqual("C#                         A#m", tab.get_content().split('\n')[1])
+        self.assertEqual(1, pager.transpose(2))
+        self.assertEqual(0, pager.get_page())
+
+    def test_sessions_are_looked_up_by_id(self):
+        store = ug_sessions.SessionStore()
+        browser = self.browser()
+        session_id = store.add(browser)
+        self.assertIs(browser, store.get(session_id))
+        self.assertNotEqual(session_id, store.add(self.browser()))
+        self.assertIs(browser, store.pop(session_id))
+        self.assertIsNone(store.get(session_id))
+        self.assertEqual(1, store.get_stats()["misses"])
+
+    def test_least_recently_used_sessions_are_evicted(self):
+        evicted = []
+        store = ug_sessions.SessionStore(max_sessions=100, on_evict=evicted.append)
+        first = store.add("first")
+        store.add("second")
+        for i in range(98):
+            store.add(i)
+        store.get(first)
+        store.add("third")
+        self.assertEqual(["second"], evicted)
+        self.assertEqual("first", store.get(first))
+        # stays bounded under many open browsers
+        for i in range(10000):
+            store.add(i)
+        self.assertEqual(100, len(store))
+        self.assertEqual(10001, len(evicted))
+        self.assertEqual(10001, store.get_stats()["evicted"])
+
+    def test_unused_sessions_expire(self):
+        evicted = []
+        store = ug_sessions.SessionStore(ttl=0, on_evict=evicted.append)
+        session_id = store.add("a")
+        self.assertIsNone(store.get(session_id))
+        self.assertEqual((["a"], 0), (evicted, len(store)))
+        self.assertEqual(1, store.get_stats()["expired"])
+
+
+class TestExploreRefresher(unittest.TestCase):
+    """
+    Tests for the explore refresher of prefetch.py
+    """
+    def setUp(self):
+        with open('sample/sample_json/chit_chat_search.json', 'r') as f:
+            result = ug_scraper.json.load(f)['store']['page']['data']['results'][0]
+        self.tab_url = result['tab_url']
+        missing = dict(result, id=1, votes=1, tab_url="https://tabs.ultimate-guitar.com/tab/a/missing-chords-1")
+        explore = {"store": {"page": {"data": {"data": {"tabs": [result, missing]}}}}}
+
+        pages = {ug_scraper.explore_url(option): ug_fixtures.page_from_json(explore) for option in ug_scraper.EXPLORE_OPTIONS.values()}
+        self.stack = contextlib.ExitStack()
+        self.adapter = self.stack.enter_context(replaying(pages, cache=ug_cache.UGCache()))
+
+    def tearDown(self):
+        self.stack.close()
+
+    def test_listings_and_top_tabs_are_served_from_memory(self):
+        refresher = ug_prefetch.ExploreRefresher(top=2)
+        self.assertIsNone(refresher.get_explore("date_desc"))
+        asyncio.run(refresher.refresh())
+        requests = self.adapter.get_requests()
+        # the four listings, the tab, and the missing tab
+        self.assertEqual(6, requests)
+
+        for option in ug_scraper.EXPLORE_OPTIONS.values():
+            results = refresher.get_explore(option).get_results(2)
+            self.assertEqual(self.tab_url, results[0].get_tab_url())
+        self.assertEqual("Chit Chat", refresher.get_tab(self.tab_url).get_song())
+        self.assertIsNone(refresher.get_tab(results[1].get_tab_url()))
+        self.assertEqual(requests, self.adapter.get_requests())
+
+    def test_cached_pages_are_fetched_again(self):
+        refresher = ug_prefetch.ExploreRefresher(top=2)
+        asyncio.run(refresher.refresh())
+        asyncio.run(refresher.refresh())
+        self.assertEqual(12, self.adapter.get_requests())
+
+    def test_expired_pages_are_not_served_as_fresh(self):
+        refresher = ug_prefetch.ExploreRefresher(top=2, max_age=60)
+        asyncio.run(refresher.refresh())
+        # the listings were fetched an hour ago, and ultimate-guitar is down since
+        memory = ug_scraper.get_cache()._memory
+        for option in ug_scraper.EXPLORE_OPTIONS.values():
+            key = ug_cache.normalize_url(ug_scraper.explore_url(option))
+            stored_at, data = memory.get(key)
+            memory.put(key, data, 100, stored_at - 60 * 60)
+        with mock.patch.object(ug_scraper, "_fetch_json", side_effect=ug_scraper.requests.ConnectionError()):
+            asyncio.run(refresher.refresh())
+        self.assertIsNone(refresher.get_explore("date_desc"))
+        self.assertEqual("Chit Chat", refresher.get_tab(self.tab_url).get_song())
+
+    def test_old_listings_are_not_served(self):
+        refresher = ug_prefetch.ExploreRefresher(max_age=0)
+        asyncio.run(refresher.refresh())
+        time.sleep(0.01)
+        self.assertIsNone(refresher.get_explore("date_desc"))
+        self.assertIsNone(refresher.get_tab(self.tab_url))
+
+
+class TestPrefetcher(unittest.TestCase):
+    """
+    Tests for the speculative prefetches of prefetch.py
+    """
+    def setUp(self):
+        self.urls = [
+            "https://tabs.ultimate-guitar.com/tab/beach-weather/chit-chat-chords-2421111",
+            "https://tabs.ultimate-guitar.com/tab/echosmith/bright-chords-1442936",
+            "https://tabs.ultimate-guitar.com/tab/a/missing-chords-1",
+        ]
+        self.stack = contextlib.ExitStack()
+
+    def tearDown(self):
+        self.stack.close()
+
+    def test_shown_result_and_neighbours_are_prefetched(self):
+        adapter = self.stack.enter_context(replaying(cache=None))
+        async def main():
+            prefetcher = ug_prefetch.Prefetcher(self.urls, budget=2)
+            prefetcher.show(0)
+            prefetcher.show(1)
+            tab = await prefetcher.get(1)
+            await prefetcher.get(0)
+            return tab, adapter.get_requests(), prefetcher
+        tab, requests, prefetcher = asyncio.run(main())
+        self.assertEqual("Bright", tab.get_song())
+        # the budget was spent on the first two results
+        self.assertEqual(2, requests)
+        self.assertRaises(ug_scraper.requests.HTTPError, asyncio.run, prefetcher.get(2))
+
+    def test_chosen_prefetch_is_not_left_behind_interactive_fetches(self):
+        scheduler = ug_concurrency.FetchScheduler(max_concurrent=1, rate=1000, burst=100)
+        others = [f"https://tabs.ultimate-guitar.com/tab/a/other-chords-{i}" for i in range(5)]
+        self.stack.enter_context(replaying(latency=0.1, cache=None, scheduler=scheduler))
+        finished = []
+
+        async def wait_for(stat, n):
+            while scheduler.get_stats()[stat] < n:
+                await asyncio.sleep(0.001)
+
+        async def fetch(url):
+            with contextlib.suppress(ug_scraper.requests.HTTPError):
+                await ug_scraper.async_json_from_url(url)
+            finished.append(url)
+
+        async def main():
+            fetches = [asyncio.ensure_future(fetch(others[0]))]
+            await wait_for("running", 1)
+            prefetcher = ug_prefetch.Prefetcher(self.urls, budget=1)
+            prefetcher.show(0)
+            await wait_for("queued_background", 1)
+            fetches += [asyncio.ensure_future(fetch(url)) for url in others[1:]]
+            await wait_for("queued_interactive", 4)
+            # the user chooses the result, whose prefetch waits behind the interactive fetches
+            tab = await prefetcher.get(0)
+            finished.append("chosen")
+            await asyncio.gather(*fetches)
+            return tab
+
+        self.assertEqual("Chit Chat", asyncio.run(main()).get_song())
+        self.assertEqual([others[0], "chosen"], finished[:2])
+        self.assertEqual(1, scheduler.get_stats()["promoted"])
+
+    def test_cancelled_prefetches_are_fetched_again(self):
+        self.stack.enter_context(replaying(latency=0.05, cache=None))
+        async def main():
+            prefetcher = ug_prefetch.Prefetcher(self.urls)
+            prefetcher.show(0)
+            prefetcher.cancel()
+            return await prefetcher.get(0)
+        self.assertEqual("Chit Chat", asyncio.run(main()).get_song())
+
+
+class TestHedged(unittest.TestCase):
+    """
+    Tests for the hedged calls of concurrency.py and prefetch.py
+    """
+    def call(self, delay, value):
+        async def call():
+            await asyncio.sleep(delay)
+            if isinstance(value, Exception):
+                raise value
+            return value
+        return call
+
+    def hedged(self, *calls):
+        return asyncio.run(ug_concurrency.hedged(list(calls), hedge_after=0.02, accept_after=0.05))
+
+    def test_first_call_is_preferred(self):
+        self.assertEqual("a", self.hedged(self.call(0, "a"), self.call(0, "b")))
+        # the second call arrives first, but the first is still worth waiting for
+        self.assertEqual("a", self.hedged(self.call(0.04, "a"), self.call(0, "b")))
+
+    def test_slow_or_failed_first_call_is_hedged(self):
+        self.assertEqual("b", self.hedged(self.call(1, "a"), self.call(0, "b")))
+        self.assertEqual("b", self.hedged(self.call(0, ValueError("a")), self.call(0, "b")))
+
+    def test_first_error_is_raised(self):
+        error = ValueError("a")
+        with self.assertRaises(ValueError) as raised:
+            self.hedged(self.call(0, error), self.call(0, ValueError("b")))
+        self.assertIs(error, raised.exception)
+
+    def test_fetch_top_tab_hedges_a_slow_tab(self):
+        urls = [
+            "https://tabs.ultimate-guitar.com/tab/beach-weather/chit-chat-chords-2421111",
+            "https://tabs.ultimate-guitar.com/tab/echosmith/bright-chords-1442936",
+        ]
+        results = [ug_parser.UGSearchResult(dict(_raw_result(i, "Chords", 10 - i), tab_url=url)) for i, url in enumerate(urls)]
+        with replaying(latency=lambda url: 0.5 if url == urls[0] else 0, cache=None):
+            tab = asyncio.run(ug_prefetch.fetch_top_tab(results, ug_parser.UGChords, hedge_after=0.02, accept_after=0.1))
+            self.assertEqual("Bright", tab.get_song())
+            self.assertRaises(IndexError, asyncio.run, ug_prefetch.fetch_top_tab([]))
+
+
+class TestSearchIndex(unittest.TestCase):
+    """
+    Tests for the local search index of index.py
+    """
+    def setUp(self):
+        with open('sample/sample_json/chit_chat_search.json', 'r') as f:
+            self.search = ug_scraper.json.load(f)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = self.tmp.name + '/search.index'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_words_are_folded(self):
+        self.assertEqual(["beyonce", "s", "cafe", "tacuba"], ug_index.tokenize("Beyoncé's  CAFÉ-Tacuba"))
+
+    def test_searches_made_before_are_answered(self):
+        index = ug_index.SearchIndex()
+        self.assertIsNone(index.lookup("beach weather", "chit chat"))
+        index.add_page(ug_scraper.SAMPLE_SEARCH, self.search)
+        data = index.lookup("Béach WEATHER", " chit  chat")
+        self.assertEqual("Chit Chat", ug_parser.UGSearch(data).get_chords_results(1)[0].get_song())
+        # known tabs, but not a search made before
+        self.assertIsNone(index.lookup("beach weather", "chit"))
+        self.assertEqual(1, len(index.query("chit")))
+        self.assertEqual({"tabs": 1, "words": 4, "searches": 1, "hits": 1, "misses": 2}, index.get_stats())
+
+    def test_changed_tabs_are_reindexed(self):
+        index = ug_index.SearchIndex()
+        index.add_results([_raw_result(1, "Chords", 10)])
+        index.add_results([dict(_raw_result(1, "Chords", 20), song_name="Other")])
+        self.assertEqual([], index.query("song"))
+        self.assertEqual(20, index.query("other")[0]["votes"])
+
+    def test_least_recently_seen_tabs_are_dropped(self):
+        index = ug_index.SearchIndex(max_entries=2)
+        index.add_results([_raw_result(1, "Chords", 10), _raw_result(2, "Chords", 10)])
+        # seen again, so the second tab is dropped instead
+        index.add_results([_raw_result(1, "Chords", 10), dict(_raw_result(3, "Chords", 10), song_name="Other")])
+        self.assertEqual(2, len(index))
+        self.assertEqual([1], [tab["id"] for tab in index.query("song")])
+        self.assertEqual({"artist", "song", "1", "other"}, set(index._postings))
+
+    def test_old_searches_are_dropped(self):
+        index = ug_index.SearchIndex(self.path, max_age=60)
+        index._searched[("old", "search")] = time.time() - 120
+        index.add_page(ug_scraper.SAMPLE_SEARCH, self.search)
+        self.assertEqual(1, index.get_stats()["searches"])
+        index.save()
+        self.assertEqual(1, ug_index.SearchIndex(self.path).get_stats()["searches"])
+
+    def test_index_is_persisted(self):
+        index = ug_index.SearchIndex(self.path)
+        index.add_page(ug_scraper.SAMPLE_SEARCH, self.search)
+        index.save()
+        loaded = ug_index.SearchIndex(self.path)
+        self.assertEqual(1, len(loaded))
+        self.assertIsNotNone(loaded.lookup("beach weather", "chit chat"))
+
+    def test_index_is_saved_in_the_background(self):
+        index = ug_index.SearchIndex(self.path, save_interval=0.01)
+        index.add_page(ug_scraper.SAMPLE_SEARCH, self.search)
+        # not written by the fetch which added the page
+        self.assertFalse(os.path.exists(self.path))
+        index.start()
+        try:
+            for _ in range(200):
+                if os.path.exists(self.path):
+                    break
+                time.sleep(0.01)
+        finally:
+            index.stop()
+        self.assertEqual(1, len(ug_index.SearchIndex(self.path)))
+
+    def test_json_from_search_is_answered_from_the_index(self):
+        with replaying(cache=None, search_index=ug_index.SearchIndex()) as adapter:
+            first = ug_scraper.json_from_search("beach weather", "chit chat")
+            second = asyncio.run(ug_scraper.async_json_from_search("Beach Weather", "Chit Chat"))
+            self.assertEqual(1, adapter.get_requests())
+        self.assertEqual(first['store']['page']['data']['results'], second['store']['page']['data']['results'])
 
-import ug_parser
 
 class TestParser(unittest.TestCase):
     """
@@ -91,5 +1061,423 @@ class TestParser(unittest.TestCase):
         self.assertEqual(sample_content, self.tab.get_content())
 
 
+class TestRecords(unittest.TestCase):
+    """
+    Tests for the slot-based objects of parser.py
+    """
+    def setUp(self):
+        with open('sample/sample_json/chit_chat.json', 'r') as f:
+            self.data = ug_scraper.json.load(f)
+
+    def test_objects_have_no_dict(self):
+        objects = [
+            ug_parser.UGTab(self.data),
+            ug_parser.UGChords(self.data),
+            ug_parser.UGSearchResult(self.data['store']['page']['data']['tab']),
+            ug_parser.UGArtist(self.data['store']['page']['data']['tab']),
+        ]
+        for o in objects:
+            self.assertFalse(hasattr(o, '__dict__'))
+
+    def test_objects_pickle(self):
+        chords = ug_parser.UGChords(self.data)
+        chords.transpose(2)
+        copy = pickle.loads(pickle.dumps(chords))
+        self.assertEqual(chords.get_content(), copy.get_content())
+        self.assertEqual(chords.get_formatted_metadata(), copy.get_formatted_metadata())
+
+        result = ug_parser.UGSearchResult(self.data['store']['page']['data']['tab'])
+        copy = pickle.loads(pickle.dumps(result))
+        self.assertEqual(result.get_formatted_result_description(), copy.get_formatted_result_description())
+
+    def test_chords_content_is_lazy(self):
+        chords = ug_parser.UGChords(self.data)
+        self.assertIsNone(chords._content)
+        with open('sample/chit_chat.txt', 'r') as f:
+            self.assertEqual(f.read(), chords.get_content())
+
+    def test_slim_data_parses_the_same(self):
+        with open('sample/sample_json/chit_chat_search.json', 'r') as f:
+            search_data = ug_scraper.json.load(f)
+        explore_data = {"store": {"page": {"data": {"data": {"tabs": search_data['store']['page']['data']['results']}}}}}
+        pages = [
+            (ug_parser.UGTab, self.data),
+            (ug_parser.UGChords, self.data),
+            (ug_parser.UGSearch, search_data),
+            (ug_parser.UGExplore, explore_data),
+        ]
+        for cls, data in pages:
+            full, slim = cls(data), cls(ug_parser.slim(data))
+            self.assertEqual(pickle.dumps(full), pickle.dumps(slim))
+
+    def test_slim_data_drops_the_store(self):
+        slim = ug_parser.slim(self.data)
+        self.assertEqual(['store'], list(slim))
+        self.assertEqual(['page'], list(slim['store']))
+        self.assertEqual(['tab', 'tab_view'], list(slim['store']['page']['data']))
+        self.assertEqual(['meta', 'wiki_tab'], list(slim['store']['page']['data']['tab_view']))
+        self.assertLess(len(ug_scraper.json.dumps(slim)), len(ug_scraper.json.dumps(self.data)) / 5)
+        self.assertEqual({"a": 1}, ug_parser.slim({"a": 1}))
+
+
+def _search_data(results: "list[dict]") -> dict:
+    """Wraps the raw results in the JSON of a search page."""
+    return {"store": {"page": {"data": {"results": results}}}}
+
+def _raw_result(i: int, type: str, votes: int, rating: float = 4.5) -> dict:
+    return {
+        "id": i, "tab_url": f"https://tabs.ultimate-guitar.com/tab/a/s-{i}", "artist_name": "Artist",
+        "song_name": f"Song {i}", "type": type, "votes": votes, "rating": rating, "artist_url": "/artist/a",
+    }
+
+class TestSearch(unittest.TestCase):
+    """
+    Tests for the search results of parser.py
+    """
+    def setUp(self):
+        types = ["Chords", "Tabs", "Pro", "Chords"]
+        self.raw = [_raw_result(i, types[i % 4], (i * 7) % 13) for i in range(60)]
+        self.search = ug_parser.UGSearch(_search_data(self.raw))
+
+    def expected(self, types: "list[str]") -> "list[int]":
+        rs = [r for r in self.raw if r["type"] in types]
+        return [r["id"] for r in sorted(rs, reverse=True, key=lambda r: r["votes"])]
+
+    def test_results_are_ranked_by_votes(self):
+        ids = lambda results: [r.get_tab_id() for r in results]
+        self.assertEqual(self.expected(["Chords", "Tabs"])[:5], ids(self.search.get_results(5)))
+        self.assertEqual(self.expected(["Chords"])[:10], ids(self.search.get_chords_results(10)))
+        self.assertEqual(self.expected(["Tabs"]), ids(self.search.get_tabs_results(100)))
+
+    def test_results_paginate(self):
+        ids = lambda results: [r.get_tab_id() for r in results]
+        pages = [ids(self.search.get_results(3, start)) for start in range(0, 45, 3)]
+        self.assertEqual(self.expected(["Chords", "Tabs"]), sum(pages, []))
+
+    def test_other_types_are_skipped(self):
+        self.assertEqual(45, len(self.search.get_results(100)))
+        self.assertEqual(60, len(self.search.get_artists_results(100)))
+
+    def test_sample_search(self):
+        with open('sample/sample_json/chit_chat_search.json', 'r') as f:
+            search = ug_parser.UGSearch(ug_scraper.json.load(f))
+        self.assertEqual("https://tabs.ultimate-guitar.com/tab/beach-weather/chit-chat-chords-2421111", search.get_chords_results(1)[0].get_tab_url())
+        self.assertEqual([], search.get_tabs_results(1))
+
+
+class TestRank(unittest.TestCase):
+    """
+    Tests for the rankers of rank.py
+    """
+    def setUp(self):
+        # a perfect rating with a few votes, and a slightly lower one with many
+        self.raw = [_raw_result(0, "Chords", 3, 5.0), _raw_result(1, "Chords", 300, 4.8), _raw_result(2, "Chords", 0, 5.0)]
+
+    def test_votes_is_the_default(self):
+        search = ug_parser.UGSearch(_search_data(self.raw))
+        self.assertEqual("votes", search.get_ranker())
+        self.assertEqual([1, 0, 2], [r.get_tab_id() for r in search.get_chords_results(3)])
+        self.assertEqual(300, search.get_chords_results(1)[0].get_score())
+
+    def test_wilson_prefers_confidence(self):
+        search = ug_parser.UGSearch(_search_data(self.raw), "wilson")
+        self.assertEqual([1, 0, 2], [r.get_tab_id() for r in search.get_chords_results(3)])
+        self.assertEqual(0.0, search.get_chords_results(3)[2].get_score())
+
+    def test_wilson_bounds(self):
+        scores = ug_rank.score("wilson", [1, 10, 1000, 1000], [5.0, 5.0, 5.0, 1.0])
+        self.assertTrue(0 < scores[0] < scores[1] < scores[2] < 1)
+        self.assertAlmostEqual(0.0, scores[3])
+
+    def test_bayesian_pulls_to_the_mean(self):
+        scores = ug_rank.score("bayesian", [3, 300, 0], [5.0, 4.8, 5.0])
+        mean = (3 * 5.0 + 300 * 4.8) / 303
+        self.assertAlmostEqual(mean, scores[2])
+        self.assertTrue(mean < scores[0] < 5.0)
+        # the same rating with more votes is pulled less
+        low = ug_rank.score("bayesian", [1, 100, 1000], [2.0, 2.0, 4.0])
+        self.assertLess(low[1], low[0])
+        self.assertEqual([0.0], ug_rank.score("bayesian", [0], [0.0]))
+
+    def test_scores_are_computed_once(self):
+        search = ug_parser.UGSearch(_search_data(self.raw), "bayesian")
+        with mock.patch.object(ug_rank, "score") as score:
+            search.get_chords_results(1)
+            search.get_results(2, 1)
+        score.assert_not_called()
+
+    def test_long_lists_are_vectorized(self):
+        if ug_rank.numpy is None:
+            self.skipTest("numpy is not installed")
+        votes = [(i * 7) % 13 for i in range(ug_rank.VECTORIZE_MIN)]
+        ratings = [1 + (i % 9) / 2 for i in range(ug_rank.VECTORIZE_MIN)]
+        for ranker, (python_score, _) in ug_rank.RANKERS.items():
+            for vectorized, expected in zip(ug_rank.score(ranker, votes, ratings), python_score(votes, ratings)):
+                self.assertAlmostEqual(expected, vectorized)
+
+    def test_unknown_ranker(self):
+        with self.assertRaises(KeyError):
+            ug_parser.UGSearch(_search_data(self.raw), "stars")
+
+    def test_rankers_are_checked(self):
+        self.assertEqual("wilson", ug_rank.check_ranker("wilson"))
+        with self.assertRaisesRegex(ValueError, "CHORDS_RANKER is `wilsn`, it should be one of: votes, wilson, bayesian"):
+            ug_rank.check_ranker("wilsn", "CHORDS_RANKER")
+
+
+@unittest.skipIf(ug_embeds is None, "interactions is not installed")
+class TestEmbeds(unittest.TestCase):
+    """
+    Tests for the embed render cache of embeds.py
+    """
+    def setUp(self):
+        with open('sample/sample_json/chit_chat.json', 'r') as f:
+            self.data = ug_scraper.json.load(f)
+        ug_embeds._rendered.clear()
+
+    def test_tab_embeds_are_reused(self):
+        first = ug_embeds.format_tab_embed(ug_parser.UGChords(self.data))
+        before = ug_embeds.get_render_stats()
+        self.assertIs(first, ug_embeds.format_tab_embed(ug_parser.UGChords(self.data)))
+        self.assertEqual(before["hits"] + 1, ug_embeds.get_render_stats()["hits"])
+
+    def test_tab_embeds_are_rendered_per_transposition_and_type(self):
+        chords = ug_parser.UGChords(self.data)
+        untransposed = ug_embeds.format_tab_embed(chords)
+        chords.transpose(2)
+        transposed = ug_embeds.format_tab_embed(chords)
+        self.assertIsNot(untransposed, transposed)
+        self.assertIn(chords.get_content(), transposed.description)
+        self.assertNotIn("Transposition", ug_embeds.format_tab_embed(ug_parser.UGTab(self.data)).footer.text)
+
+    def test_changed_content_is_rendered_again(self):
+        tab = ug_parser.UGTab(self.data)
+        first = ug_embeds.format_tab_embed(tab)
+        tab._content = "new content"
+        self.assertIn("new content", ug_embeds.format_tab_embed(tab).description)
+        self.assertIsNot(first, ug_embeds.format_tab_embed(tab))
+
+    def test_results_embeds_are_reused(self):
+        raw = [_raw_result(i, "Chords", i) for i in range(3)]
+        first = ug_embeds.format_results_embeds(ug_parser.UGSearch(_search_data(raw)).get_results(3))
+        second = ug_embeds.format_results_embeds(ug_parser.UGSearch(_search_data(raw)).get_results(3))
+        self.assertEqual([id(e) for e in first], [id(e) for e in second])
+        raw[0]["votes"] = 100
+        third = ug_embeds.format_results_embeds(ug_parser.UGSearch(_search_data(raw)).get_results(3))
+        self.assertIn("`100`", third[0].description)
+
+    def test_long_tabs_are_paged(self):
+        tab = ug_parser.UGTab(self.data)
+        tab._content = "Am\nla la la\n" * 1000
+        pages = tab.get_page_count()
+        self.assertGreater(pages, 1)
+        embeds = [ug_embeds.format_tab_embed(tab, page) for page in range(pages)]
+        self.assertTrue(all(len(embed.description) <= 4096 for embed in embeds))
+        self.assertEqual(tab.get_content(), ''.join(embed.description.strip('`') for embed in embeds))
+        self.assertIn(f"Page 2/{pages}", embeds[1].footer.text)
+
+    def test_render_cache_is_bounded(self):
+        with mock.patch.object(ug_embeds, "RENDER_CACHE_SIZE", 2):
+            for i in range(5):
+                ug_embeds.format_results_embeds(ug_parser.UGSearch(_search_data([_raw_result(i, "Chords", 1)])).get_results(1))
+        self.assertEqual(2, ug_embeds.get_render_stats()["entries"])
+
+
+class TestPaginate(unittest.TestCase):
+    """
+    Tests for the tab pagination of parser.py
+    """
+    def setUp(self):
+        with open('sample/sample_json/chit_chat.json', 'r') as f:
+            self.data = ug_scraper.json.load(f)
+
+    def pages(self, content: str, max_chars: int) -> "list[str]":
+        offsets = ug_parser.paginate(content, max_chars)
+        return [content[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def test_short_content_is_one_page(self):
+        self.assertEqual([0, 5], ug_parser.paginate("Am G\n", 100))
+
+    def test_pages_cover_the_content(self):
+        content = ug_parser.UGChords(self.data).get_content()
+        for max_chars in (300, 1000):
+            pages = self.pages(content, max_chars)
+            self.assertEqual(content, ''.join(pages))
+            self.assertTrue(all(0 < len(page) <= max_chars for page in pages))
+            self.assertTrue(all(page.endswith('\n') for page in pages[:-1]))
+
+    def test_chord_lines_stay_with_their_lyrics(self):
+        content = ug_parser.UGChords(self.data).get_content()
+        for page in self.pages(content, 300)[:-1]:
+            last_line = page.rstrip('\n').rsplit('\n', 1)[-1]
+            self.assertFalse(ug_parser._is_chord_line(last_line), last_line)
+
+    def test_pages_end_at_sections(self):
+        content = "[Verse]\n" + "la la la\n" * 6 + "\n[Chorus]\n" + "na na na\n" * 6
+        pages = self.pages(content, 100)
+        self.assertTrue(pages[1].startswith("[Chorus]") or pages[1].startswith("\n[Chorus]"), pages)
+
+    def test_staff_lines_stay_together(self):
+        staff = ''.join(f"{string}|--0--2--3--|\n" for string in "eBGDAE")
+        pages = self.pages("intro\n" + (staff + "\n") * 4, 150)
+        self.assertTrue(all(page.count('|\n') % 6 == 0 for page in pages), pages)
+
+    def test_long_lines_are_split(self):
+        self.assertEqual([0, 10, 20, 25], ug_parser.paginate("x" * 25, 10))
+
+    def test_chord_lines(self):
+        self.assertTrue(ug_parser._is_chord_line("  Am   G/B  F#m7b5 Dsus4 | x2"))
+        self.assertFalse(ug_parser._is_chord_line("And I feel it now"))
+        self.assertFalse(ug_parser._is_chord_line(""))
+
+    def test_offsets_are_found_once_per_transposition(self):
+        chords = ug_parser.UGChords(self.data)
+        with mock.patch.object(ug_parser, "paginate", wraps=ug_parser.paginate) as paginate:
+            pages = chords.get_page_count(300)
+            self.assertEqual(chords.get_content()[:len(chords.get_page(0, 300))], chords.get_page(0, 300))
+            self.assertEqual(1, paginate.call_count)
+            chords.transpose(3)
+            self.assertEqual(chords.get_content(), ''.join(chords.get_page(i, 300) for i in range(chords.get_page_count(300))))
+            chords.transpose(0)
+            self.assertEqual(pages, chords.get_page_count(300))
+            self.assertEqual(2, paginate.call_count)
+
+
+class TestTranspose(unittest.TestCase):
+    """
+    Tests for the chord transposition of parser.py
+    """
+    def setUp(self):
+        with open('sample/sample_json/chit_chat.json', 'r') as f:
+            self.data = ug_scraper.json.load(f)
+
+    def chords(self, content: str) -> ug_parser.UGChords:
+        data = copy.deepcopy(self.data)
+        data['store']['page']['data']['tab_view']['wiki_tab']['content'] = content
+        return ug_parser.UGChords(data)
+
+    def test_sharps_flats_and_slash_chords(self):
+        chords = self.chords("[ch]F#m[/ch] [ch]D/F#[/ch] [ch]C#7[/ch] [ch]Am[/ch]")
+        chords.transpose(1)
+        self.assertEqual("Gm D#/G D7 A#m", chords.get_content())
+        chords = self.chords("[ch]Bb[/ch] [ch]Eb/Bb[/ch] [ch]Fmaj7[/ch]")
+        chords.transpose(2)
+        self.assertEqual("C F/C Gmaj7", chords.get_content())
+
+    def test_transposition_is_not_cumulative(self):
+        chords = self.chords("[ch]C[/ch] la [ch]G/B[/ch] [ch]N.C.[/ch]")
+        chords.transpose(3)
+        chords.transpose(-1)
+        self.assertEqual("B la Gb/Bb N.C.", chords.get_content())
+        self.assertEqual(11, chords.get_transposition())
+        chords.transpose(12)
+        self.assertEqual("C la G/B N.C.", chords.get_content())
+
+    def test_sample_transposes(self):
+        chords = ug_parser.UGChords(self.data)
+        chords.transpose(2)
+        self.assertEqual("E                         C#m", chords.get_content().split('\n')[1])
+        chords.transpose(0)
+        with open('sample/chit_chat.txt', 'r') as f:
+            self.assertEqual(f.read(), chords.get_content())
+
+    def test_materialized_keys_match_transpose(self):
+        chords = ug_parser.UGChords(self.data)
+        expected = []
+        for t in range(12):
+            chords.transpose(t)
+            expected.append(chords.get_content())
+        chords.materialize_keys()
+        for t in range(12):
+            chords.transpose(t)
+            self.assertEqual(expected[t], chords.get_content())
+
+    def test_materialized_keys_are_looked_up(self):
+        chords = ug_parser.UGChords(self.data)
+        chords.materialize_keys()
+        with mock.patch.object(ug_parser.UGChords, "_transposed_chords") as transposed:
+            chords.transpose(5)
+        transposed.assert_not_called()
+        # the keys share the text between the chords
+        self.assertLess(0, chords.get_keys_nbytes())
+        self.assertGreater(12 * len(chords.get_content()) // 2, chords.get_keys_nbytes())
+        chords.drop_keys()
+        self.assertEqual(0, chords.get_keys_nbytes())
+
+    def test_keys_cache_caps_tabs(self):
+        keys_cache = ug_cache.KeysCache(max_tabs=2)
+        tabs = []
+        for i in range(3):
+            data = copy.deepcopy(self.data)
+            data['store']['page']['data']['tab']['id'] = i
+            tabs.append(ug_parser.UGChords(data))
+            keys_cache.add(tabs[-1])
+        self.assertEqual([False, True, True], [t.has_keys() for t in tabs])
+        self.assertEqual(2, len(keys_cache))
+        self.assertNotIn(tabs[0], keys_cache)
+        self.assertEqual(tabs[1].get_keys_nbytes() + tabs[2].get_keys_nbytes(), keys_cache.get_nbytes())
+        # the same tab shown twice is kept twice, in its own key
+        keys_cache.add(ug_parser.UGChords(copy.deepcopy(self.data)))
+        self.assertNotIn(tabs[1], keys_cache)
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Tests for the latency metrics of metrics.py
+    """
+    def setUp(self):
+        ug_metrics.reset()
+        ug_metrics.enable()
+
+    def tearDown(self):
+        ug_metrics.enable(False)
+        ug_metrics.reset()
+
+    def test_disabled_records_nothing(self):
+        ug_metrics.enable(False)
+        self.assertIs(ug_metrics._NOOP, ug_metrics.timer("extract"))
+        ug_metrics.inc("fetches")
+        self.assertEqual({}, ug_metrics.snapshot()["counters"])
+
+    def test_metrics_are_labelled_with_the_command(self):
+        with ug_metrics.command_scope("chords"):
+            ug_metrics.observe("extract", 0.003)
+        ug_metrics.observe("extract", 0.02)
+        stats = ug_metrics.snapshot()
+        self.assertEqual(1, stats["counters"]['commands{command="chords"}'])
+        self.assertEqual(1, stats["latency_ms"]["chords"]["extract"]["count"])
+        self.assertEqual(5.0, stats["latency_ms"]["chords"]["extract"]["p50"])
+        self.assertEqual(25.0, stats["latency_ms"]["-"]["extract"]["p95"])
+
+    def test_stats_are_valid_json(self):
+        import server
+        # slower than the last bucket, e.g. a refresh with a cold cache
+        ug_metrics.observe("refresh", 30.0)
+        response = server.app.test_client().get('/stats')
+        stats = ug_scraper.json.loads(response.get_data(as_text=True))
+        self.assertEqual(10000.0, stats["latency_ms"]["-"]["refresh"]["p50"])
+
+    def test_render_prometheus(self):
+        ug_metrics.register_collector("test", lambda: {"entries": 3})
+        self.addCleanup(ug_metrics._collectors.pop, "test")
+        with ug_metrics.command_scope("tabs"):
+            ug_metrics.observe("decode", 0.0004)
+        text = ug_metrics.render_prometheus()
+        self.assertIn('# TYPE ug_decode_seconds histogram', text)
+        self.assertIn('ug_decode_seconds_bucket{command="tabs",le="0.001"} 1', text)
+        self.assertIn('ug_decode_seconds_count{command="tabs"} 1', text)
+        self.assertIn('ug_commands_total{command="tabs"} 1', text)
+        self.assertIn('ug_test_entries 3', text)
+
+    def test_fetch_records_each_stage(self):
+        with replaying(cache=None):
+            with ug_metrics.command_scope("search"):
+                asyncio.run(ug_scraper.async_json_from_search("beach weather", "chit chat"))
+        stats = ug_metrics.snapshot()
+        for stage in ("connect", "download", "extract", "decode"):
+            self.assertEqual(1, stats["latency_ms"]["search"][stage]["count"])
+        self.assertEqual(1, stats["counters"]['fetches{command="search"}'])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,329 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import urllib.parse
+from collections import OrderedDict
+
+# how long each kind of page stays fresh, in seconds
+DEFAULT_TTLS = {
+    "explore": 10 * 60,         # the explore listings change throughout the day
+    "search": 6 * 60 * 60,
+    "artist": 24 * 60 * 60,
+    "tab": 7 * 24 * 60 * 60,    # tab contents rarely change
+}
+
+
+def normalize_url(url: str) -> str:
+    """
+    Normalizes the url so that the same page is cached under one key:
+    lowercases the scheme and host, sorts the query,
+    and drops the fragment and any trailing slash.
+    """
+    parts = urllib.parse.urlsplit(url.strip())
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True)))
+    path = parts.path.rstrip('/') or '/'
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, query, ''))
+
+
+def url_kind(url: str) -> str:
+    """Returns the kind of ultimate-guitar page: tab, search, explore or artist."""
+    parts = urllib.parse.urlsplit(url)
+    if parts.netloc.startswith("tabs."):
+        return "tab"
+    if parts.path.startswith("/search.php"):
+        return "search"
+    if parts.path.startswith("/explore"):
+        return "explore"
+    return "artist"
+
+
+class LRUCache():
+    """
+    A bounded in-memory cache, which evicts the least recently used entries
+    once it holds more than max_entries entries or max_bytes bytes.
+
+    Instance Variables:
+    - max_entries:  int | the maximum number of entries
+    - max_bytes:    int | the maximum total size of the entries
+    """
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024):
+        self._max_entries: int = max_entries
+        self._max_bytes: int = max_bytes
+        self._nbytes: int = 0
+        self._entries: "OrderedDict[str, tuple[float, int, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> "tuple[float, dict] or None":
+        """Returns the (stored_at, data) entry for the key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[2]
+
+    def put(self, key: str, data: dict, size: int, stored_at: float = None) -> None:
+        """Stores the data, and evicts the oldest entries if the cache is full."""
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= old[1]
+            self._entries[key] = (stored_at or time.time(), size, data)
+            self._nbytes += size
+            while len(self._entries) > self._max_entries or self._nbytes > self._max_bytes:
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self._nbytes -= old_size
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._nbytes -= old[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_nbytes(self) -> int:
+        return self._nbytes
+
+
+class DiskCache():
+    """
+    A persistent cache, which stores each entry as a JSON file in a directory,
+    and evicts the oldest files once they take up more than max_bytes,
+    down to low_water of max_bytes, so that the directory is not scanned again on every write.
+    Writes are best-effort: a file which cannot be written is not cached.
+
+    Instance Variables:
+    - path:         str   | the directory of the cache files
+    - max_bytes:    int   | the maximum total size of the cache files
+    - low_water:    float | the fraction of max_bytes the files are evicted down to
+    """
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024, low_water: float = 0.9):
+        self._path: str = path
+        self._max_bytes: int = max_bytes
+        self._low_water: float = low_water
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._nbytes: int = sum(entry.stat().st_size for entry in self._files())
+
+    def get(self, key: str) -> "tuple[float, dict] or None":
+        """Returns the (stored_at, data) entry for the key, or None."""
+        try:
+            with open(self._file_path(key), 'r') as f:
+                entry = json.load(f)
+            return entry["stored_at"], entry["data"]
+        except (OSError, ValueError, KeyError, TypeError):
+            # missing, or not an entry, e.g. a file cut short
+            return None
+
+    def put(self, key: str, data: dict, stored_at: float = None) -> int:
+        """
+        Stores the data, evicts the oldest files if the cache is full, and returns the file size,
+        or 0 if the file could not be written, e.g. as the disk is full.
+        """
+        path = self._file_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({"url": key, "stored_at": stored_at or time.time(), "data": data}, f)
+            size = os.path.getsize(tmp_path)
+            with self._lock:
+                old_size = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+                self._nbytes += size - old_size
+                if self._nbytes > self._max_bytes:
+                    self._evict()
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return 0
+        return size
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            try:
+                path = self._file_path(key)
+                size = os.path.getsize(path)
+                os.remove(path)
+                self._nbytes -= size
+            except OSError:
+                pass
+
+    def get_nbytes(self) -> int:
+        return self._nbytes
+
+    def _evict(self) -> None:
+        """Removes the least recently written files down to the low water mark, `_lock` must be held."""
+        target = self._max_bytes * self._low_water
+        for entry in sorted(self._files(), key=lambda e: e.stat().st_mtime):
+            if self._nbytes <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._nbytes -= size
+            except OSError:
+                pass
+
+    def _files(self) -> "list[os.DirEntry]":
+        return [e for e in os.scandir(self._path) if e.name.endswith('.json')]
+
+    def _file_path(self, key: str) -> str:
+        return os.path.join(self._path, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+
+class UGCache():
+    """
+    A two-tier cache for the JSON dicts of ultimate-guitar pages,
+    keyed by the normalized url: a bounded in-memory LRU cache
+    in front of an optional on-disk cache.
+    Each kind of page (see url_kind) has its own time to live.
+
+    Instance Variables:
+    - memory:   LRUCache         | the in-memory cache
+    - disk:     DiskCache or None | the on-disk cache, None to only cache in memory
+    - ttls:     dict[str, float] | the time to live for each kind of page, in seconds
+    """
+    def __init__(self, memory: LRUCache = None, disk: DiskCache = None, ttls: "dict[str, float]" = None):
+        self._memory: LRUCache = memory if memory is not None else LRUCache()
+        self._disk: DiskCache or None = disk
+        self._ttls: "dict[str, float]" = dict(DEFAULT_TTLS, **(ttls or {}))
+        self._memory_hits: int = 0
+        self._disk_hits: int = 0
+        self._stale_hits: int = 0
+        self._misses: int = 0
+
+    def get(self, url: str, allow_stale: bool = False) -> dict or None:
+        """
+        Returns the cached JSON dict for the url, or None if it is missing or expired.
+
+        Parameters:
+        - url:          the url of the page
+        - allow_stale:  whether to return the dict even if it has expired,
+                        e.g. when ultimate-guitar cannot be reached
+        """
+        key = normalize_url(url)
+        ttl = float('inf') if allow_stale else self._ttls[url_kind(key)]
+
+        entry = self._memory.get(key)
+        if entry is not None and time.time() - entry[0] <= ttl:
+            if allow_stale:
+                self._stale_hits += 1
+            else:
+                self._memory_hits += 1
+            return entry[1]
+
+        if self._disk is not None:
+            entry = self._disk.get(key)
+            if entry is not None and time.time() - entry[0] <= ttl:
+                if allow_stale:
+                    self._stale_hits += 1
+                else:
+                    self._disk_hits += 1
+                stored_at, data = entry
+                self._memory.put(key, data, len(json.dumps(data)), stored_at)
+                return data
+
+        if not allow_stale:
+            self._misses += 1
+        return None
+
+    def put(self, url: str, data: dict, size: int) -> None:
+        """
+        Caches the JSON dict for the url.
+
+        Parameters:
+        - url:  the url of the page
+        - data: the JSON dict of the page
+        - size: the approximate size of the data in bytes, e.g. the length of its JSON string
+        """
+        key = normalize_url(url)
+        stored_at = time.time()
+        self._memory.put(key, data, size, stored_at)
+        if self._disk is not None:
+            self._disk.put(key, data, stored_at)
+
+    def get_stored_at(self, url: str) -> float or None:
+        """Returns when the url's dict was cached, even if it has expired, or None if it is not cached."""
+        key = normalize_url(url)
+        entry = self._memory.get(key)
+        if entry is None and self._disk is not None:
+            entry = self._disk.get(key)
+        return entry[0] if entry is not None else None
+
+    def remove(self, url: str) -> None:
+        key = normalize_url(url)
+        self._memory.remove(key)
+        if self._disk is not None:
+            self._disk.remove(key)
+
+    def get_stats(self) -> "dict[str, int]":
+        """Returns the hit, stale hit and miss counters, and the size of each tier."""
+        return {
+            "memory_hits": self._memory_hits,
+            "disk_hits": self._disk_hits,
+            "stale_hits": self._stale_hits,
+            "misses": self._misses,
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory.get_nbytes(),
+            "disk_bytes": self._disk.get_nbytes() if self._disk is not None else 0,
+        }
+
+
+class KeysCache():
+    """
+    Caps how many UGChords keep all 12 of their keys (see UGChords.materialize_keys):
+    adding a tab builds its keys, and once more than max_tabs tabs, or more than
+    max_bytes of keys, are kept, the keys of the least recently used tabs are dropped.
+    Each UGChords is kept by itself, as each one shown has its own transposition.
+
+    Instance Variables:
+    - max_tabs:     int | the maximum number of tabs with all of their keys
+    - max_bytes:    int | the maximum memory used by the keys
+    """
+    def __init__(self, max_tabs: int = 64, max_bytes: int = 16 * 1024 * 1024):
+        self._max_tabs: int = max_tabs
+        self._max_bytes: int = max_bytes
+        self._nbytes: int = 0
+        # id of the chords -> (chords, keys size)
+        self._tabs: "OrderedDict[int, tuple[object, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, chords) -> None:
+        """Builds all of the keys of the UGChords, or marks it as recently used if they are kept."""
+        key = id(chords)
+        with self._lock:
+            if key in self._tabs:
+                self._tabs.move_to_end(key)
+                return
+        chords.materialize_keys()
+        size = chords.get_keys_nbytes()
+        with self._lock:
+            if key in self._tabs:
+                return
+            self._tabs[key] = (chords, size)
+            self._nbytes += size
+            while len(self._tabs) > 1 and (len(self._tabs) > self._max_tabs or self._nbytes > self._max_bytes):
+                _, (old, old_size) = self._tabs.popitem(last=False)
+                old.drop_keys()
+                self._nbytes -= old_size
+
+    def __contains__(self, chords) -> bool:
+        return id(chords) in self._tabs
+
+    def __len__(self) -> int:
+        return len(self._tabs)
+
+    def get_nbytes(self) -> int:
+        return self._nbytes
+
+    def get_stats(self) -> "dict[str, int]":
+        """Returns the number of tabs with all of their keys, and the memory used by the keys."""
+        return {"tabs": len(self._tabs), "bytes": self._nbytes}
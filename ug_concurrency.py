@@ -0,0 +1,576 @@
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+import contextlib
+import contextvars
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import ug_metrics
+
+# the priorities of fetches, lower ones are started first
+INTERACTIVE = 0     # fetches for a command that a user is waiting on
+BACKGROUND = 1      # prefetches and refreshes
+_PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+_priority: "contextvars.ContextVar[int]" = contextvars.ContextVar('ug_priority', default=INTERACTIVE)
+
+
+class QueueFullError(Exception):
+    """Raised when too many fetches are already waiting to start, instead of waiting behind them."""
+    pass
+
+
+class CircuitOpenError(Exception):
+    """Raised when a host has been failing, instead of fetching from it again."""
+    pass
+
+
+@contextlib.contextmanager
+def priority(level: int):
+    """
+    Gives the fetches started in the with block (and in the tasks and
+    scraper threads it starts) the priority, INTERACTIVE or BACKGROUND.
+    Fetches are INTERACTIVE by default.
+    """
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def get_priority() -> int:
+    """Returns the priority of the fetches started in the current context."""
+    return _priority.get()
+
+
+class SingleFlight():
+    """
+    Deduplicates concurrent calls for the same key:
+    while a call for a key is in flight, other callers with the same key
+    wait for it and get its result, or its exception, instead of calling again.
+    Safe to use from multiple threads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: "dict[str, Future]" = {}
+
+    def do(self, key: str, func, *args):
+        """
+        Calls func(*args), unless a call for the key is already in flight,
+        in which case that call's result is returned, or its exception raised.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        """Returns the number of keys with a call in flight."""
+        return len(self._calls)
+
+
+class AsyncSingleFlight():
+    """
+    The asynchronous version of SingleFlight, for coroutines on one event loop:
+    callers with the same key await one shared task.
+    A caller being cancelled does not cancel the shared task for the other callers.
+    """
+    def __init__(self):
+        self._tasks: "dict[str, asyncio.Future]" = {}
+
+    async def do(self, key: str, func, *args):
+        """
+        Awaits func(*args), unless a call for the key is already in flight,
+        in which case that call's result is returned, or its exception raised.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args))
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._tasks.pop(key) if self._tasks.get(key) is t else None)
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        """Returns the number of keys with a call in flight."""
+        return len(self._tasks)
+
+
+
+class TokenBucket():
+    """
+    Rate limits calls to `rate` per second on average, allowing bursts of up to `burst` calls.
+    Callers past the limit are given a turn in the order they asked for one.
+    Safe to use from multiple threads.
+
+    Instance Variables:
+    - rate:     float | the calls per second
+    - burst:    int   | the calls that can be made at once after being idle
+    """
+    def __init__(self, rate: float, burst: int):
+        assert rate > 0 and burst > 0
+        self._rate: float = rate
+        self._burst: int = burst
+        self._tokens: float = float(burst)
+        self._updated: float = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes a token, and returns the seconds to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            # the tokens can go negative, which queues the callers behind each other
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self._rate
+
+    def take(self) -> float:
+        """Takes a token, waiting for one if needed, and returns the seconds waited."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+class FetchScheduler():
+    """
+    Admission control for the fetches to ultimate-guitar:
+    at most max_concurrent fetches run at once, the fetches to each host are
+    rate limited by a TokenBucket, and waiting fetches are started in order of
+    priority (see priority()), then in the order they arrived.
+    Once max_queued fetches of a priority are waiting, further ones are rejected
+    with QueueFullError straight away.
+    A waiting fetch can be given a higher priority (see promote), e.g. once a user
+    waits on a prefetch, so that it does not wait behind the fetches it was started ahead of.
+    Safe to use from multiple threads.
+
+    Instance Variables:
+    - max_concurrent:   int   | the number of fetches that can run at once
+    - rate:             float | the fetches per second to each host
+    - burst:            int   | the fetches to a host that can start at once after being idle
+    - max_queued:       dict[int, int]
+                              | the number of fetches of each priority that can wait to start
+    """
+    def __init__(self, max_concurrent: int = 4, rate: float = 4.0, burst: int = 8, max_queued: "dict[int, int]" = None):
+        assert max_concurrent > 0
+        self._max_concurrent: int = max_concurrent
+        self._rate: float = rate
+        self._burst: int = burst
+        self._max_queued: "dict[int, int]" = {INTERACTIVE: 32, BACKGROUND: 8, **(max_queued or {})}
+        self._cond = threading.Condition()
+        # a heap of the [priority, arrival] of the waiting fetches
+        self._waiting: "list[list[int]]" = []
+        # the key of a waiting fetch -> its entry in _waiting, see promote
+        self._keyed: "dict[str, list[int]]" = {}
+        self._arrivals = itertools.count()
+        self._queued: "dict[int, int]" = {level: 0 for level in self._max_queued}
+        self._running: int = 0
+        self._rejected: int = 0
+        self._promoted: int = 0
+        self._buckets: "dict[str, TokenBucket]" = {}
+
+    @contextlib.contextmanager
+    def slot(self, host: str, key: str = None):
+        """
+        Waits for a turn to fetch from the host, which lasts for the with block.
+
+        Parameters:
+        - host: the host fetched from
+        - key:  the key the fetch can be promoted by while it waits, e.g. its normalized url
+
+        Exceptions:
+        - QueueFullError:   if too many fetches of the same priority are already waiting
+        """
+        self.acquire(host, key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def acquire(self, host: str, key: str = None) -> None:
+        """Waits for a turn to fetch from the host, release() must be called after the fetch."""
+        level = _priority.get()
+        start = time.monotonic()
+        with self._cond:
+            if self._queued.get(level, 0) >= self._max_queued.get(level, 0):
+                self._rejected += 1
+                ug_metrics.inc("rejected", priority=_PRIORITY_NAMES.get(level, level))
+                raise QueueFullError(f"Too many fetches are waiting for ultimate-guitar ({self._queued.get(level, 0)}).")
+            # a list, so that promote() can change its priority in place
+            entry = [level, next(self._arrivals)]
+            heapq.heappush(self._waiting, entry)
+            self._queued[level] = self._queued.get(level, 0) + 1
+            if key is not None:
+                self._keyed[key] = entry
+            try:
+                while self._waiting[0] is not entry or self._running >= self._max_concurrent:
+                    self._cond.wait()
+                heapq.heappop(self._waiting)
+            except BaseException:
+                self._waiting.remove(entry)
+                heapq.heapify(self._waiting)
+                raise
+            finally:
+                level = entry[0]
+                self._queued[level] -= 1
+                if key is not None and self._keyed.get(key) is entry:
+                    del self._keyed[key]
+                # the next waiting fetch may be able to start as well
+                self._cond.notify_all()
+            self._running += 1
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self._rate, self._burst)
+
+        try:
+            bucket.take()
+        except BaseException:
+            self.release()
+            raise
+        ug_metrics.observe("queue_wait", time.monotonic() - start, priority=_PRIORITY_NAMES.get(level, level))
+
+    def release(self) -> None:
+        """Ends a turn started by acquire()."""
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    def promote(self, key: str, level: int = INTERACTIVE) -> bool:
+        """
+        Gives the waiting fetch with the key the priority, if it has a lower one,
+        ahead of the fetches of that priority which arrived after it.
+
+        Returns:
+        - whether a waiting fetch was promoted
+        """
+        with self._cond:
+            entry = self._keyed.get(key)
+            if entry is None or entry[0] <= level:
+                return False
+            self._queued[entry[0]] -= 1
+            self._queued[level] = self._queued.get(level, 0) + 1
+            entry[0] = level
+            heapq.heapify(self._waiting)
+            self._promoted += 1
+            self._cond.notify_all()
+        ug_metrics.inc("promoted")
+        return True
+
+    def get_capacity(self) -> int:
+        """Returns the number of fetches that can run or wait at once, past which fetches are rejected."""
+        return self._max_concurrent + sum(self._max_queued.values())
+
+    def get_stats(self) -> "dict[str, int]":
+        """Returns the number of running fetches, of waiting fetches of each priority, and of rejected fetches."""
+        with self._cond:
+            stats = {"running": self._running, "rejected": self._rejected, "promoted": self._promoted}
+            for level, queued in self._queued.items():
+                stats[f"queued_{_PRIORITY_NAMES.get(level, level)}"] = queued
+            return stats
+
+
+
+class RetryPolicy():
+    """
+    When, and after how long, a failed fetch is tried again:
+    with exponential backoff and full jitter, or after the Retry-After
+    the server asked for, if it is not longer than max_retry_after.
+
+    Instance Variables:
+    - max_attempts:     int   | the number of attempts, including the first
+    - base_delay:       float | the backoff before the first retry, in seconds
+    - max_delay:        float | the longest backoff, in seconds
+    - max_retry_after:  float | the longest Retry-After that is waited for, in seconds
+    """
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0, max_retry_after: float = 10.0):
+        assert max_attempts > 0
+        self._max_attempts: int = max_attempts
+        self._base_delay: float = base_delay
+        self._max_delay: float = max_delay
+        self._max_retry_after: float = max_retry_after
+
+    def get_max_attempts(self) -> int:
+        return self._max_attempts
+
+    def get_delay(self, attempt: int, retry_after: float = None) -> float or None:
+        """
+        Returns the seconds to wait before retrying after the attempt (counted from 0) failed,
+        or None if it should not be retried.
+        """
+        if attempt + 1 >= self._max_attempts:
+            return None
+        if retry_after is not None:
+            return retry_after if retry_after <= self._max_retry_after else None
+        # full jitter, so that fetches which failed together do not retry together
+        return random.uniform(0, min(self._max_delay, self._base_delay * 2 ** attempt))
+
+
+class CircuitBreaker():
+    """
+    Fails fast while a host is down: once failure_threshold fetches in a row
+    have failed, the breaker opens and allow() refuses fetches, until
+    reset_timeout seconds have passed, when one trial fetch is let through
+    (half-open). The breaker closes if it succeeds, and opens again if it fails.
+    The state is reported as the circuit_state gauge: 0 closed, 1 half-open, 2 open.
+    Safe to use from multiple threads.
+
+    Instance Variables:
+    - host:                 str   | the host, the label of the gauge
+    - failure_threshold:    int   | the failures in a row which open the breaker
+    - reset_timeout:        float | the seconds until a trial fetch is let through
+    """
+    CLOSED = "closed"
+    HALF_OPEN = "half-open"
+    OPEN = "open"
+    _GAUGE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, host: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self._host: str = host
+        self._failure_threshold: int = failure_threshold
+        self._reset_timeout: float = reset_timeout
+        self._state: str = CircuitBreaker.CLOSED
+        self._failures: int = 0
+        self._retry_at: float = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Returns whether a fetch may be made to the host."""
+        with self._lock:
+            if self._state == CircuitBreaker.CLOSED:
+                return True
+            now = time.monotonic()
+            if now < self._retry_at:
+                return False
+            # one trial per reset_timeout, so that a lost trial does not keep the breaker open
+            self._retry_at = now + self._reset_timeout
+            self._set_state(CircuitBreaker.HALF_OPEN)
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            if self._state != CircuitBreaker.CLOSED:
+                self._set_state(CircuitBreaker.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == CircuitBreaker.HALF_OPEN or self._failures >= self._failure_threshold:
+                self._retry_at = time.monotonic() + self._reset_timeout
+                self._set_state(CircuitBreaker.OPEN)
+
+    def get_state(self) -> str:
+        return self._state
+
+    def _set_state(self, state: str) -> None:
+        """Changes the state and its gauge, `_lock` must be held."""
+        self._state = state
+        ug_metrics.set_gauge("circuit_state", CircuitBreaker._GAUGE_VALUES[state], host=self._host)
+
+
+class ParsePool():
+    """
+    Worker processes for the CPU-bound parsing of fetched pages,
+    so that parsing runs on more than one core, outside of the bot process's GIL.
+    Once max_pending calls are waiting for the workers, further calls are run
+    in the calling thread instead of queueing, as are the calls made after
+    the workers fail, until the pool is restarted by the next call.
+    Safe to use from multiple threads.
+
+    The workers are started by the first call, or by start().
+    With the "spawn" and "forkserver" contexts the workers import the __main__ module,
+    so it has to be guarded with `if __name__ == '__main__'`.
+    With the "fork" context the workers should be started before the process starts
+    any thread, as a forked child only has the thread which forked it, and can deadlock
+    on a lock held by another one. For the same reason, failed forked workers are not
+    restarted once other threads are running, the calls then all run in the calling thread.
+
+    Instance Variables:
+    - workers:      int        | the number of worker processes
+    - max_pending:  int        | the number of calls that can wait for, or run on, the workers
+    - context:      str or None | the multiprocessing start method, None for the platform's default
+    """
+    def __init__(self, workers: int = None, max_pending: int = None, context: str = None):
+        self._workers: int = workers or multiprocessing.cpu_count()
+        self._max_pending: int = max_pending or 4 * self._workers
+        self._context: str or None = context
+        self._executor: ProcessPoolExecutor or None = None
+        # set once the workers fail and cannot be restarted safely
+        self._stopped: bool = False
+        self._pending = threading.BoundedSemaphore(self._max_pending)
+        self._lock = threading.Lock()
+        self._stats: "dict[str, int]" = {"offloaded": 0, "fallbacks": 0, "restarts": 0}
+
+    def start(self) -> None:
+        """Starts the workers, before the process starts any thread if they are forked."""
+        executor = self._get_executor()
+        if executor is None:
+            return
+        # the workers are started on demand, so one call per worker starts them all
+        for future in [executor.submit(int) for _ in range(self._workers)]:
+            future.result()
+
+    def run(self, func, *args):
+        """
+        Runs the function on a worker, and waits for its result,
+        or runs it in the calling thread if too many calls are pending, or the workers failed.
+        The function and its arguments and result have to be picklable.
+        """
+        if not self._pending.acquire(blocking=False):
+            self._count("fallbacks")
+            return func(*args)
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                self._count("fallbacks")
+                return func(*args)
+            try:
+                future = executor.submit(func, *args)
+            except RuntimeError:
+                # shut down, or broken while submitting
+                self._count("fallbacks")
+                return func(*args)
+            self._count("offloaded")
+            try:
+                return future.result()
+            except BrokenProcessPool:
+                self._restart(executor)
+                self._count("fallbacks")
+                return func(*args)
+        finally:
+            self._pending.release()
+
+    def shutdown(self) -> None:
+        """Stops the workers, after the calls in progress."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def get_workers(self) -> int:
+        return self._workers
+
+    def get_stats(self) -> "dict[str, int]":
+        """Returns the number of workers, and of calls offloaded to them, run in-process instead, and restarts."""
+        with self._lock:
+            return {"workers": self._workers, **self._stats}
+
+    def _get_executor(self) -> ProcessPoolExecutor or None:
+        with self._lock:
+            if self._executor is None and not self._stopped:
+                context = multiprocessing.get_context(self._context)
+                self._executor = ProcessPoolExecutor(self._workers, mp_context=context)
+            return self._executor
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        """
+        Drops the broken workers, so that the next call starts new ones,
+        unless they would be forked from a process running other threads.
+        """
+        # not counting the broken executor's own thread, which may still be stopping
+        ignored = {threading.current_thread(), getattr(broken, "_executor_manager_thread", None)}
+        forks_from_threads = multiprocessing.get_context(self._context).get_start_method() == "fork" \
+            and any(t not in ignored for t in threading.enumerate())
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+            if forks_from_threads:
+                self._stopped = True
+            else:
+                self._stats["restarts"] += 1
+        broken.shutdown(wait=False)
+
+    def _count(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+        ug_metrics.inc(f"parse_{stat}")
+
+
+async def hedged(calls: list, hedge_after: float, accept_after: float):
+    """
+    Awaits the first of the calls, in order of preference, which succeeds in time:
+    the first call is started straight away, and each next one once the calls
+    before it have failed, or have run for hedge_after seconds without finishing.
+    The result of a call is returned once every call before it has failed,
+    or has run for accept_after seconds, and the calls still running are cancelled.
+
+    Parameters:
+    - calls:        the coroutine functions, without arguments, most preferred first
+    - hedge_after:  the seconds before the next call is started alongside the slow ones
+    - accept_after: the seconds a more preferred call is waited for, before a result
+                    of a less preferred one is returned instead
+
+    Returns:
+    - the result of the call
+
+    Exceptions:
+    - the exception of the first call, if every call fails
+    """
+    assert calls
+    loop = asyncio.get_running_loop()
+    tasks: "list[asyncio.Task]" = []
+    started_at: "list[float]" = []
+
+    def start_next():
+        tasks.append(asyncio.ensure_future(calls[len(tasks)]()))
+        started_at.append(loop.time())
+        if len(tasks) > 1:
+            ug_metrics.inc("hedges")
+
+    start_next()
+    try:
+        while True:
+            now = loop.time()
+            for i, task in enumerate(tasks):
+                if task.done() and not task.cancelled() and task.exception() is None:
+                    return task.result()
+                if not task.done() and now - started_at[i] < accept_after:
+                    # still worth waiting for
+                    break
+            else:
+                if all(task.done() for task in tasks) and len(tasks) == len(calls):
+                    raise tasks[0].exception()
+
+            pending = [task for task in tasks if not task.done()]
+            if len(tasks) < len(calls) and (not pending or now - started_at[-1] >= hedge_after):
+                start_next()
+                continue
+
+            # wakes up when a call finishes, the next call is due, or a call has been waited for long enough
+            deadlines = [started_at[i] + accept_after for i, task in enumerate(tasks) if not task.done()]
+            if len(tasks) < len(calls):
+                deadlines.append(started_at[-1] + hedge_after)
+            deadlines = [deadline for deadline in deadlines if deadline > now]
+            timeout = min(deadlines) - now if deadlines else None
+            await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+            else:
+                # retrieved, so that the exceptions of the losing calls are not logged
+                task.cancelled() or task.exception()
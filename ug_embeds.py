@@ -0,0 +1,118 @@
+import threading
+import collections
+
+import interactions
+
+import ug_metrics
+from ug_parser import UGTab, UGSearchResult, UGArtist
+
+UG_YELLOW = 0xffc600
+
+# the number of tab and results listing embeds kept, the least recently shown are dropped past it
+RENDER_CACHE_SIZE = 512
+
+# key -> (the content it was rendered from, the embed or embeds)
+_rendered: "collections.OrderedDict[tuple, tuple]" = collections.OrderedDict()
+_rendered_lock = threading.Lock()
+_render_stats = {"hits": 0, "misses": 0}
+
+
+@ug_metrics.timed("embed")
+def format_tab_embed(ugtab: UGTab, page: int = 0) -> interactions.Embed:
+    """
+    Formats a page of the tab to be an embed (see UGTab.get_page).
+    The embed of each page of a tab, at each transposition, is built once and then reused
+    while the tab's content is the same, so the embed must not be changed.
+    """
+    # the metadata of UGChords differs from UGTab's
+    key = (type(ugtab).__name__, ugtab.get_tab_id(), ugtab.get_transposition(), page)
+    content = ugtab.get_content()
+    embed = _get_rendered(key, content)
+    if embed is None:
+        embed = _build_tab_embed(ugtab, page)
+        _put_rendered(key, content, embed)
+    return embed
+
+
+def _build_tab_embed(ugtab: UGTab, page: int) -> interactions.Embed:
+    embed = interactions.Embed(
+        title = ugtab.get_artist() + " - " + ugtab.get_song() + " (" + ugtab.get_type() + ")",
+        url = ugtab.get_tab_url(),
+        description = "```" + ugtab.get_page(page) + "```",
+        color = UG_YELLOW
+    )
+    footer = ugtab.get_formatted_metadata()
+    pages = ugtab.get_page_count()
+    if pages > 1:
+        footer += "\nPage " + str(page+1) + "/" + str(pages)
+    embed.set_footer(text=footer)
+    return embed
+
+
+
+@ug_metrics.timed("embed")
+def format_results_embeds(results: "list[UGSearchResult | UGArtist]") -> "list[interactions.Embed]":
+    """
+    Formats the results listing to be embeds, one per result.
+    The embeds of a listing are built once and then reused
+    while its results are the same, so the embeds must not be changed.
+    """
+    key = ("results",) + tuple(
+        (r.get_tab_id(), r.get_votes(), r.get_rating()) if type(r) is UGSearchResult else r.get_artist_url()
+        for r in results
+    )
+    embeds = _get_rendered(key, None)
+    if embeds is None:
+        embeds = _build_results_embeds(results)
+        _put_rendered(key, None, embeds)
+    return list(embeds)
+
+
+def get_render_stats() -> "dict[str, int]":
+    """Returns the number of embeds kept, and of the embeds reused and built."""
+    with _rendered_lock:
+        return {"entries": len(_rendered), **_render_stats}
+
+
+def _build_results_embeds(results: "list[UGSearchResult | UGArtist]") -> "list[interactions.Embed]":
+    results_embeds = []
+    for i in range(len(results)):
+        r = results[i]
+        if type(r) is UGSearchResult:
+            embed = interactions.Embed(
+                title = r.get_artist() + " - " + r.get_song() + " (" + r.get_type() + ")",
+                description = r.get_formatted_result_description(),
+                color = UG_YELLOW
+            )
+        elif type(r) is UGArtist:
+            embed = interactions.Embed(
+                title = r.get_artist(),
+                description = r.get_formatted_result_description(),
+                color = UG_YELLOW
+            )
+        embed.set_footer(text=str(i+1)+"/"+str(len(results)))
+        results_embeds.append(embed)
+    return results_embeds
+
+
+def _get_rendered(key: tuple, content: str or None):
+    """Returns the embed rendered for the key from the same content, or None."""
+    with _rendered_lock:
+        entry = _rendered.get(key)
+        if entry is not None and (entry[0] is content or entry[0] == content):
+            _rendered.move_to_end(key)
+            _render_stats["hits"] += 1
+            hit = entry[1]
+        else:
+            _render_stats["misses"] += 1
+            hit = None
+    ug_metrics.inc("render_hits" if hit is not None else "render_misses")
+    return hit
+
+
+def _put_rendered(key: tuple, content: str or None, rendered) -> None:
+    with _rendered_lock:
+        _rendered[key] = (content, rendered)
+        _rendered.move_to_end(key)
+        while len(_rendered) > RENDER_CACHE_SIZE:
+            _rendered.popitem(last=False)
@@ -0,0 +1,189 @@
+"""
+Recorded ultimate-guitar pages, replayed from disk instead of the site,
+for offline tests and reproducible benchmarks.
+
+Recording the pages (needs a connection to ultimate-guitar):
+
+    python ug_fixtures.py record <url> [<url> ...]
+
+Replaying them:
+
+    with replay():
+        json_from_url(url)
+"""
+import io
+import os
+import sys
+import json
+import html
+import time
+import hashlib
+import contextlib
+import http
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+import ug_scraper
+from ug_cache import normalize_url
+
+FIXTURE_DIR = 'sample/fixtures'
+_INDEX_FILE = 'index.json'
+
+# the urls of the saved JSON in sample/sample_json
+SAMPLE_URLS = {
+    "https://tabs.ultimate-guitar.com/tab/beach-weather/chit-chat-chords-2421111": 'chit_chat',
+    "https://tabs.ultimate-guitar.com/tab/echosmith/bright-chords-1442936": 'bright',
+    ug_scraper.SAMPLE_SEARCH: 'chit_chat_search',
+}
+
+
+def page_from_json(data: dict) -> bytes:
+    """Builds an ultimate-guitar style html page around the JSON dict."""
+    data_content = html.escape(json.dumps(data), quote=True)
+    # the real pages have a large amount of markup and scripts around the js-store div
+    filler = '<script type="text/javascript">window.UGAPP = {};</script>\n' * 200
+    return (
+        '<!DOCTYPE html><html><head><title>Ultimate-Guitar</title>' + filler + '</head>'
+        + '<body><div id="root"></div>'
+        + f'<div class="js-store" data-content="{data_content}"></div>'
+        + filler + '</body></html>'
+    ).encode('utf-8')
+
+
+def load_sample_pages() -> "dict[str, bytes]":
+    """Returns pages built from the saved JSON in sample/sample_json, by sample name."""
+    pages = {}
+    for name in SAMPLE_URLS.values():
+        with open(f'sample/sample_json/{name}.json', 'r') as f:
+            pages[name] = page_from_json(json.load(f))
+    return pages
+
+
+def record(urls: "list[str]", path: str = FIXTURE_DIR) -> None:
+    """
+    Fetches the pages and saves them as fixtures, with their status codes,
+    so that unsuccessful pages (e.g. 404) are replayed too.
+    """
+    session = ug_scraper._get_session()
+    for url in urls:
+        page = session.get(url)
+        save_page(url, page.content, path, page.status_code)
+
+
+def build_from_samples(path: str = FIXTURE_DIR) -> None:
+    """Saves pages built from the saved JSON in sample/sample_json as fixtures for their urls."""
+    pages = load_sample_pages()
+    for url, name in SAMPLE_URLS.items():
+        save_page(url, pages[name], path)
+
+
+def save_page(url: str, content: bytes, path: str = FIXTURE_DIR, status: int = 200, headers: "dict[str, str]" = None) -> None:
+    """Saves the page as the fixture for the url, with the status and any extra headers to respond with."""
+    os.makedirs(path, exist_ok=True)
+    key = normalize_url(url)
+    file_name = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + '.html'
+    with open(os.path.join(path, file_name), 'wb') as f:
+        f.write(content)
+    index = _read_index(path)
+    index[key] = {"file": file_name, "status": status}
+    if headers:
+        index[key]["headers"] = headers
+    with open(os.path.join(path, _INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    A requests transport adapter which responds with the fixtures in a directory,
+    and with 404 for urls without a fixture.
+
+    Instance Variables:
+    - path:     str | the fixture directory
+    - latency:  float or callable or None
+                    | the seconds to wait before each response, to stand in for the network,
+                      or a function of the url returning them
+    """
+    def __init__(self, path: str = FIXTURE_DIR, latency=None):
+        super().__init__()
+        self._path: str = path
+        self._index: "dict[str, dict]" = _read_index(path)
+        self._latency = latency
+        self._requests: int = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        self._requests += 1
+        if self._latency is not None:
+            time.sleep(self._latency(request.url) if callable(self._latency) else self._latency)
+
+        fixture = self._index.get(normalize_url(request.url))
+        if fixture is None:
+            status, body = 404, b'<html><body>Not Found</body></html>'
+        else:
+            status = fixture["status"]
+            with open(os.path.join(self._path, fixture["file"]), 'rb') as f:
+                body = f.read()
+
+        response = requests.Response()
+        response.status_code = status
+        response.reason = http.HTTPStatus(status).phrase
+        response.headers = CaseInsensitiveDict({
+            "Content-Type": "text/html; charset=utf-8",
+            "Content-Length": str(len(body)),
+            **(fixture or {}).get("headers", {}),
+        })
+        response.raw = io.BytesIO(body)
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+    def get_requests(self) -> int:
+        """Returns the number of requests the adapter has responded to."""
+        return self._requests
+
+
+@contextlib.contextmanager
+def replay(path: str = FIXTURE_DIR, latency=None):
+    """
+    Replays the fixtures for every fetch of the scraper's pooled session,
+    for the duration of the with block.
+
+    Parameters:
+    - path:     the fixture directory
+    - latency:  the seconds to wait before each response, or a function of the url returning them
+
+    Returns:
+    - the ReplayAdapter
+    """
+    session = ug_scraper._get_session()
+    adapter = ReplayAdapter(path, latency)
+    old_adapters = dict(session.adapters)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    try:
+        yield adapter
+    finally:
+        session.adapters.clear()
+        session.adapters.update(old_adapters)
+
+
+def _read_index(path: str) -> "dict[str, dict]":
+    try:
+        with open(os.path.join(path, _INDEX_FILE), 'r') as f:
+            return json.load(f)
+    except OSError:
+        return {}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == 'record':
+        record(sys.argv[2:])
+    elif len(sys.argv) == 2 and sys.argv[1] == 'samples':
+        build_from_samples()
+    else:
+        print("usage: python ug_fixtures.py record <url> [<url> ...] | samples")
@@ -0,0 +1,246 @@
+"""
+A local inverted index of the tabs seen in the pages fetched from ultimate-guitar,
+so that searches which were already made can be answered without searching again.
+"""
+import os
+import re
+import json
+import time
+import threading
+import unicodedata
+import urllib.parse
+
+from ug_cache import url_kind
+
+# the fields of each indexed tab, in the layout of a search result (see ug_parser.slim)
+FIELDS = ('id', 'tab_url', 'artist_name', 'song_name', 'type', 'votes', 'rating', 'artist_url')
+_ID, _TAB_URL, _ARTIST, _SONG = 0, 1, 2, 3
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> "list[str]":
+    """Splits the text into case- and accent-folded words, e.g. `Beyoncé's` into `beyonce`, `s`."""
+    if text.isascii():
+        return _TOKEN.findall(text.lower())
+    decomposed = unicodedata.normalize('NFKD', text)
+    folded = ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+    return _TOKEN.findall(folded)
+
+
+class SearchIndex():
+    """
+    An inverted index from the words of the artist and song names to the tabs,
+    filled with every search result and tab in the pages the scraper fetches (see add_page),
+    and persisted to a file, by a background thread once started (see start),
+    so that the fetches which add to the index never wait for it to be written.
+
+    A search for an artist and song is answered from the index (see lookup)
+    only if the same words were searched on ultimate-guitar within max_age,
+    so its results are as complete as that search's were.
+    The searches older than max_age are dropped, as are the tabs least recently seen
+    once there are more than max_entries, so the index, and its file, stay bounded.
+
+    Instance Variables:
+    - path:             str or None | the file the index is saved to, None to only keep it in memory
+    - max_age:          float       | the seconds a search on ultimate-guitar answers the same search for
+    - max_entries:      int         | the number of tabs kept
+    - save_interval:    float       | the seconds between saves of the index, if it changed
+    """
+    def __init__(self, path: str = None, max_age: float = 7 * 24 * 60 * 60, max_entries: int = 100000, save_interval: float = 60):
+        assert max_entries > 0
+        self._path: str or None = path
+        self._max_age: float = max_age
+        self._max_entries: int = max_entries
+        self._save_interval: float = save_interval
+        # tab id -> the FIELDS of the tab, least recently seen first
+        self._entries: "dict[int, tuple]" = {}
+        # word -> the ids of the tabs with the word in their artist or song name
+        self._postings: "dict[str, set[int]]" = {}
+        # the sorted words of a search -> when it was searched on ultimate-guitar, oldest first
+        self._searched: "dict[tuple[str, ...], float]" = {}
+        self._lock = threading.RLock()
+        self._dirty: bool = False
+        self._stop = threading.Event()
+        self._saver: threading.Thread or None = None
+        self._hits: int = 0
+        self._misses: int = 0
+        if path is not None:
+            self.load()
+
+    def add_page(self, url: str, data: dict) -> None:
+        """Indexes the tabs in the JSON dict of a fetched page, and the search it answers, if any."""
+        try:
+            page_data: dict = data['store']['page']['data']
+        except (KeyError, TypeError):
+            return
+        results = []
+        for field in ('results', 'other_tabs'):
+            if type(page_data.get(field)) is list:
+                results += page_data[field]
+        if type(page_data.get('data')) is dict and type(page_data['data'].get('tabs')) is list:
+            results += page_data['data']['tabs']
+        if type(page_data.get('tab')) is dict:
+            results.append(page_data['tab'])
+
+        with self._lock:
+            self.add_results(results)
+            if url_kind(url) == "search":
+                query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+                if query.get('search_type') == ['title'] and query.get('value'):
+                    key = _search_key(query['value'][0])
+                    self._searched.pop(key, None)
+                    self._searched[key] = time.time()
+                    self._dirty = True
+                self._expire_searches()
+
+    def add_results(self, results: "list[dict]") -> None:
+        """Indexes the search results, or tabs, replacing the older entries of the same tabs."""
+        with self._lock:
+            for result in results:
+                if type(result) is not dict or 'id' not in result or 'song_name' not in result:
+                    continue
+                self._add_entry(tuple(result.get(field) for field in FIELDS))
+
+    def query(self, text: str) -> "list[dict]":
+        """Returns the indexed tabs with every word of the text in their artist or song name."""
+        words = set(tokenize(text))
+        if not words:
+            return []
+        with self._lock:
+            postings = sorted((self._postings.get(word, ()) for word in words), key=len)
+            ids = set(postings[0]).intersection(*postings[1:])
+            return [dict(zip(FIELDS, self._entries[i])) for i in ids]
+
+    def lookup(self, artist: str, song: str) -> dict or None:
+        """
+        Answers a search for the artist and song from the index.
+
+        Returns:
+        - the JSON dict of the search, in the layout of a search page,
+          or None if the search was not made on ultimate-guitar lately, or matched nothing
+        """
+        query = artist.strip() + " " + song.strip()
+        with self._lock:
+            searched_at = self._searched.get(_search_key(query))
+            results = self.query(query) if searched_at is not None and time.time() - searched_at <= self._max_age else []
+            if not results:
+                self._misses += 1
+                return None
+            self._hits += 1
+        return {"store": {"page": {"data": {"results": results}}}}
+
+    def start(self) -> None:
+        """Starts saving the index every save_interval in a background thread, if it has a file."""
+        if self._path is None or (self._saver is not None and self._saver.is_alive()):
+            return
+        self._stop.clear()
+        self._saver = threading.Thread(target=self._save_periodically, name="ug_index", daemon=True)
+        self._saver.start()
+
+    def stop(self) -> None:
+        """Stops the background saves, without saving the last changes (see save)."""
+        self._stop.set()
+        if self._saver is not None:
+            self._saver.join()
+            self._saver = None
+
+    def save(self) -> None:
+        """Writes the index to its file."""
+        if self._path is None:
+            return
+        with self._lock:
+            self._expire_searches()
+            state = {
+                "fields": FIELDS,
+                "entries": list(self._entries.values()),
+                "searched": [[list(key), searched_at] for key, searched_at in self._searched.items()],
+            }
+            self._dirty = False
+        tmp_path = f"{self._path}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(self._path) or '.', exist_ok=True)
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp_path, self._path)
+
+    def load(self) -> None:
+        """Reads the index from its file, if it has been saved."""
+        try:
+            with open(self._path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if tuple(state.get("fields", ())) != FIELDS:
+            return
+        with self._lock:
+            for entry in state["entries"]:
+                self._add_entry(tuple(entry))
+            for key, searched_at in sorted(state["searched"], key=lambda searched: searched[1]):
+                self._searched[tuple(key)] = searched_at
+            self._expire_searches()
+            self._dirty = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> "dict[str, int]":
+        """Returns the number of tabs, words and searches indexed, and the lookup hits and misses."""
+        return {
+            "tabs": len(self._entries),
+            "words": len(self._postings),
+            "searches": len(self._searched),
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+    def _add_entry(self, entry: tuple) -> None:
+        """Indexes the FIELDS of a tab, and drops the least recently seen tabs past max_entries, `_lock` must be held."""
+        old = self._entries.pop(entry[_ID], None)
+        self._entries[entry[_ID]] = entry
+        if old == entry:
+            return
+        if old is not None:
+            self._remove_postings(old)
+        for word in set(_entry_words(entry)):
+            self._postings.setdefault(word, set()).add(entry[_ID])
+        while len(self._entries) > self._max_entries:
+            self._remove_postings(self._entries.pop(next(iter(self._entries))))
+        self._dirty = True
+
+    def _remove_postings(self, entry: tuple) -> None:
+        """Removes the tab from the postings of its words, `_lock` must be held."""
+        for word in set(_entry_words(entry)):
+            ids = self._postings.get(word)
+            if ids is not None:
+                ids.discard(entry[_ID])
+                if not ids:
+                    del self._postings[word]
+
+    def _expire_searches(self) -> None:
+        """Drops the searches made more than max_age ago, `_lock` must be held."""
+        expired_at = time.time() - self._max_age
+        while self._searched:
+            key, searched_at = next(iter(self._searched.items()))
+            if searched_at >= expired_at:
+                break
+            del self._searched[key]
+            self._dirty = True
+
+    def _save_periodically(self) -> None:
+        """Saves the index every save_interval if it changed, until stopped."""
+        while not self._stop.wait(self._save_interval):
+            if self._dirty:
+                try:
+                    self.save()
+                except OSError:
+                    # e.g. the disk is full, the changes are saved with the next ones
+                    self._dirty = True
+
+
+def _entry_words(entry: tuple) -> "list[str]":
+    return tokenize(entry[_ARTIST] or '') + tokenize(entry[_SONG] or '')
+
+
+def _search_key(query: str) -> "tuple[str, ...]":
+    """Returns the key of a search, the same for searches with the same words."""
+    return tuple(sorted(set(tokenize(query))))
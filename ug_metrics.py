@@ -0,0 +1,271 @@
+"""
+Latency histograms, counters and gauges for the hot path of the bot,
+labelled by the command being handled, and rendered for the
+/metrics (Prometheus) and /stats (JSON) routes of server.py.
+
+Metrics are off until enable() is called; when off, timer() returns
+a shared no-op context manager and observe()/inc() return immediately.
+"""
+import time
+import bisect
+import functools
+import threading
+import contextlib
+import contextvars
+
+# upper bounds of the latency buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled: bool = False
+_lock = threading.Lock()
+_command: "contextvars.ContextVar[str]" = contextvars.ContextVar('ug_command', default='')
+
+# (name, labels) -> metric
+_histograms: "dict[tuple, Histogram]" = {}
+_counters: "dict[tuple, float]" = {}
+_gauges: "dict[tuple, float]" = {}
+# name -> function returning a dict of gauges, e.g. the cache stats
+_collectors: "dict[str, object]" = {}
+
+_NOOP = contextlib.nullcontext()
+
+
+class Histogram():
+    """
+    A latency histogram with fixed buckets.
+
+    Instance Variables:
+    - counts:   list[int] | the number of observations in each bucket, the last is +Inf
+    - sum:      float     | the sum of the observations, in seconds
+    - count:    int       | the number of observations
+    """
+    __slots__ = ('_counts', '_sum', '_count')
+
+    def __init__(self):
+        self._counts: "list[int]" = [0] * (len(BUCKETS) + 1)
+        self._sum: float = 0.0
+        self._count: int = 0
+
+    def observe(self, seconds: float) -> None:
+        self._counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self._sum += seconds
+        self._count += 1
+
+    def get_counts(self) -> "list[int]":
+        return self._counts
+
+    def get_sum(self) -> float:
+        return self._sum
+
+    def get_count(self) -> int:
+        return self._count
+
+    def get_percentile(self, p: float) -> float:
+        """
+        Returns the upper bound of the bucket holding the p-th percentile, in seconds,
+        or the last finite bound if it is in the +Inf bucket, as Prometheus' histogram_quantile does,
+        so that it can be written as JSON.
+        """
+        rank = p / 100 * self._count
+        seen = 0
+        for i, n in enumerate(self._counts):
+            seen += n
+            if seen >= rank and n:
+                return BUCKETS[min(i, len(BUCKETS) - 1)]
+        return 0.0
+
+
+def enable(on: bool = True) -> None:
+    """Turns the metrics on, or off."""
+    global _enabled
+    _enabled = on
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    """Clears all of the metrics."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+@contextlib.contextmanager
+def command_scope(command: str):
+    """
+    Labels the metrics recorded in the with block (and in the tasks and
+    scraper threads it starts) with the command, and counts the command.
+    """
+    token = _command.set(command)
+    try:
+        inc("commands")
+        yield
+    finally:
+        _command.reset(token)
+
+
+def timer(name: str, **labels):
+    """Returns a context manager which observes the time spent in its with block."""
+    if not _enabled:
+        return _NOOP
+    return _Timer(name, labels)
+
+
+def timed(name: str):
+    """A decorator which observes the time spent in the function."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Adds a latency observation, in seconds, to the histogram."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+def inc(name: str, n: float = 1, **labels) -> None:
+    """Increments the counter."""
+    if not _enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    """Sets the gauge, which is not labelled with the command."""
+    if not _enabled:
+        return
+    with _lock:
+        _gauges[(name, tuple(sorted(labels.items())))] = value
+
+
+def register_collector(name: str, collect) -> None:
+    """
+    Registers a function returning a dict of numbers,
+    which are reported as gauges named `<name>_<key>` when the metrics are rendered.
+    """
+    _collectors[name] = collect
+
+
+def render_prometheus() -> str:
+    """Renders the metrics in the Prometheus text format."""
+    lines = []
+    with _lock:
+        histograms = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+        gauges = sorted(_gauges.items())
+
+    typed = set()
+    for (name, labels), h in histograms:
+        metric = f"ug_{name}_seconds"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} histogram")
+            typed.add(metric)
+        cumulative = 0
+        for bound, n in zip(BUCKETS + (float('inf'),), h.get_counts()):
+            cumulative += n
+            le = "+Inf" if bound == float('inf') else repr(bound)
+            lines.append(f"{metric}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+        lines.append(f"{metric}_sum{_labels(labels)} {h.get_sum()}")
+        lines.append(f"{metric}_count{_labels(labels)} {h.get_count()}")
+
+    for (name, labels), value in counters:
+        metric = f"ug_{name}_total"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} counter")
+            typed.add(metric)
+        lines.append(f"{metric}{_labels(labels)} {value}")
+
+    for (name, labels), value in gauges + _collected():
+        metric = f"ug_{name}"
+        if metric not in typed:
+            lines.append(f"# TYPE {metric} gauge")
+            typed.add(metric)
+        lines.append(f"{metric}{_labels(labels)} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+def snapshot() -> dict:
+    """Returns the metrics as a JSON-compatible dict, with the latencies in milliseconds."""
+    stats = {"enabled": _enabled, "latency_ms": {}, "counters": {}, "gauges": {}}
+    with _lock:
+        for (name, labels), h in _histograms.items():
+            command = dict(labels).get("command") or "-"
+            other_labels = tuple(label for label in labels if label[0] != "command")
+            stats["latency_ms"].setdefault(command, {})[_flat_name(name, other_labels)] = {
+                "count": h.get_count(),
+                "mean": h.get_sum() / h.get_count() * 1000 if h.get_count() else 0.0,
+                "p50": h.get_percentile(50) * 1000,
+                "p95": h.get_percentile(95) * 1000,
+            }
+        for (name, labels), value in _counters.items():
+            stats["counters"][_flat_name(name, labels)] = value
+        for (name, labels), value in _gauges.items():
+            stats["gauges"][_flat_name(name, labels)] = value
+    for (name, labels), value in _collected():
+        stats["gauges"][_flat_name(name, labels)] = value
+    return stats
+
+
+class _Timer():
+    __slots__ = ('_name', '_labels', '_start')
+
+    def __init__(self, name: str, labels: dict):
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self._name, time.perf_counter() - self._start, **self._labels)
+        return False
+
+
+def _key(name: str, labels: dict) -> tuple:
+    """Returns the key of the metric, labelled with the current command."""
+    command = _command.get()
+    if command:
+        labels = dict(labels, command=command)
+    return (name, tuple(sorted(labels.items())))
+
+
+def _collected() -> "list[tuple]":
+    """Returns the gauges of the registered collectors."""
+    gauges = []
+    for collector, collect in list(_collectors.items()):
+        try:
+            values = collect()
+        except Exception:
+            continue
+        for key, value in values.items():
+            gauges.append(((f"{collector}_{key}", ()), value))
+    return gauges
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels) + '}'
+
+
+def _flat_name(name: str, labels: tuple) -> str:
+    return name + _labels(labels)
@@ -1,4 +1,99 @@
-class UGTabInfo():
+import re
+import sys
+import heapq
+import bisect
+
+import ug_rank
+import ug_metrics
+
+
+class _Record():
+    """
+    The base of the parsed objects, which are slot-based
+    so that many of them can be kept in a cache,
+    and which pickle as a flat tuple of their fields.
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return (_restore_record, (type(self), tuple(getattr(self, name, None) for name in _record_fields(type(self)))))
+
+
+_record_fields_cache: "dict[type, tuple[str, ...]]" = {}
+
+def _record_fields(cls: type) -> "tuple[str, ...]":
+    """Returns the slot names of a _Record class, including the inherited ones."""
+    fields = _record_fields_cache.get(cls)
+    if fields is None:
+        fields = tuple(name for c in reversed(cls.__mro__) for name in c.__dict__.get('__slots__', ()))
+        _record_fields_cache[cls] = fields
+    return fields
+
+def _restore_record(cls: type, values: tuple) -> _Record:
+    """Rebuilds a _Record from its fields, without the original page dict."""
+    record = cls.__new__(cls)
+    for name, value in zip(_record_fields(cls), values):
+        setattr(record, name, value)
+    return record
+
+
+# the fields of a tab, and of a search result, read by the parser
+_TAB_FIELDS = ('id', 'type', 'tab_url', 'artist_name', 'song_name', 'votes', 'rating')
+_RESULT_FIELDS = ('id', 'tab_url', 'artist_name', 'song_name', 'type', 'votes', 'rating', 'artist_url')
+
+# the characters of a page of tab content, which fits in an embed with its code block
+PAGE_CHARS = 4000
+
+
+def slim(data: dict) -> dict:
+    """
+    Returns a copy of the JSON dict of an ultimate-guitar page with only the fields
+    read by the parser, without the site config, ads, comments, etc. of the store.
+    The copy keeps the layout of the page, so the parser objects can be built from either.
+
+    Parameters:
+    - data: the JSON dict of a tab, search, explore or artist page
+
+    Returns:
+    - the slim JSON dict, or the dict itself if it is not the JSON of a page
+    """
+    try:
+        page_data: dict = data['store']['page']['data']
+    except (KeyError, TypeError):
+        return data
+
+    slim_data = {}
+    if 'tab' in page_data:
+        slim_data['tab'] = _pick(page_data['tab'], _TAB_FIELDS)
+    if 'tab_view' in page_data:
+        tab_view = page_data['tab_view']
+        slim_view = slim_data['tab_view'] = {}
+        if 'meta' in tab_view:
+            slim_view['meta'] = tab_view['meta']
+        if 'wiki_tab' in tab_view:
+            slim_view['wiki_tab'] = _pick(tab_view['wiki_tab'], ('content',))
+    for results_field in ('results', 'other_tabs'):
+        if results_field in page_data:
+            slim_data[results_field] = _pick_results(page_data[results_field])
+    if 'data' in page_data and type(page_data['data']) is dict and 'tabs' in page_data['data']:
+        slim_data['data'] = {'tabs': _pick_results(page_data['data']['tabs'])}
+    return {'store': {'page': {'data': slim_data}}}
+
+
+def _pick(data: dict, fields: "tuple[str, ...]") -> dict:
+    """Returns the fields of the dict which it has."""
+    if type(data) is not dict:
+        return data
+    return {field: data[field] for field in fields if field in data}
+
+
+def _pick_results(results: "list[dict]") -> "list[dict]":
+    if type(results) is not list:
+        return results
+    return [_pick(r, _RESULT_FIELDS) for r in results]
+
+
+class UGTabInfo(_Record):
     """
     An Ultimate-Guitar Tab Info object, which defines
     all of the metadata for a tab.
@@ -20,6 +115,7 @@ class UGTabInfo():
                         capo settings could sometimes be included in the tab contents,
                         otherwise, if None, it could be assumed to be 0
     """
+    __slots__ = ('_tab_id', '_type', '_tab_url', '_artist', '_song', '_tuning', '_key', '_capo')
 
     def __init__(self, data: dict):
         tab_info: dict = data['store']['page']['data']['tab']
@@ -60,7 +156,7 @@ class UGTabInfo():
         return self._capo
 
 
-class UGTab():
+class UGTab(_Record):
     """
     An Ultimate-Guitar Tab object, which defines
     the tab info and metadata, and the tab contents.
@@ -68,11 +164,18 @@ class UGTab():
     Instance Variables:
     - info:     UGTabInfo | the tab info and metadata, in a UGTabInfo object
     - content:  str       | the tab content, which includes the formatted chords and lyrics
+    - pages:    dict[tuple[int, int], list[int]] or None
+                          | the page offsets of the content (see paginate),
+                            by page size and transposition, once asked for
     """
     # TODO: add version description
+    __slots__ = ('_info', '_content', '_pages')
+
+    @ug_metrics.timed("parse_tab")
     def __init__(self, data: dict):
         self._info: UGTabInfo = UGTabInfo(data)
         self._content: str = self._format_content(data['store']['page']['data']['tab_view']['wiki_tab']['content'])
+        self._pages: "dict[tuple[int, int], list[int]] or None" = None
         
     
     def _format_content(self, content: str, fchords: bool = True) -> str:
@@ -86,6 +189,31 @@ class UGTab():
 
     def get_content(self) -> str:
         return self._content
+
+    def get_transposition(self) -> int:
+        return 0
+
+    def get_page_offsets(self, max_chars: int = PAGE_CHARS) -> "list[int]":
+        """
+        Returns the offsets in the content where each page starts, followed by
+        the length of the content (see paginate).
+        They are found once per page size and transposition, and kept with the tab.
+        """
+        key = (max_chars, self.get_transposition())
+        if self._pages is None:
+            self._pages = {}
+        offsets = self._pages.get(key)
+        if offsets is None:
+            offsets = self._pages[key] = paginate(self.get_content(), max_chars)
+        return offsets
+
+    def get_page_count(self, max_chars: int = PAGE_CHARS) -> int:
+        return len(self.get_page_offsets(max_chars)) - 1
+
+    def get_page(self, page: int, max_chars: int = PAGE_CHARS) -> str:
+        """Returns the content of the page, counted from 0."""
+        offsets = self.get_page_offsets(max_chars)
+        return self.get_content()[offsets[page]:offsets[page+1]]
     
     def write_content_to_file(self, path: str):
         f = open(path, 'w')
@@ -137,13 +265,17 @@ class UGChords(UGTab):
     Inherits from UGTab.
 
     Class Variables:
-    - tonalities          | The available chord names
+    - tonalities          | The available chord names, with flats
+    - sharp_tonalities    | The available chord names, with sharps
 
     Instance Variables:
     - content_with_chords | The content still with '[ch]' and '[/ch]' surrounding the chords
     - transposition       | The integer by which the song's chords will be transposed
     """
     tonalities = ["A","Bb","B","C","Db","D","Eb","E","F","Gb","G","Ab"]
+    sharp_tonalities = ["A","A#","B","C","C#","D","D#","E","F","F#","G","G#"]
+
+    __slots__ = ('_content_with_chords', '_transposition', '_tokens', '_sharps', '_keys')
 
     # keys = {
     #     'Ab': ['Ab','Bb','C','Db','Eb','F','G'],
@@ -160,52 +292,96 @@ class UGChords(UGTab):
     #     'G': ['G','A','B','C','D','E','F#'],
     # }
 
+    @ug_metrics.timed("parse_chords")
     def __init__(self, data: dict):
         self._info: UGTabInfo = UGTabInfo(data)
         self._content_with_chords: str = self._format_content(data['store']['page']['data']['tab_view']['wiki_tab']['content'], fchords=False)
-        self._content: str = self._format_content(self._content_with_chords)
-        self._chords_og: list[str] = list(data['store']['page']['data']['tab_view']['applicature'].keys())
+        # formatted on the first get_content()
+        self._content: str or None = None
         self._transposition: int = 0
-    
+        # split into chords and text on the first transpose()
+        self._tokens: "list[str] or None" = None
+        self._sharps: bool = False
+        # the chords in every key, by materialize_keys()
+        self._keys: "list[list[str]] or None" = None
+        self._pages: "dict[tuple[int, int], list[int]] or None" = None
+    
+    @ug_metrics.timed("transpose")
     def transpose(self, transposition: int = 0) -> None:
+        """
+        Transposes the chords of the content by a number of semitones.
+        The content is only split into chords and text the first time,
+        each transposition is then one pass over the split content,
+        with no transposing if all of the keys were built by materialize_keys().
+        """
         self._transposition = transposition%12
         if self._transposition == 0:
-            self._content_with_chords: str = self._format_content(self._content_with_chords, fchords=True)
-            return
-        #FIXME: How to deal with sharps / flats
-        content = self._content_with_chords
-        for c in self._chords_og:
-            new_chord = c
-            slash_i = new_chord.find('/')
-            if slash_i != -1:
-                try:
-                    new_chord = UGChords.tonalities[(UGChords.tonalities.index(c[:slash_i][:2])+self._transposition)%12] \
-                        + c[2:slash_i] \
-                        + UGChords.tonalities[(UGChords.tonalities.index(c[slash_i+1:])+self._transposition)%12]
-                except ValueError:
-                    try:
-                        new_chord = UGChords.tonalities[(UGChords.tonalities.index(c[:slash_i][0])+self._transposition)%12] \
-                            + c[1:slash_i] \
-                            + UGChords.tonalities[(UGChords.tonalities.index(c[slash_i+1:])+self._transposition)%12]
-                    except ValueError:
-                        pass
-            else:
-                try:
-                    new_chord = UGChords.tonalities[(UGChords.tonalities.index(c[:2])+self._transposition)%12] \
-                        + c[2:]
-                except ValueError:
-                    try:
-                        new_chord = UGChords.tonalities[(UGChords.tonalities.index(c[0])+self._transposition)%12] \
-                            + c[1:]
-                    except ValueError:
-                        pass
-            content = content.replace(
-                f"[ch]{c}[/ch]",
-                new_chord
-            )
-            
-        self._content = content
+            # formatted from the original content on the next get_content()
+            self._content = None
+        else:
+            self._content = ''.join(self._transposed_parts(self._transposition))
+
+    def materialize_keys(self) -> None:
+        """
+        Transposes the chords to all 12 keys at once and keeps them,
+        so that switching keys with transpose() only joins the content of the key.
+        Only the chords are kept for each key, the text between them is shared by every key.
+        """
+        if self._keys is None:
+            tokens = self._get_tokens()
+            self._keys = [tokens[1::2]] + [self._transposed_chords(t) for t in range(1, 12)]
+
+    def drop_keys(self) -> None:
+        """Frees the keys built by materialize_keys()."""
+        self._keys = None
 
+    def has_keys(self) -> bool:
+        return self._keys is not None
+
+    def get_keys_nbytes(self) -> int:
+        """Returns the approximate memory used by the keys built by materialize_keys(), in bytes."""
+        if self._keys is None:
+            return 0
+        shared = {id(t) for t in self._get_tokens()}
+        chords = {id(c): c for key in self._keys for c in key if id(c) not in shared}
+        return sys.getsizeof(self._keys) + sum(sys.getsizeof(key) for key in self._keys) \
+            + sum(sys.getsizeof(c) for c in chords.values())
+
+    def _transposed_parts(self, transposition: int) -> "list[str]":
+        """Returns the split content with the chords transposed, sharing the text with the split content."""
+        tokens = self._get_tokens()
+        parts = tokens[:]
+        if transposition != 0:
+            parts[1::2] = self._keys[transposition] if self._keys is not None else self._transposed_chords(transposition)
+        return parts
+
+    def _transposed_chords(self, transposition: int) -> "list[str]":
+        """Returns the chords of the split content transposed, each distinct chord transposed once."""
+        chords = self._get_tokens()[1::2]
+        names = UGChords.sharp_tonalities if self._sharps else UGChords.tonalities
+        transposed = {c: _transpose_chord(c, transposition, names) for c in set(chords)}
+        return [transposed[c] for c in chords]
+
+    def _get_tokens(self) -> "list[str]":
+        """
+        Returns the content split into text and chords,
+        the text at the even indexes and the chords at the odd indexes.
+        """
+        if self._tokens is None:
+            self._tokens = _CHORD_MARKUP.split(self._content_with_chords)
+            # chords are written with the more common accidental of the tab
+            sharps = flats = 0
+            for c in self._tokens[1::2]:
+                for note in c.split('/', 1):
+                    sharps += note[1:2] == '#'
+                    flats += note[1:2] == 'b'
+            self._sharps = sharps > flats
+        return self._tokens
+
+    def get_content(self) -> str:
+        if self._content is None:
+            self._content = self._format_content(self._content_with_chords)
+        return self._content
 
     def get_transposition(self) -> int:
         return self._transposition
@@ -215,7 +391,105 @@ class UGChords(UGTab):
 
 
 
-class UGSearchResult():
+_CHORD_MARKUP = re.compile(r'\[ch\](.*?)\[/ch\]', re.S)
+
+# the semitones above A of every note name
+_NOTE_SEMITONES = {
+    "A": 0, "A#": 1, "Bb": 1, "B": 2, "B#": 3, "Cb": 2, "C": 3, "C#": 4, "Db": 4,
+    "D": 5, "D#": 6, "Eb": 6, "E": 7, "E#": 8, "Fb": 7, "F": 8, "F#": 9, "Gb": 9,
+    "G": 10, "G#": 11, "Ab": 11,
+}
+
+def _transpose_note(note: str, transposition: int, names: "list[str]") -> str:
+    """Transposes the note name at the start of the string, and keeps the rest (e.g. `m7`)."""
+    for length in (2, 1):
+        semitones = _NOTE_SEMITONES.get(note[:length])
+        if semitones is not None:
+            return names[(semitones+transposition)%12] + note[length:]
+    return note
+
+def _transpose_chord(chord: str, transposition: int, names: "list[str]") -> str:
+    """Transposes the root of the chord, and the bass note of a slash chord."""
+    slash_i = chord.find('/')
+    if slash_i == -1:
+        return _transpose_note(chord, transposition, names)
+    return _transpose_note(chord[:slash_i], transposition, names) + '/' \
+        + _transpose_note(chord[slash_i+1:], transposition, names)
+
+
+_CHORD_TOKEN = re.compile(r'\(?[A-G][#b]?(?:maj|min|dim|aug|sus|add|m|M)?[0-9]*(?:(?:sus|add|b|#|\+|-)[0-9]*)*(?:/[A-G][#b]?)?\)?')
+_CHORD_LINE_EXTRA = re.compile(r'\||-+|x[0-9]+|N\.?C\.?')
+_STAFF_LINE = re.compile(r'\s*[A-Ga-g][#b]?\s*\|')
+
+def _is_chord_line(line: str) -> bool:
+    """Returns whether the line only has chords, e.g. `Am   G/B  | x2`."""
+    has_chord = False
+    for token in line.split():
+        if _CHORD_TOKEN.fullmatch(token):
+            has_chord = True
+        elif not _CHORD_LINE_EXTRA.fullmatch(token):
+            return False
+    return has_chord
+
+def paginate(content: str, max_chars: int = PAGE_CHARS) -> "list[int]":
+    """
+    Splits the content into pages of at most max_chars, on line boundaries.
+    A page ends at a section (a blank line, or a header like `[Chorus]`) if one
+    is past half of the page, and never between a chord line and the line under it,
+    or inside the lines of a tab staff.
+    Lines longer than a page are split at max_chars.
+
+    Returns:
+    - the offset where each page starts, followed by the length of the content,
+      so page i is content[offsets[i]:offsets[i+1]]
+    """
+    length = len(content)
+    if length <= max_chars:
+        return [0, length]
+
+    # the offsets of the lines a page may start at, and of those which start a section
+    breaks = []
+    sections = []
+    glued = blank = False
+    start = 0
+    while start < length:
+        end = content.find('\n', start)
+        end = length if end == -1 else end + 1
+        line = content[start:end]
+        is_blank = not line.strip()
+        if start > 0 and (is_blank or not glued):
+            breaks.append(start)
+            if is_blank or blank or line.lstrip().startswith('['):
+                sections.append(start)
+        # a chord line is kept with the line under it, and a staff line with the next one
+        glued = not is_blank and (_STAFF_LINE.match(line) is not None or _is_chord_line(line))
+        blank = is_blank
+        start = end
+
+    offsets = [0]
+    page_start = 0
+    while length - page_start > max_chars:
+        limit = page_start + max_chars
+        cut = _last_at_most(sections, limit)
+        if cut - page_start < max_chars // 2:
+            cut = _last_at_most(breaks, limit)
+        if cut <= page_start:
+            # one chord and lyric pair, or staff, longer than a page
+            cut = content.rfind('\n', page_start, limit) + 1
+            if cut <= page_start:
+                cut = limit
+        offsets.append(cut)
+        page_start = cut
+    offsets.append(length)
+    return offsets
+
+def _last_at_most(offsets: "list[int]", limit: int) -> int:
+    """Returns the last of the sorted offsets which is at most limit, or -1."""
+    i = bisect.bisect_right(offsets, limit)
+    return offsets[i-1] if i else -1
+
+
+class UGSearchResult(_Record):
     """
     An Ultimate-Guitar Search Result object, 
     which defines all of the metadata for a search result;
@@ -228,7 +502,11 @@ class UGSearchResult():
     - type:     str   | could be Chords or Tab
     - votes:    int   | the number of votes for the tab
     - rating:   float | the rating for the tab, out of 5
+    - score:    float | the score of the result by the ranker of its search (see ug_rank),
+                        its votes until it is scored
     """
+    __slots__ = ('_tab_id', '_tab_url', '_artist', '_song', '_type', '_votes', '_rating', '_score')
+
     def __init__(self, data: dict):
         self._tab_id: int = data['id']
         self._tab_url: str = data['tab_url']
@@ -237,6 +515,7 @@ class UGSearchResult():
         self._type: str = data['type']
         self._votes: int = data['votes']
         self._rating: float = data['rating']
+        self._score: float = self._votes
     
     def get_tab_id(self) -> str:
         return self._tab_id
@@ -259,6 +538,9 @@ class UGSearchResult():
     def get_rating(self) -> float:
         return self._rating
 
+    def get_score(self) -> float:
+        return self._score
+
     def get_formatted_result_description(self) -> str:
         # TODO: add version description
         return f"**Rating:** `{self._rating}`\n" \
@@ -267,7 +549,9 @@ class UGSearchResult():
                 + f"**Link**\n{self._tab_url}"
     
 
-class UGArtist():
+class UGArtist(_Record):
+    __slots__ = ('_artist', '_artist_url')
+
     def __init__(self, data: dict):
         self._artist: str = data['artist_name']
         self._artist_url: str = data['artist_url']
@@ -282,82 +566,112 @@ class UGArtist():
         return f"**Link**\n{'https://www.ultimate-guitar.com' + self._artist_url}"
 
 
-class UGSearch():
+class UGSearch(_Record):
     """
     An Ultimate-Guitar Search object,
     which parses the search results from a JSON,
     and can return the Chords results or Tabs results.
+    The results are parsed, scored by the ranker and grouped by type once,
+    and each group is ranked the first time it is asked for.
 
     Instance Variables:
-    - raw_results:  list[dict]  | the search results as a list of results with data
+    - results:  dict[str, list[UGSearchResult]]
+                            | the Chords and Tabs results, in page order,
+                              grouped by type, and all together under "all"
+    - artists:  list[UGArtist] | the artist results, in page order
+    - ranker:   str            | the name of the ranker the results are scored by (see ug_rank)
     """
-    # TODO: maybe look into https://stats.stackexchange.com/questions/6418/rating-system-taking-account-of-number-of-votes
-    sort_key = lambda x: x.get_votes()
+    sort_key = lambda x: x.get_score()
 
-    def __init__(self, data: dict):
+    __slots__ = ('_results', '_artists', '_ranked', '_ranker')
+
+    @ug_metrics.timed("parse_search")
+    def __init__(self, data: dict, ranker: str = ug_rank.DEFAULT_RANKER):
         try:
-            self._raw_results: list[dict] = data["store"]["page"]["data"]["results"]
+            raw_results: list[dict] = data["store"]["page"]["data"]["results"]
         except KeyError:
-            self._raw_results: list[dict] = data["store"]["page"]["data"]["other_tabs"]
+            raw_results: list[dict] = data["store"]["page"]["data"]["other_tabs"]
+        self._index(raw_results, ranker)
 
-    def get_results(self, num: int) -> "list[UGSearchResult]":
-        """
-        Returns a list of search results.
-        Currently sorts the results by highest number of votes.
-        """
-        assert num > 0
-        s_r = []
-        for r in self._raw_results:
+    def get_ranker(self) -> str:
+        return self._ranker
+
+    def _index(self, raw_results: "list[dict]", ranker: str) -> None:
+        """Parses the raw results and groups them by type, in one pass, then scores them."""
+        self._results: "dict[str, list[UGSearchResult]]" = {"all": [], "Chords": [], "Tabs": []}
+        self._artists: "list[UGArtist]" = []
+        # the ranked results for each group; may only hold the top results
+        # until more are asked for
+        self._ranked: "dict[str, list[UGSearchResult]]" = {}
+        for r in raw_results:
             try:
                 if r['type'] == "Chords" or r['type'] == "Tabs":
-                    s_r.append(UGSearchResult(r))
+                    result = UGSearchResult(r)
+                    self._results["all"].append(result)
+                    self._results[r['type']].append(result)
+            except KeyError:
+                pass
+            try:
+                self._artists.append(UGArtist(r))
             except KeyError:
                 pass
-        s_r.sort(reverse=True, key=UGSearch.sort_key)
-        return s_r[:num]
 
-    def get_chords_results(self, num: int) -> "list[UGSearchResult]": 
+        self._ranker: str = ranker
+        results = self._results["all"]
+        if ranker != "votes":
+            scores = ug_rank.score(ranker, [r._votes for r in results], [r._rating for r in results])
+            for result, score in zip(results, scores):
+                result._score = score
+
+    def _top(self, group: str, num: int, start: int) -> "list[UGSearchResult]":
+        """Returns the results ranked start to start+num of the group."""
+        assert num > 0 and start >= 0
+        results = self._results[group]
+        ranked = self._ranked.get(group)
+        end = start + num
+        if ranked is None or (len(ranked) < end and len(ranked) < len(results)):
+            if end * 4 < len(results):
+                # only the top results are needed, so a heap selection is cheaper than sorting
+                ranked = heapq.nlargest(end, results, key=UGSearch.sort_key)
+            else:
+                ranked = sorted(results, reverse=True, key=UGSearch.sort_key)
+            self._ranked[group] = ranked
+        return ranked[start:end]
+
+    def get_results(self, num: int, start: int = 0) -> "list[UGSearchResult]":
+        """
+        Returns a list of search results.
+        Sorts the results by highest score of the ranker.
+        Skips the first `start` results, for pagination.
+        """
+        return self._top("all", num, start)
+
+    def get_chords_results(self, num: int, start: int = 0) -> "list[UGSearchResult]": 
         """
         Returns a list of search results that are for Chords type results.
-        Currently sorts the results by highest number of votes.
+        Sorts the results by highest score of the ranker.
+        Skips the first `start` results, for pagination.
         """
-        assert num > 0
-        ch_r = []
-        for r in self._raw_results:
-            try:
-                if r['type'] == "Chords":
-                    ch_r.append(UGSearchResult(r))
-            except KeyError:
-                pass
-        ch_r.sort(reverse=True, key=UGSearch.sort_key)
-        return ch_r[:num]
+        return self._top("Chords", num, start)
     
-    def get_tabs_results(self, num: int) -> "list[UGSearchResult]":
+    def get_tabs_results(self, num: int, start: int = 0) -> "list[UGSearchResult]":
         """
         Returns a list of search results that are for Tabs type results.
-        Currently sorts the results by highest number of votes.
+        Sorts the results by highest score of the ranker.
+        Skips the first `start` results, for pagination.
         """
-        assert num > 0
-        t_r = []
-        for r in self._raw_results:
-            try:
-                if r['type'] == "Tabs":
-                    t_r.append(UGSearchResult(r))
-            except KeyError:
-                pass
-        t_r.sort(reverse=True, key=UGSearch.sort_key)
-        return t_r[:num]
+        return self._top("Tabs", num, start)
     
     def get_artists_results(self, num: int) -> "list[UGArtist]":
         """
         Returns a list of artist results.
         """
         assert num > 0
-        a_r = []
-        for r in self._raw_results:
-            a_r.append(UGArtist(r))
-        return a_r[:num]
+        return self._artists[:num]
     
 class UGExplore(UGSearch): #TODO: still sorts by votes, turn sorting off
-    def __init__(self, data: dict):
-        self._raw_results: list[dict] = data["store"]["page"]["data"]["data"]["tabs"]
\ No newline at end of file
+    __slots__ = ()
+
+    @ug_metrics.timed("parse_search")
+    def __init__(self, data: dict, ranker: str = ug_rank.DEFAULT_RANKER):
+        self._index(data["store"]["page"]["data"]["data"]["tabs"], ranker)
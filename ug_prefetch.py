@@ -0,0 +1,216 @@
+"""
+Fetches made ahead of, or alongside, the ones the commands wait on,
+so that commands can be answered without waiting on ultimate-guitar.
+Every speculative fetch made here has the BACKGROUND priority
+(see ug_concurrency.priority), so the commands' own fetches are started ahead of them.
+"""
+import time
+import asyncio
+import functools
+
+import ug_metrics
+from ug_concurrency import priority, hedged, BACKGROUND
+from ug_scraper import EXPLORE_OPTIONS, async_json_from_explore, async_json_from_url, async_json_from_urls, promote, explore_url, get_stored_at
+from ug_parser import UGExplore, UGTab, UGSearchResult
+
+# the seconds before the second best result's tab is fetched too, see fetch_top_tab
+HEDGE_AFTER = 0.75
+# the seconds the best result's tab is waited for, once the second best one has arrived
+ACCEPT_AFTER = 1.5
+
+
+class ExploreRefresher():
+    """
+    Periodically fetches the four explore listings, and the top tabs of each,
+    and keeps them parsed, so that /explore and its Display button
+    are answered from memory.
+    A listing, and its tabs, are kept until they are refreshed, or until
+    they are older than max_age, e.g. while ultimate-guitar is down.
+    Every refresh fetches the pages again, even if they are cached,
+    and their age is the age of their cached entries, so that the expired
+    entries returned while ultimate-guitar is down are not served as fresh.
+
+    Instance Variables:
+    - interval: float | the seconds between refreshes
+    - top:      int   | the number of top results of each listing whose tabs are kept
+    - max_age:  float | the seconds a listing and its tabs are served for after being fetched
+    """
+    def __init__(self, interval: float = 5 * 60, top: int = 10, max_age: float = None):
+        self._interval: float = interval
+        self._top: int = top
+        self._max_age: float = max_age if max_age is not None else 3 * interval
+        # explore option -> (fetched at, listing)
+        self._explores: "dict[str, tuple[float, UGExplore]]" = {}
+        # tab url -> (fetched at, tab)
+        self._tabs: "dict[str, tuple[float, UGTab]]" = {}
+        self._task: asyncio.Task or None = None
+
+    def start(self) -> None:
+        """Starts refreshing in the background, on the running event loop."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run(self) -> None:
+        """Refreshes every interval, until cancelled."""
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self._interval)
+
+    async def refresh(self) -> None:
+        """Fetches the explore listings and their top tabs, keeping the old ones if a fetch fails."""
+        with priority(BACKGROUND), ug_metrics.timer("refresh"):
+            urls = set()
+            for option in EXPLORE_OPTIONS.values():
+                try:
+                    explore = UGExplore(await async_json_from_explore(option, refresh=True))
+                except Exception:
+                    ug_metrics.inc("refresh_errors")
+                    continue
+                self._explores[option] = (_fetched_at(explore_url(option)), explore)
+                urls.update(result.get_tab_url() for result in explore.get_results(self._top))
+
+            # each tab is kept as soon as it is fetched
+            async for url, data, error in async_json_from_urls(urls, refresh=True):
+                if error is None:
+                    try:
+                        tab = UGTab(data)
+                    except Exception as e:
+                        error = e
+                if error is not None:
+                    ug_metrics.inc("refresh_errors")
+                    continue
+                self._tabs[url] = (_fetched_at(url), tab)
+            # the tabs which dropped out of every listing
+            for url in [url for url, (fetched_at, _) in self._tabs.items() if url not in urls and self._is_old(fetched_at)]:
+                del self._tabs[url]
+
+    def get_explore(self, option: str) -> UGExplore or None:
+        """Returns the listing of the explore option, or None if it has not been refreshed lately."""
+        entry = self._explores.get(option)
+        if entry is None or self._is_old(entry[0]):
+            return None
+        ug_metrics.inc("refresh_hits")
+        return entry[1]
+
+    def get_tab(self, url: str) -> UGTab or None:
+        """Returns the tab of a listing's top result, or None if it has not been refreshed lately."""
+        entry = self._tabs.get(url)
+        if entry is None or self._is_old(entry[0]):
+            return None
+        ug_metrics.inc("refresh_hits")
+        return entry[1]
+
+    def _is_old(self, fetched_at: float) -> bool:
+        return time.time() - fetched_at > self._max_age
+
+
+def _fetched_at(url: str) -> float:
+    """Returns when the page was fetched, the age of its cached entry, or now if pages are not cached."""
+    stored_at = get_stored_at(url)
+    return stored_at if stored_at is not None else time.time()
+
+
+class Prefetcher():
+    """
+    Speculatively fetches and parses the tabs of the search results a user is
+    paging through, the shown result first and then its neighbours,
+    so that the tab is ready when the user chooses it.
+    At most budget tabs are prefetched for one listing.
+    The prefetches should be cancelled once the user has chosen, or has stopped paging.
+
+    Instance Variables:
+    - urls:         list[str] | the tab url of the result on each page
+    - parse:        callable  | builds the parsed tab from its JSON dict, e.g. UGTab
+    - budget:       int       | the most tabs which are prefetched
+    - neighbours:   int       | the results on each side of the shown one which are prefetched
+    """
+    def __init__(self, urls: "list[str]", parse=UGTab, budget: int = 3, neighbours: int = 1):
+        self._urls: "list[str]" = urls
+        self._parse = parse
+        self._budget: int = budget
+        self._neighbours: int = neighbours
+        # page -> the prefetch of its tab
+        self._tasks: "dict[int, asyncio.Task]" = {}
+        self._cancelled: bool = False
+
+    def show(self, page: int) -> None:
+        """Starts prefetching the tab of the shown page, then of its neighbours, while the budget lasts."""
+        if self._cancelled:
+            return
+        pages = [page]
+        for distance in range(1, self._neighbours + 1):
+            pages += [page + distance, page - distance]
+        for p in pages:
+            if len(self._tasks) >= self._budget:
+                break
+            if 0 <= p < len(self._urls) and p not in self._tasks:
+                task = asyncio.ensure_future(self._prefetch(self._urls[p]))
+                # failed prefetches are fetched again by get()
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                self._tasks[p] = task
+                ug_metrics.inc("prefetches")
+
+    async def get(self, page: int):
+        """
+        Returns the parsed tab of the page, waiting for its prefetch, or fetching it if it was not prefetched.
+        A prefetch still waiting for its turn is given the caller's priority, so the user does not wait
+        behind the fetches it was started ahead of.
+        """
+        task = self._tasks.get(page)
+        if task is not None and not self._cancelled:
+            if not task.done():
+                promote(self._urls[page])
+            try:
+                tab = await task
+            except Exception:
+                pass
+            else:
+                ug_metrics.inc("prefetch_hits")
+                return tab
+        return self._parse(await async_json_from_url(self._urls[page]))
+
+    def cancel(self) -> None:
+        """Cancels the prefetches which have not finished. Fetches already sent still fill the cache."""
+        self._cancelled = True
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+                ug_metrics.inc("prefetch_cancels")
+
+    async def _prefetch(self, url: str):
+        with priority(BACKGROUND):
+            return self._parse(await async_json_from_url(url))
+
+
+async def fetch_top_tab(results: "list[UGSearchResult]", parse=UGTab, hedge_after: float = HEDGE_AFTER, accept_after: float = ACCEPT_AFTER):
+    """
+    Fetches and parses the tab of the best search result, as soon as the results are ranked.
+    If it is slow, the tab of the second best result is fetched alongside it,
+    and is returned instead if the best one fails, or is still not there after accept_after seconds.
+
+    Parameters:
+    - results:      the ranked search results, best first
+    - parse:        builds the parsed tab from its JSON dict, e.g. UGTab or UGChords
+    - hedge_after:  the seconds before the second best result's tab is fetched too
+    - accept_after: the seconds the best result's tab is waited for
+
+    Returns:
+    - the parsed tab
+
+    Exceptions:
+    - IndexError:   if there are no results
+    - the exception of fetching the best result's tab, if both fail
+    """
+    if not results:
+        raise IndexError("No results.")
+    calls = [functools.partial(_fetch_tab, result.get_tab_url(), parse) for result in results[:2]]
+    return await hedged(calls, hedge_after, accept_after)
+
+
+async def _fetch_tab(url: str, parse):
+    return parse(await async_json_from_url(url))
@@ -0,0 +1,114 @@
+"""
+Rankers for search results, which score each result from its votes and rating.
+The scores of a whole results list are computed at once (see score),
+with numpy when it is installed and the list is long.
+
+- votes:    the number of votes, how ultimate-guitar sorts
+- wilson:   the lower bound of the Wilson score interval of the rating,
+            so a 5 star rating with 3 votes ranks below a 4.8 with 300
+- bayesian: the rating, pulled towards the mean rating of the results
+            by a prior worth PRIOR_VOTES votes
+"""
+import math
+
+# numpy scores long results lists in one pass, if it is installed
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# the ranker used if none is given
+DEFAULT_RANKER = "votes"
+# the results lists at least this long are scored with numpy
+VECTORIZE_MIN = 256
+# the z score of the Wilson interval, for 95% confidence
+WILSON_Z = 1.96
+# the weight of the mean rating in the bayesian score, as a number of votes
+PRIOR_VOTES = 10
+
+
+def score(ranker: str, votes: "list[int]", ratings: "list[float]") -> "list[float]":
+    """
+    Scores the results, higher is better.
+
+    Parameters:
+    - ranker:   the name of the ranker, one of RANKERS
+    - votes:    the number of votes of each result
+    - ratings:  the rating of each result, out of 5
+
+    Returns:
+    - the score of each result
+
+    Exceptions:
+    - KeyError: if there is no ranker with the name
+    """
+    python_score, numpy_score = RANKERS[ranker]
+    if numpy is not None and len(votes) >= VECTORIZE_MIN:
+        return numpy_score(numpy.asarray(votes, dtype=float), numpy.asarray(ratings, dtype=float)).tolist()
+    return python_score(votes, ratings)
+
+
+def check_ranker(ranker: str, setting: str = "ranker") -> str:
+    """
+    Returns the name of the ranker, if there is a ranker with the name,
+    so that a misspelt setting fails once when it is read, instead of on every search.
+
+    Parameters:
+    - ranker:   the name of the ranker
+    - setting:  the name of the setting it was read from, for the error message, e.g. "CHORDS_RANKER"
+
+    Exceptions:
+    - ValueError: if there is no ranker with the name
+    """
+    if ranker not in RANKERS:
+        raise ValueError(f"{setting} is `{ranker}`, it should be one of: {', '.join(RANKERS)}")
+    return ranker
+
+
+def _votes(votes: "list[int]", ratings: "list[float]") -> "list[float]":
+    return list(votes)
+
+
+def _votes_numpy(votes, ratings):
+    return votes
+
+
+def _wilson(votes: "list[int]", ratings: "list[float]") -> "list[float]":
+    z2 = WILSON_Z * WILSON_Z
+    scores = []
+    for n, rating in zip(votes, ratings):
+        if n <= 0:
+            scores.append(0.0)
+            continue
+        # the rating as the fraction of positive votes
+        p = min(max((rating - 1) / 4, 0.0), 1.0)
+        scores.append((p + z2 / (2*n) - WILSON_Z * math.sqrt(p * (1-p) / n + z2 / (4*n*n))) / (1 + z2 / n))
+    return scores
+
+
+def _wilson_numpy(votes, ratings):
+    z2 = WILSON_Z * WILSON_Z
+    n = numpy.maximum(votes, 1)
+    p = numpy.clip((ratings - 1) / 4, 0.0, 1.0)
+    scores = (p + z2 / (2*n) - WILSON_Z * numpy.sqrt(p * (1-p) / n + z2 / (4*n*n))) / (1 + z2 / n)
+    return numpy.where(votes > 0, scores, 0.0)
+
+
+def _bayesian(votes: "list[int]", ratings: "list[float]") -> "list[float]":
+    total = sum(votes)
+    mean = sum(n * rating for n, rating in zip(votes, ratings)) / total if total > 0 else 0.0
+    return [(PRIOR_VOTES * mean + n * rating) / (PRIOR_VOTES + n) for n, rating in zip(votes, ratings)]
+
+
+def _bayesian_numpy(votes, ratings):
+    total = votes.sum()
+    mean = (votes * ratings).sum() / total if total > 0 else 0.0
+    return (PRIOR_VOTES * mean + votes * ratings) / (PRIOR_VOTES + votes)
+
+
+# name -> (score a list, score numpy arrays)
+RANKERS = {
+    "votes": (_votes, _votes_numpy),
+    "wilson": (_wilson, _wilson_numpy),
+    "bayesian": (_bayesian, _bayesian_numpy),
+}
@@ -1,9 +1,41 @@
 import json
+import re
+import html
+import time
+import email.utils
 import requests
 from bs4 import BeautifulSoup
 import urllib.parse
+import asyncio
+import threading
+import contextvars
+import functools
+import contextlib
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+
+from ug_cache import UGCache, normalize_url
+from ug_index import SearchIndex
+from ug_concurrency import SingleFlight, AsyncSingleFlight, FetchScheduler, QueueFullError, RetryPolicy, CircuitBreaker, CircuitOpenError, ParsePool, get_priority
+import ug_parser
+import ug_metrics
+
+# orjson decodes the large js-store JSON several times faster, if it is installed
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+    _dumps = lambda data: json.dumps(data, separators=(',', ':'))
 
 _DIV_CLASS = 'js-store'
+_DIV_CLASS_BYTES = b'js-store'
+_DATA_CONTENT_ATTR = b'data-content="'
+# any entity other than the ones escaped in the js-store JSON
+_UNCOMMON_ENTITY = re.compile(r'&(?!quot;|amp;|lt;|gt;|#0?39;|#x27;)')
 _UG_TAB_URI     = "https://tabs.ultimate-guitar.com/tab/"
 _UG_TAB_URI_LEN = 37
 _UG_SEARCH_URI  = "https://www.ultimate-guitar.com/"
@@ -11,16 +43,165 @@ _UG_SEARCH_URI_LEN = 32
 
 SAMPLE_SEARCH="https://www.ultimate-guitar.com/search.php?search_type=title&value=beach%20weather%20chit%20chat"
 
+# the explore option of each /explore sub command
+EXPLORE_OPTIONS = {
+    "today": "hitsdailygroup_desc",     # today's most popular tabs
+    "popular": "hitstotal_desc",        # alltime popular tabs
+    "recent": "date_desc",              # recently added tabs
+    "rating": "rating_desc",            # highest rated tabs
+}
+
+# the least number of threads running the async functions, there are at least as many
+# as the scheduler lets run and wait at once (see FetchScheduler.get_capacity),
+# so that every waiting fetch queues in the scheduler, by priority, or is rejected by it,
+# instead of waiting for a thread
+_MAX_WORKERS = 32
+# the number of keep-alive connections kept open per host
+_POOL_SIZE = 8
+# the pages fetched at once by json_from_urls
+_BATCH_CONCURRENCY = 8
+# the seconds to wait for a connection, and then between bytes of the page
+_TIMEOUT = (5, 10)
+# the statuses which mean ultimate-guitar may answer if asked again
+_TRANSIENT_STATUSES = frozenset((429, 500, 502, 503, 504))
+# the size of the chunks streamed pages are read in
+_CHUNK_SIZE = 16 * 1024
+# once the js-store div is read, a remainder this small is still read
+# so that the connection can be reused, instead of closing it
+_DRAIN_BYTES = 32 * 1024
+
+# shared by every fetch, so connections to ultimate-guitar are reused,
+# opened on the first fetch or by open_session()
+_session: requests.Session or None = None
+_executor: ThreadPoolExecutor or None = None
+_max_workers: int = _MAX_WORKERS
+# the threads of _executor, at least _max_workers (see _workers_needed)
+_executor_workers: int = 0
+_session_lock = threading.Lock()
+
+# the cache in front of every fetch, None to always fetch
+_cache: UGCache or None = UGCache()
+# the index of the tabs in the fetched pages, which answers repeated searches, None to always search
+_search_index: SearchIndex or None = None
+
+# every fetch waits for its turn, None to fetch straight away
+_scheduler: FetchScheduler or None = FetchScheduler()
+
+# how failed fetches are retried, None to not retry
+_retry_policy: RetryPolicy or None = RetryPolicy()
+# a circuit breaker for each host, see set_circuit_breakers
+_breakers: "dict[str, CircuitBreaker]" = {}
+_breaker_settings: dict = {"failure_threshold": 5, "reset_timeout": 30.0}
+_breakers_lock = threading.Lock()
+
+# concurrent fetches of the same page share one request
+_flights = SingleFlight()
+_async_flights = AsyncSingleFlight()
+
+# whether pages are streamed and only read up to the js-store div (see set_streaming)
+_streaming: bool = True
+# whether only the fields read by the parser are kept (see set_slim)
+_slim: bool = True
+# the worker processes pages are parsed on, None to parse them in the fetching thread
+_parse_pool: ParsePool or None = None
+_download_stats = {"pages": 0, "bytes_read": 0, "bytes_saved": 0}
+_download_stats_lock = threading.Lock()
+
 
 class InvalidLinkError(Exception):
     """Raised when the link is not an ultimate-guitar tab link."""
     pass
 
 
+class DataContentExtractor():
+    """
+    Finds the data-content attribute of the js-store div
+    while an ultimate-guitar page is being downloaded,
+    so that the rest of the page does not have to be read.
+    Feed it the chunks of the page in order, until feed() returns True.
+
+    Instance Variables:
+    - buffer:       bytearray | the chunks read so far
+    - bytes_read:   int       | the number of bytes fed
+    - span:         tuple[int, int] or None
+                        | the start and end of the attribute value in the buffer, once found
+    """
+    def __init__(self):
+        self._buffer: bytearray = bytearray()
+        self._bytes_read: int = 0
+        self._span: "tuple[int, int] or None" = None
+        # where to look for the next js-store class
+        self._scan_i: int = 0
+        # the js-store class whose opening tag has not been read to its end yet
+        self._class_i: int = -1
+        self._tag_start: int = -1
+        self._tag_end_from: int = 0
+
+    def feed(self, chunk: bytes) -> bool:
+        """Adds the next chunk of the page, and returns True once the attribute has been read."""
+        if self._span is not None:
+            return True
+        self._buffer += chunk
+        self._bytes_read += len(chunk)
+        buffer = self._buffer
+
+        while True:
+            if self._class_i == -1:
+                class_i = buffer.find(_DIV_CLASS_BYTES, self._scan_i)
+                if class_i == -1:
+                    # the class may be split between this chunk and the next
+                    self._scan_i = max(self._scan_i, len(buffer) - len(_DIV_CLASS_BYTES) + 1)
+                    return False
+                self._class_i = class_i
+                self._tag_start = buffer.rfind(b'<', 0, class_i)
+                self._tag_end_from = max(self._tag_start, 0)
+
+            tag_end = buffer.find(b'>', self._tag_end_from)
+            if tag_end == -1:
+                self._tag_end_from = len(buffer)
+                return False
+
+            self._span = _data_content_span(buffer, self._class_i, self._tag_start, tag_end)
+            if self._span is not None:
+                return True
+            self._scan_i = self._class_i + 1
+            self._class_i = -1
+
+    def is_done(self) -> bool:
+        return self._span is not None
+
+    def get_bytes_read(self) -> int:
+        return self._bytes_read
+
+    def get_content(self) -> bytes:
+        """Returns the page read so far."""
+        return bytes(self._buffer)
+
+    def get_raw_data_content(self) -> bytes or None:
+        """Returns the data-content attribute as read, still escaped, or None if it has not been read."""
+        if self._span is None:
+            return None
+        start, end = self._span
+        return bytes(self._buffer[start:end])
+
+    def get_data_content(self, encoding: str = 'utf-8') -> str or None:
+        """Returns the unescaped data-content attribute, or None if it has not been read."""
+        if self._span is None:
+            return None
+        start, end = self._span
+        return _unescape(self._buffer[start:end].decode(encoding, errors='replace'))
+
+
 def json_from_url(url: str) -> dict:
     """
     Extracts the data_content attribute from 
     the url's html, to access the page's data.
+    Fresh pages are returned from the cache (see set_cache)
+    without being fetched again, and concurrent calls
+    for the same page share one fetch.
+    Fetches which fail with a transient error are retried (see set_retry_policy).
+    While ultimate-guitar is failing, expired pages are returned
+    from the cache instead of fetching them.
 
     Parameters:
     - url:  the ultimate-guitar.com url as a string,
@@ -33,30 +214,72 @@ def json_from_url(url: str) -> dict:
     - HTTPError:    if the page request does not return a successful
                     status code (200-299) then this exception will be raised
     - InvalidLinkError: Raised when the link is not an ultimate-guitar tab link.
+    - QueueFullError:   Raised when too many fetches are waiting to start (see set_scheduler).
+    - CircuitOpenError: Raised when ultimate-guitar has been failing, and the page is not cached.
     """
     
     if not _link_has_ug_uri(url):
         raise InvalidLinkError(f"`{url}` is not a valid link.")
 
-    page = requests.get(url)
-    page.raise_for_status()
+    cached = _get_cached(url)
+    if cached is not None:
+        return cached
+    return _fetch_uncached(url)
 
-    soup = BeautifulSoup(page.content, "html.parser")
-    body = soup.find('body')
-    
-    cont = body.find('div', class_=_DIV_CLASS)
-    
-    data_content = cont["data-content"]
-    data_content.replace('&quot;', '\"')
+
+def _get_cached(url: str) -> dict or None:
+    """Returns the fresh cached JSON dict of the page, or None."""
+    cache = _cache
+    if cache is None:
+        return None
+    cached = cache.get(url)
+    if cached is not None:
+        ug_metrics.inc("cache_hits")
+    return cached
+
+
+def _fetch_uncached(url: str) -> dict:
+    """Fetches the page which is not cached, or returns its expired entry while ultimate-guitar is failing."""
+    cache = _cache
+    breaker = _get_breaker(urllib.parse.urlsplit(url).netloc)
+    try:
+        if not breaker.allow():
+            raise CircuitOpenError("Ultimate-Guitar is not responding, try again later.")
+        return _flights.do(normalize_url(url), _fetch_json, url, cache, breaker)
+    except (CircuitOpenError, requests.RequestException) as e:
+        stale = cache.get(url, allow_stale=True) if cache is not None and _is_transient(e) else None
+        if stale is None:
+            raise
+        ug_metrics.inc("stale_hits")
+        return stale
+
+
+def extract_data_content(content: bytes, encoding: str = 'utf-8') -> str:
+    """
+    Extracts the data-content attribute of the js-store div
+    from the raw html of an ultimate-guitar page.
+    Scans the bytes for the div directly, and only builds
+    the full BeautifulSoup tree if that fails.
+
+    Parameters:
+    - content:  the raw html of the page
+    - encoding: the encoding of the page
     
-    data_content_json = json.loads(data_content)
-    return data_content_json
+    Returns:
+    - the unescaped data-content attribute, a JSON string
+    """
+    data_content = _fast_extract_data_content(content, encoding)
+    if data_content is None:
+        data_content = _soup_extract_data_content(content)
+    return data_content
 
 
 def json_from_search(artist: str, song: str = None) -> dict:
     """
     Extracts the data_content attribute from 
     the url's html, to access the page's data.
+    Searches for an artist and song are answered from the
+    search index (see set_search_index) if they were made before.
 
     Parameters:
     - artist:   the artist name
@@ -70,13 +293,10 @@ def json_from_search(artist: str, song: str = None) -> dict:
                     status code (200-299) then this exception will be raised
     - InvalidLinkError: Raised when the link is not an ultimate-guitar tab link.
     """
-    if song:
-        query = artist.strip() + " " + song.strip()
-        url = _UG_SEARCH_URI + "search.php?search_type=title&value=" + urllib.parse.quote(query)
-    else:
-        query = artist.strip()
-        url = _UG_SEARCH_URI + "search.php?search_type=band&value=" + urllib.parse.quote(query)
-    return json_from_url(url)
+    indexed = _lookup_search(artist, song)
+    if indexed is not None:
+        return indexed
+    return json_from_url(_search_url(artist, song))
 
 
 def json_from_explore(option: str) -> dict:
@@ -95,9 +315,7 @@ def json_from_explore(option: str) -> dict:
                     status code (200-299) then this exception will be raised
     - InvalidLinkError: Raised when the link is not an ultimate-guitar tab link.
     """
-    query = option.strip()
-    url = _UG_SEARCH_URI + "explore?order=" + urllib.parse.quote(query)
-    return json_from_url(url)
+    return json_from_url(explore_url(option))
 
 
 def json_from_artist(artist_url: str) -> dict:
@@ -116,9 +334,405 @@ def json_from_artist(artist_url: str) -> dict:
                     status code (200-299) then this exception will be raised
     - InvalidLinkError: Raised when the link is not an ultimate-guitar tab link.
     """
-    query = artist_url.strip()[1:]
-    url = _UG_SEARCH_URI + urllib.parse.quote(query)
-    return json_from_url(url)
+    return json_from_url(_artist_url(artist_url))
+
+
+def json_from_urls(urls, max_concurrent: int = _BATCH_CONCURRENCY):
+    """
+    Fetches many pages at once, with json_from_url on the scraper's worker threads,
+    and yields each page as soon as it has been fetched, in the order they finish.
+    The urls are read as fetches are started, so they can be a generator,
+    and the fetches not started yet are cancelled if the iteration is stopped.
+    A page which cannot be fetched is yielded with its error, instead of ending the batch.
+
+    Parameters:
+    - urls:             an iterable of the ultimate-guitar.com urls
+    - max_concurrent:   the number of pages fetched at once
+
+    Yields:
+    - (url, data, error): the url, and the JSON dict of its page or None,
+                          and the exception its fetch raised or None
+
+    Example:
+        for url, data, error in json_from_urls(urls):
+            if error is None:
+                tabs.append(UGTab(data))
+    """
+    assert max_concurrent > 0
+    executor = _get_executor()
+    pending: "dict[concurrent.futures.Future, str]" = {}
+    urls = iter(urls)
+    try:
+        while True:
+            for url in urls:
+                # copied so that the metrics and priority in the thread are the caller's
+                context = contextvars.copy_context()
+                pending[executor.submit(context.run, json_from_url, url)] = url
+                if len(pending) >= max_concurrent:
+                    break
+            if not pending:
+                return
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                url = pending.pop(future)
+                error = future.exception()
+                ug_metrics.inc("batch_errors" if error is not None else "batch_pages")
+                yield (url, future.result() if error is None else None, error)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def async_json_from_url(url: str, refresh: bool = False) -> dict:
+    """
+    The asynchronous version of json_from_url.
+    The page request runs on the scraper's worker threads,
+    so awaiting it does not block the event loop.
+
+    Parameters:
+    - url:      the ultimate-guitar.com url as a string
+    - refresh:  whether to fetch the page even if it is cached and fresh,
+                its expired entry is still returned while ultimate-guitar is failing
+    
+    Returns:
+    - the JSON dict of the tab data
+
+    Exceptions:
+    - HTTPError:    if the page request does not return a successful
+                    status code (200-299) then this exception will be raised
+    - InvalidLinkError: Raised when the link is not an ultimate-guitar tab link.
+    """
+    if not _link_has_ug_uri(url):
+        raise InvalidLinkError(f"`{url}` is not a valid link.")
+
+    # answered on the event loop, so that cached pages do not wait for a worker thread
+    cached = _get_cached(url) if not refresh else None
+    if cached is not None:
+        return cached
+    # concurrent callers await one shared worker thread, which is started
+    # ahead of the background fetches if this caller has a higher priority
+    promote(url)
+    return await _async_flights.do(normalize_url(url), _run_in_executor, _fetch_uncached, url)
+
+
+async def async_json_from_search(artist: str, song: str = None) -> dict:
+    """
+    The asynchronous version of json_from_search.
+
+    Parameters:
+    - artist:   the artist name
+    - song:     the song name (can be None if searching by artist)
+    
+    Returns:
+    - the JSON dict of the search results
+
+    Exceptions:
+    - HTTPError:    if the page request does not return a successful
+                    status code (200-299) then this exception will be raised
+    - InvalidLinkError: Raised when the link is not an ultimate-guitar tab link.
+    """
+    indexed = _lookup_search(artist, song)
+    if indexed is not None:
+        return indexed
+    return await async_json_from_url(_search_url(artist, song))
+
+
+async def async_json_from_explore(option: str, refresh: bool = False) -> dict:
+    """
+    The asynchronous version of json_from_explore.
+
+    Parameters:
+    - option:   the explore option
+    - refresh:  whether to fetch the page even if it is cached and fresh
+    
+    Returns:
+    - the JSON dict of the search results
+
+    Exceptions:
+    - HTTPError:    if the page request does not return a successful
+                    status code (200-299) then this exception will be raised
+    - InvalidLinkError: Raised when the link is not an ultimate-guitar tab link.
+    """
+    return await async_json_from_url(explore_url(option), refresh)
+
+
+async def async_json_from_artist(artist_url: str) -> dict:
+    """
+    The asynchronous version of json_from_artist.
+
+    Parameters:
+    - artist_url:   the artist url
+    
+    Returns:
+    - the JSON dict of the search results
+
+    Exceptions:
+    - HTTPError:    if the page request does not return a successful
+                    status code (200-299) then this exception will be raised
+    - InvalidLinkError: Raised when the link is not an ultimate-guitar tab link.
+    """
+    return await async_json_from_url(_artist_url(artist_url))
+
+
+async def async_json_from_urls(urls, max_concurrent: int = _BATCH_CONCURRENCY, refresh: bool = False):
+    """
+    The asynchronous version of json_from_urls, an async generator.
+    The fetches not started yet are cancelled if the iteration is stopped,
+    the ones in progress still finish, and fill the cache.
+
+    Parameters:
+    - urls:             an iterable of the ultimate-guitar.com urls
+    - max_concurrent:   the number of pages fetched at once
+    - refresh:          whether to fetch the pages even if they are cached and fresh
+
+    Yields:
+    - (url, data, error): the url, and the JSON dict of its page or None,
+                          and the exception its fetch raised or None
+
+    Example:
+        async for url, data, error in async_json_from_urls(urls):
+            ...
+    """
+    assert max_concurrent > 0
+    pending: "dict[asyncio.Task, str]" = {}
+    urls = iter(urls)
+    try:
+        while True:
+            for url in urls:
+                pending[asyncio.ensure_future(async_json_from_url(url, refresh))] = url
+                if len(pending) >= max_concurrent:
+                    break
+            if not pending:
+                return
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                url = pending.pop(task)
+                error = task.exception()
+                ug_metrics.inc("batch_errors" if error is not None else "batch_pages")
+                yield (url, task.result() if error is None else None, error)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def set_cache(cache: UGCache or None) -> None:
+    """
+    Sets the cache used by all of the json_from_* functions.
+    By default, pages are only cached in memory.
+
+    Parameters:
+    - cache:    the UGCache, or None to turn off caching
+
+    Example:
+        set_cache(UGCache(disk=DiskCache('.ug_cache')))
+    """
+    global _cache
+    _cache = cache
+
+
+def get_cache() -> UGCache or None:
+    """Returns the cache used by all of the json_from_* functions."""
+    return _cache
+
+
+def get_stored_at(url: str) -> float or None:
+    """Returns when the cached page was fetched, even if it has expired, or None if it is not cached."""
+    cache = _cache
+    return cache.get_stored_at(url) if cache is not None else None
+
+
+def set_search_index(index: SearchIndex or None) -> None:
+    """
+    Sets the index which every fetched page is added to,
+    and which answers the searches for an artist and song made before,
+    without searching ultimate-guitar again.
+
+    Parameters:
+    - index:    the SearchIndex, or None to always search ultimate-guitar
+
+    Example:
+        set_search_index(SearchIndex('.ug_cache/search.index'))
+    """
+    global _search_index
+    _search_index = index
+
+
+def get_search_index() -> SearchIndex or None:
+    """Returns the index which answers the searches made before."""
+    return _search_index
+
+
+def set_scheduler(scheduler: FetchScheduler or None) -> None:
+    """
+    Sets the scheduler that every fetch of the json_from_* functions waits on,
+    which caps the concurrent fetches, rate limits them, and starts them by priority.
+    Cached pages do not wait.
+    The worker threads of the async functions are added to, if needed,
+    so that there are at least as many as the scheduler's capacity.
+
+    Parameters:
+    - scheduler:    the FetchScheduler, or None to fetch straight away
+
+    Example:
+        set_scheduler(FetchScheduler(max_concurrent=2, rate=1.0))
+    """
+    global _scheduler, _executor
+    _scheduler = scheduler
+    with _session_lock:
+        if _executor is not None and _workers_needed(_max_workers) > _executor_workers:
+            # the fetches already submitted finish on the old threads
+            old, _executor = _executor, _new_executor(_max_workers)
+            old.shutdown(wait=False)
+
+
+def promote(url: str) -> bool:
+    """
+    Gives the fetch of the page the priority of the caller (see ug_concurrency.priority),
+    if it is waiting for the scheduler with a lower one, e.g. when a user waits on its prefetch.
+
+    Returns:
+    - whether a waiting fetch was promoted
+    """
+    scheduler = _scheduler
+    return scheduler is not None and scheduler.promote(normalize_url(url), get_priority())
+
+
+def get_scheduler() -> FetchScheduler or None:
+    """Returns the scheduler that every fetch of the json_from_* functions waits on."""
+    return _scheduler
+
+
+def set_retry_policy(policy: RetryPolicy or None) -> None:
+    """
+    Sets how the json_from_* functions retry fetches which fail with a transient error:
+    a connection error or timeout, or a 429, 500, 502, 503 or 504 status.
+
+    Parameters:
+    - policy:   the RetryPolicy, or None to not retry
+
+    Example:
+        set_retry_policy(RetryPolicy(max_attempts=5, base_delay=1.0))
+    """
+    global _retry_policy
+    _retry_policy = policy
+
+
+def set_circuit_breakers(failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+    """
+    Sets up the circuit breaker of each host (see CircuitBreaker), and closes them.
+
+    Parameters:
+    - failure_threshold:    the fetches in a row which fail, after retrying,
+                            before fetches to the host fail fast
+    - reset_timeout:        the seconds until a fetch is tried again
+    """
+    with _breakers_lock:
+        _breaker_settings.update(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        _breakers.clear()
+
+
+def get_circuit_states() -> "dict[str, str]":
+    """Returns the state of the circuit breaker of each host: closed, half-open or open."""
+    with _breakers_lock:
+        return {host: breaker.get_state() for host, breaker in _breakers.items()}
+
+
+def set_streaming(on: bool) -> None:
+    """
+    Sets whether the json_from_* functions stream pages, and stop reading them
+    once the js-store div has been read, instead of downloading the whole page.
+    Pages are streamed by default.
+    """
+    global _streaming
+    _streaming = on
+
+
+def set_slim(on: bool) -> None:
+    """
+    Sets whether the json_from_* functions only return, and cache,
+    the fields of the pages read by the parser (see ug_parser.slim),
+    instead of the whole JSON dict. Pages are slimmed by default.
+    """
+    global _slim
+    _slim = on
+
+
+def set_parse_pool(pool: ParsePool or None) -> None:
+    """
+    Sets the worker processes the json_from_* functions extract and decode pages on,
+    so that parsing the pages of concurrent fetches is spread over the cores.
+    Pages are parsed in the fetching thread by default, or with None.
+
+    Example:
+        set_parse_pool(ParsePool(workers=4))
+    """
+    global _parse_pool
+    _parse_pool = pool
+
+
+def get_parse_pool() -> ParsePool or None:
+    return _parse_pool
+
+
+def get_download_stats() -> "dict[str, int]":
+    """
+    Returns the number of pages fetched, the bytes read from the network,
+    and the bytes of the pages that were not read because they were streamed.
+    """
+    with _download_stats_lock:
+        return dict(_download_stats)
+
+
+def open_session(pool_size: int = _POOL_SIZE, max_workers: int = _MAX_WORKERS) -> None:
+    """
+    Opens the pooled session that is shared by all of the json_from_* functions.
+    If a session is already open, it is closed first.
+    Opening the session is optional, the first fetch opens one with the defaults.
+
+    Parameters:
+    - pool_size:    the number of keep-alive connections kept open per host,
+                    fetches to a host wait for a free connection past this limit
+    - max_workers:  the number of fetches that can run at once for the async functions,
+                    raised to the capacity of the scheduler if it is higher (see set_scheduler)
+    """
+    global _session, _executor, _max_workers
+    assert pool_size > 0 and max_workers > 0
+    close()
+    with _session_lock:
+        _max_workers = max_workers
+        _session, _executor = _new_session(pool_size, max_workers)
+
+
+def close() -> None:
+    """
+    Waits for the fetches in progress to finish,
+    then closes the pooled session and its connections.
+    """
+    global _session, _executor
+    with _session_lock:
+        session, executor = _session, _executor
+        _session, _executor = None, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+    if session is not None:
+        session.close()
+
+
+@contextlib.contextmanager
+def pooled_session(pool_size: int = _POOL_SIZE, max_workers: int = _MAX_WORKERS):
+    """
+    Opens the pooled session for the duration of the with block,
+    and closes it at the end.
+
+    Example:
+        with pooled_session(pool_size=4):
+            json_from_url(url)
+    """
+    open_session(pool_size, max_workers)
+    try:
+        yield
+    finally:
+        close()
 
 
 # for debugging
@@ -129,6 +743,319 @@ def write_dict_to_file(data: dict, path: str) -> None:
     f.close()
 
 
+def _new_session(pool_size: int, max_workers: int) -> "tuple[requests.Session, ThreadPoolExecutor]":
+    """Creates a keep-alive session with `pool_size` connections per host, and its worker threads."""
+    session = requests.Session()
+    # pool_block caps the connections per host, instead of opening throwaway ones
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": ACCEPT_ENCODING,
+        "Connection": "keep-alive",
+    })
+    return session, _new_executor(max_workers)
+
+
+def _new_executor(max_workers: int) -> ThreadPoolExecutor:
+    """Creates the worker threads of the async functions, `_session_lock` must be held."""
+    global _executor_workers
+    _executor_workers = _workers_needed(max_workers)
+    return ThreadPoolExecutor(max_workers=_executor_workers, thread_name_prefix="ug_scraper")
+
+
+def _workers_needed(max_workers: int) -> int:
+    """Returns the threads needed for every fetch the scheduler admits to reach it without waiting for a thread."""
+    scheduler = _scheduler
+    return max(max_workers, scheduler.get_capacity() if scheduler is not None else 0)
+
+
+def _fetch_json(url: str, cache: UGCache or None, breaker: CircuitBreaker) -> dict:
+    """Fetches the page, retrying transient errors, extracts and decodes its JSON, and caches it."""
+    policy = _retry_policy
+    attempt = 0
+    while True:
+        try:
+            extractor = _download(url)
+        except requests.RequestException as e:
+            if not _is_transient(e):
+                # ultimate-guitar answered, e.g. with a 404
+                breaker.record_success()
+                raise
+            delay = policy.get_delay(attempt, _retry_after(e)) if policy is not None else None
+            # the breaker counts the fetches which gave up, not each attempt,
+            # but another fetch may have opened it while this one waited
+            if delay is None or breaker.get_state() == CircuitBreaker.OPEN:
+                breaker.record_failure()
+                raise
+            ug_metrics.inc("retries")
+            time.sleep(delay)
+            attempt += 1
+        else:
+            breaker.record_success()
+            break
+
+    pool = _parse_pool
+    if pool is not None:
+        # only the attribute is sent to the worker, if it was found while streaming
+        raw = extractor.get_raw_data_content()
+        found = raw is not None
+        if not found:
+            raw = extractor.get_content()
+        with ug_metrics.timer("parse_offload"):
+            data_content_json = pool.run(_decode_page, raw, found, _slim)
+        size = len(raw) if found else None
+    else:
+        with ug_metrics.timer("extract"):
+            data_content = extractor.get_data_content()
+            if data_content is None:
+                data_content = extract_data_content(extractor.get_content())
+
+        with ug_metrics.timer("decode"):
+            data_content_json = _loads(data_content)
+            if _slim:
+                # the rest of the store is dropped before it is cached
+                data_content_json = ug_parser.slim(data_content_json)
+        size = len(data_content)
+    if cache is not None:
+        if _slim or size is None:
+            size = len(_dumps(data_content_json))
+        cache.put(url, data_content_json, size)
+    index = _search_index
+    if index is not None:
+        index.add_page(url, data_content_json)
+    return data_content_json
+
+
+def _decode_page(raw: bytes, found: bool, slim: bool) -> dict:
+    """
+    Extracts and decodes the JSON of a page, on a worker of the parse pool (see set_parse_pool).
+
+    Parameters:
+    - raw:      the escaped data-content attribute if found, else the whole page
+    - found:    whether raw is the attribute
+    - slim:     whether to only return the fields read by the parser (see ug_parser.slim)
+    """
+    if found:
+        data_content = _unescape(raw.decode('utf-8', errors='replace'))
+    else:
+        data_content = extract_data_content(raw)
+    data = _loads(data_content)
+    return ug_parser.slim(data) if slim else data
+
+
+def _lookup_search(artist: str, song: str or None) -> dict or None:
+    """Returns the JSON dict of the search for the artist and song from the search index, if it has it."""
+    index = _search_index
+    if index is None or not song:
+        return None
+    with ug_metrics.timer("index_lookup"):
+        indexed = index.lookup(artist, song)
+    if indexed is not None:
+        ug_metrics.inc("index_hits")
+    return indexed
+
+
+def _download(url: str) -> DataContentExtractor:
+    """Waits for a turn from the scheduler, then reads the page up to its js-store div."""
+    scheduler = _scheduler
+    with scheduler.slot(urllib.parse.urlsplit(url).netloc, normalize_url(url)) if scheduler is not None else contextlib.nullcontext():
+        ug_metrics.inc("fetches")
+        # streamed, so that the download is timed apart from the connection
+        page = _get_session().get(url, stream=True, timeout=_TIMEOUT)
+        # the time to the response headers: DNS, connecting, and waiting for the server
+        ug_metrics.observe("connect", page.elapsed.total_seconds())
+        try:
+            page.raise_for_status()
+            with ug_metrics.timer("download"):
+                if _streaming:
+                    extractor = _stream_page(page)
+                else:
+                    extractor = DataContentExtractor()
+                    extractor.feed(page.content)
+            _count_download(page, extractor)
+        finally:
+            page.close()
+    return extractor
+
+
+def _is_transient(e: Exception) -> bool:
+    """Returns whether the fetch failed in a way that asking again may fix."""
+    if isinstance(e, CircuitOpenError):
+        return True
+    if isinstance(e, requests.HTTPError):
+        return e.response is not None and e.response.status_code in _TRANSIENT_STATUSES
+    return isinstance(e, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
+
+
+def _retry_after(e: Exception) -> float or None:
+    """Returns the seconds the server asked to wait in its Retry-After header, if any."""
+    response = getattr(e, 'response', None)
+    value = response.headers.get("Retry-After") if response is not None else None
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _get_breaker(host: str) -> CircuitBreaker:
+    """Returns the circuit breaker of the host, creating it if needed."""
+    with _breakers_lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            breaker = _breakers[host] = CircuitBreaker(host, **_breaker_settings)
+        return breaker
+
+
+def _stream_page(page: requests.Response) -> DataContentExtractor:
+    """Reads the page in chunks until the js-store div has been read."""
+    extractor = DataContentExtractor()
+    chunks = page.iter_content(_CHUNK_SIZE)
+    for chunk in chunks:
+        if extractor.feed(chunk):
+            break
+    remaining = _content_length(page) - _wire_bytes(page)
+    if 0 < remaining <= _DRAIN_BYTES:
+        # cheaper than opening a new connection for the next fetch
+        for _ in chunks:
+            pass
+    return extractor
+
+
+def _count_download(page: requests.Response, extractor: DataContentExtractor) -> None:
+    """Adds the bytes read, and the bytes left unread, to the download stats and metrics."""
+    read = _wire_bytes(page) or extractor.get_bytes_read()
+    saved = max(_content_length(page) - read, 0)
+    with _download_stats_lock:
+        _download_stats["pages"] += 1
+        _download_stats["bytes_read"] += read
+        _download_stats["bytes_saved"] += saved
+    ug_metrics.inc("bytes_read", read)
+    ug_metrics.inc("bytes_saved", saved)
+
+
+def _content_length(page: requests.Response) -> int:
+    """Returns the length of the page body as sent, 0 if unknown."""
+    try:
+        return int(page.headers.get("Content-Length", 0))
+    except ValueError:
+        return 0
+
+
+def _wire_bytes(page: requests.Response) -> int:
+    """Returns the bytes of the page body read from the connection so far, before decompression."""
+    try:
+        return page.raw.tell()
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def _fast_extract_data_content(content: bytes, encoding: str) -> str or None:
+    """
+    Finds the data-content attribute of the js-store div without parsing the page.
+    Returns None if the div or its attribute could not be found.
+    """
+    class_i = content.find(_DIV_CLASS_BYTES)
+    while class_i != -1:
+        tag_start = content.rfind(b'<', 0, class_i)
+        tag_end = content.find(b'>', tag_start)
+        span = _data_content_span(content, class_i, tag_start, tag_end)
+        if span is not None:
+            return _unescape(content[span[0]:span[1]].decode(encoding, errors='replace'))
+        class_i = content.find(_DIV_CLASS_BYTES, class_i + 1)
+    return None
+
+
+def _data_content_span(content: bytes, class_i: int, tag_start: int, tag_end: int) -> "tuple[int, int] or None":
+    """
+    Returns the start and end of the data-content attribute value
+    if the js-store class at class_i is inside the opening tag of a div with one.
+    """
+    # the class has to be inside the opening tag of a div
+    if not content.startswith(b'<div', tag_start) or tag_end < class_i:
+        return None
+    attr_i = content.find(_DATA_CONTENT_ATTR, tag_start, tag_end)
+    if attr_i == -1:
+        return None
+    value_start = attr_i + len(_DATA_CONTENT_ATTR)
+    value_end = content.find(b'"', value_start)
+    if value_end == -1:
+        return None
+    return value_start, value_end
+
+
+def _unescape(value: str) -> str:
+    """Unescapes the attribute value, with str.replace when only the common entities are used."""
+    if _UNCOMMON_ENTITY.search(value):
+        return html.unescape(value)
+    return value.replace('&quot;', '"').replace('&#039;', "'").replace('&#39;', "'").replace('&#x27;', "'") \
+        .replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&')
+
+
+def _soup_extract_data_content(content: bytes) -> str:
+    """Finds the data-content attribute of the js-store div by parsing the whole page."""
+    soup = BeautifulSoup(content, "html.parser")
+    body = soup.find('body')
+    
+    cont = body.find('div', class_=_DIV_CLASS)
+    
+    return cont["data-content"]
+
+
+def _get_pool() -> "tuple[requests.Session, ThreadPoolExecutor]":
+    """Returns the pooled session and its worker threads, opening them with the defaults if needed."""
+    global _session, _executor
+    with _session_lock:
+        if _session is None:
+            _session, _executor = _new_session(_POOL_SIZE, _max_workers)
+        return _session, _executor
+
+
+def _get_session() -> requests.Session:
+    """Returns the pooled session, opening one with the defaults if needed."""
+    return _get_pool()[0]
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Returns the worker threads of the pooled session, opening them with the defaults if needed."""
+    return _get_pool()[1]
+
+
+async def _run_in_executor(func, *args):
+    """Runs the blocking function on the scraper's worker threads, in the caller's context."""
+    loop = asyncio.get_running_loop()
+    # copied so that the metrics in the thread are labelled with the caller's command
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), functools.partial(context.run, func, *args))
+
+
+def _search_url(artist: str, song: str = None) -> str:
+    """Builds the search url for an artist, or for an artist and song."""
+    if song:
+        query = artist.strip() + " " + song.strip()
+        return _UG_SEARCH_URI + "search.php?search_type=title&value=" + urllib.parse.quote(query)
+    query = artist.strip()
+    return _UG_SEARCH_URI + "search.php?search_type=band&value=" + urllib.parse.quote(query)
+
+
+def explore_url(option: str) -> str:
+    """Builds the explore url for an explore option."""
+    query = option.strip()
+    return _UG_SEARCH_URI + "explore?order=" + urllib.parse.quote(query)
+
+
+def _artist_url(artist_url: str) -> str:
+    """Builds the full url from an artist url path (e.g. `/artist/...`)."""
+    query = artist_url.strip()[1:]
+    return _UG_SEARCH_URI + urllib.parse.quote(query)
+
+
 def _link_has_ug_uri(url: str) -> bool:
     """Checks if the given URL contains an ultimate-guitar tab or search URI."""
     try:
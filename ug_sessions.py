@@ -0,0 +1,239 @@
+"""
+The result browsers the bot's commands show, kept between button clicks,
+so that one component handler can answer the clicks of every browser
+instead of each command waiting for its own.
+The buttons of a browser carry its session id in their custom_id (see encode_custom_id).
+"""
+import time
+import secrets
+import threading
+import collections
+
+# the seconds a browser is kept after its last click
+SESSION_TTL = 15 * 60
+# the number of browsers kept, the least recently clicked are dropped past it
+MAX_SESSIONS = 2000
+_SEPARATOR = ":"
+
+
+def encode_custom_id(action: str, session_id: str) -> str:
+    """Returns the custom_id of the button which does the action in the session, e.g. `next:3fa9c1d2e0b4`."""
+    return action + _SEPARATOR + session_id
+
+
+def decode_custom_id(custom_id: str) -> "tuple[str, str] or None":
+    """Returns the action and session id of the custom_id, or None if it is not a session's button."""
+    action, separator, session_id = custom_id.partition(_SEPARATOR)
+    if not separator or not action or not session_id:
+        return None
+    return action, session_id
+
+
+class TabPager():
+    """
+    The pages of a tab a user reads (see UGTab.get_page).
+
+    Instance Variables:
+    - command:  str   | the command which showed the tab, e.g. "chords"
+    - tab:      UGTab | the tab
+    - page:     int   | the page shown
+    """
+    __slots__ = ('_command', '_tab', '_page')
+
+    def __init__(self, command: str, tab):
+        self._command: str = command
+        self._tab = tab
+        self._page: int = 0
+
+    def turn(self, pages: int) -> int:
+        """Turns the pages forward, or back, within the tab, and returns the page shown."""
+        self._page = min(max(self._page + pages, 0), self._tab.get_page_count() - 1)
+        return self._page
+
+    def transpose(self, semitones: int) -> int:
+        """
+        Transposes the tab, a UGChords, by the semitones, and returns its transposition.
+        The page shown is kept, or the last page if the tab is shorter in the new key.
+        """
+        self._tab.transpose(self._tab.get_transposition() + semitones)
+        self._page = min(self._page, self._tab.get_page_count() - 1)
+        return self._tab.get_transposition()
+
+    def close(self) -> None:
+        pass
+
+    def get_command(self) -> str:
+        return self._command
+
+    def get_tab(self):
+        return self._tab
+
+    def get_page(self) -> int:
+        return self._page
+
+    def is_first_page(self) -> bool:
+        return self._page == 0
+
+    def is_last_page(self) -> bool:
+        return self._page >= self._tab.get_page_count() - 1
+
+
+class ResultsBrowser():
+    """
+    The results a user pages through, the prefetches of their tabs, and the tab chosen.
+
+    Instance Variables:
+    - command:      str        | the command which showed the results, e.g. "explore"
+    - results:      list[UGSearchResult | UGArtist] | the results, one per page
+    - embeds:       list[interactions.Embed]        | the embed of each page
+    - page:         int        | the page shown
+    - prefetcher:   Prefetcher or None | the prefetches of the results' tabs
+    - tab_pager:    TabPager or None   | the pages of the tab chosen, while it is shown
+    """
+    __slots__ = ('_command', '_results', '_embeds', '_page', '_prefetcher', '_tab_pager')
+
+    def __init__(self, command: str, results: list, embeds: list, prefetcher=None):
+        self._command: str = command
+        self._prefetcher = None
+        self.set_results(results, embeds, prefetcher)
+
+    def set_results(self, results: list, embeds: list, prefetcher=None) -> None:
+        """Shows other results from their first page, e.g. the tabs of the artist chosen."""
+        self.close()
+        self._results: list = results
+        self._embeds: list = embeds
+        self._page: int = 0
+        self._prefetcher = prefetcher
+        self._tab_pager: TabPager or None = None
+        if prefetcher is not None:
+            prefetcher.show(0)
+
+    def turn(self, pages: int) -> int:
+        """Turns the pages forward, or back, within the results, and returns the page shown."""
+        self._page = min(max(self._page + pages, 0), len(self._results) - 1)
+        if self._prefetcher is not None:
+            self._prefetcher.show(self._page)
+        return self._page
+
+    def show_tab(self, tab) -> TabPager:
+        """Shows the tab of the result chosen, from its first page."""
+        self._tab_pager = TabPager(self._command, tab)
+        return self._tab_pager
+
+    def close(self) -> None:
+        """Cancels the prefetches which have not finished."""
+        if self._prefetcher is not None:
+            self._prefetcher.cancel()
+
+    def get_command(self) -> str:
+        return self._command
+
+    def get_results(self) -> list:
+        return self._results
+
+    def get_result(self):
+        """Returns the result of the page shown."""
+        return self._results[self._page]
+
+    def get_embed(self):
+        """Returns the embed of the page shown."""
+        return self._embeds[self._page]
+
+    def get_page(self) -> int:
+        return self._page
+
+    def is_first_page(self) -> bool:
+        return self._page == 0
+
+    def is_last_page(self) -> bool:
+        return self._page >= len(self._results) - 1
+
+    def get_prefetcher(self):
+        return self._prefetcher
+
+    def get_tab_pager(self) -> TabPager or None:
+        return self._tab_pager
+
+
+class SessionStore():
+    """
+    The sessions of the result browsers, by session id, dropped once they have not been
+    used for ttl seconds, or once there are more than max_sessions.
+    Sessions are only dropped as others are added or looked up, so no task is kept per session.
+    Safe to use from multiple threads.
+
+    Instance Variables:
+    - max_sessions: int   | the number of sessions kept
+    - ttl:          float | the seconds a session is kept after it was last used
+    - on_evict:     function or None | called with each session dropped, e.g. to cancel its prefetches
+    """
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl: float = SESSION_TTL, on_evict=None):
+        assert max_sessions > 0
+        self._max_sessions: int = max_sessions
+        self._ttl: float = ttl
+        self._on_evict = on_evict
+        # session id -> (last used, session), least recently used first
+        self._sessions: "collections.OrderedDict[str, tuple[float, object]]" = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: "dict[str, int]" = {"added": 0, "expired": 0, "evicted": 0, "misses": 0}
+
+    def add(self, session) -> str:
+        """Keeps the session, and returns its new session id."""
+        now = time.monotonic()
+        session_id = secrets.token_hex(6)
+        with self._lock:
+            dropped = self._expire(now)
+            self._sessions[session_id] = (now, session)
+            self._stats["added"] += 1
+            while len(self._sessions) > self._max_sessions:
+                dropped.append(self._sessions.popitem(last=False)[1][1])
+                self._stats["evicted"] += 1
+        self._evict(dropped)
+        return session_id
+
+    def get(self, session_id: str):
+        """Returns the session, and keeps it for another ttl, or None if it was dropped."""
+        now = time.monotonic()
+        with self._lock:
+            dropped = self._expire(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                self._stats["misses"] += 1
+                session = None
+            else:
+                session = entry[1]
+                self._sessions[session_id] = (now, session)
+                self._sessions.move_to_end(session_id)
+        self._evict(dropped)
+        return session
+
+    def pop(self, session_id: str):
+        """Drops the session, and returns it, or None if it was already dropped."""
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        return entry[1] if entry is not None else None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get_stats(self) -> "dict[str, int]":
+        """Returns the number of sessions kept, added, expired, evicted past max_sessions, and of lookups of dropped ones."""
+        with self._lock:
+            return {"sessions": len(self._sessions), **self._stats}
+
+    def _expire(self, now: float) -> list:
+        """Drops the sessions unused for ttl, and returns them, `_lock` must be held."""
+        dropped = []
+        while self._sessions:
+            used_at, session = next(iter(self._sessions.values()))
+            if now - used_at < self._ttl:
+                break
+            self._sessions.popitem(last=False)
+            self._stats["expired"] += 1
+            dropped.append(session)
+        return dropped
+
+    def _evict(self, dropped: list) -> None:
+        if self._on_evict is not None:
+            for session in dropped:
+                self._on_evict(session)